@@ -0,0 +1,419 @@
+from collections import namedtuple
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files import File
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.http import FileResponse, StreamingHttpResponse
+from django.utils import timezone
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font
+from shortener.jobs import JobError, enqueue_job, recover_stale_jobs, update_job
+from shortener.models import ShortenedURL, Click, DailySystemStats, ExportJob
+from shortener.rollups import rollups_for, sum_clicks, top_values
+from .system_stats import get_system_stats
+from .timeseries import click_series
+import csv
+import io
+import json
+import logging
+import re
+import tempfile
+import uuid
+import zlib
+
+logger = logging.getLogger(__name__)
+
+User = get_user_model()
+
+XLSX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+# Rows per worksheet, header included, that Excel can open
+XLSX_MAX_ROWS = 1048576
+
+# `rows` is a generator, so nothing is read from the database until it is
+# consumed. `summary` returns [(sheet title, header, rows)] of aggregated data
+# that only the XLSX export includes.
+Dataset = namedtuple('Dataset', ['name', 'title', 'header', 'rows', 'summary'])
+
+DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+def _chunk_size():
+    return getattr(settings, 'EXPORT_CHUNK_SIZE', 2000)
+
+def _yes_no(value):
+    return 'Yes' if value else 'No'
+
+def _breakdown(rollups, dimension, title, label, limit=50):
+    return (
+        title,
+        [label, 'Clicks'],
+        [[row[dimension] or 'Unknown', row['count']] for row in top_values(rollups, dimension, limit=limit)],
+    )
+
+def _daily_clicks(**owner):
+    series = click_series('day', getattr(settings, 'ANALYTICS_MAX_DAYS', 365), **owner)
+    return ('Daily Clicks', ['Date', 'Clicks'], [[day.date(), count] for day, count in zip(series.buckets, series.values)])
+
+def url_clicks_dataset(url):
+    """Every click on a link, newest first"""
+    def rows():
+        clicks = Click.objects.filter(url=url).order_by('-clicked_at', '-pk').values_list(
+            'clicked_at', 'ip_address', 'browser', 'device', 'os', 'country', 'city', 'referrer'
+        )
+        for clicked_at, ip_address, browser, device, os, country, city, referrer in clicks.iterator(chunk_size=_chunk_size()):
+            yield [clicked_at, ip_address, browser, device, os, country, city, referrer or 'Direct']
+
+    def summary():
+        rollups = rollups_for(url=url)
+        clicks, unique_clicks = sum_clicks(rollups)
+        return [
+            ('Summary', ['Metric', 'Value'], [
+                ['Short URL', url.short_url],
+                ['Original URL', url.original_url],
+                ['Created', url.created_at],
+                ['Total Clicks', clicks],
+                ['Unique Clicks', unique_clicks],
+            ]),
+            _daily_clicks(url=url),
+            _breakdown(rollups, 'country', 'Countries', 'Country'),
+            _breakdown(rollups, 'browser', 'Browsers', 'Browser'),
+            _breakdown(rollups, 'device', 'Devices', 'Device'),
+            _breakdown(rollups, 'referrer_domain', 'Referrers', 'Referrer'),
+        ]
+
+    return Dataset(
+        f'{url.short_code}_analytics',
+        'Clicks',
+        ['Date', 'IP Address', 'Browser', 'Device', 'OS', 'Country', 'City', 'Referrer'],
+        rows(),
+        summary,
+    )
+
+def user_urls_dataset(user):
+    """Every link of a user with its click totals, newest first"""
+    def rows():
+        urls = ShortenedURL.objects.filter(user=user).order_by('-created_at', '-pk').values_list(
+            'original_url', 'short_code', 'click_count', 'unique_clicks', 'created_at', 'is_active', 'expires_at'
+        )
+        for original_url, short_code, click_count, unique_clicks, created_at, is_active, expires_at in urls.iterator(chunk_size=_chunk_size()):
+            yield [
+                original_url, short_code, click_count, unique_clicks, created_at,
+                _yes_no(is_active), expires_at or 'Never',
+            ]
+
+    def summary():
+        urls = ShortenedURL.objects.filter(user=user)
+        rollups = rollups_for(user=user)
+        clicks, unique_clicks = sum_clicks(rollups)
+        return [
+            ('Summary', ['Metric', 'Value'], [
+                ['Links', urls.count()],
+                ['Active Links', urls.filter(is_active=True).count()],
+                ['Total Clicks', clicks],
+                ['Unique Clicks', unique_clicks],
+            ]),
+            _daily_clicks(user=user),
+            _breakdown(rollups, 'country', 'Countries', 'Country'),
+            _breakdown(rollups, 'browser', 'Browsers', 'Browser'),
+            _breakdown(rollups, 'referrer_domain', 'Referrers', 'Referrer'),
+        ]
+
+    return Dataset(
+        'my_analytics',
+        'Links',
+        ['URL', 'Short Code', 'Total Clicks', 'Unique Clicks', 'Created Date', 'Is Active', 'Expires At'],
+        rows(),
+        summary,
+    )
+
+def system_users_dataset():
+    """Every user with their link and click counts from the system stats snapshot, most clicked first"""
+    def rows():
+        users = User.objects.order_by(F('stats__click_count').desc(nulls_last=True), 'pk').values_list(
+            'email', 'stats__url_count', 'stats__click_count', 'date_joined', 'is_premium', 'is_email_verified'
+        )
+        for email, url_count, click_count, date_joined, is_premium, is_email_verified in users.iterator(chunk_size=_chunk_size()):
+            yield [
+                email, url_count or 0, click_count or 0, date_joined.date(),
+                _yes_no(is_premium), _yes_no(is_email_verified),
+            ]
+
+    def summary():
+        stats = get_system_stats()
+        return [
+            ('Summary', ['Metric', 'Value'], [
+                ['Users', stats.total_users],
+                ['Links', stats.total_urls],
+                ['Active Links', stats.active_urls],
+                ['Total Clicks', stats.total_clicks],
+                ['Updated', stats.refreshed_at],
+            ]),
+            ('Daily Activity', ['Date', 'New Users', 'New Links', 'Clicks'], (
+                list(row) for row in DailySystemStats.objects.order_by('date').values_list(
+                    'date', 'new_users', 'new_urls', 'clicks'
+                ).iterator(chunk_size=_chunk_size())
+            )),
+            ('Countries', ['Country', 'Clicks'], [
+                [row['country'] or 'Unknown', row['count']] for row in stats.top_countries(limit=None)
+            ]),
+        ]
+
+    return Dataset(
+        'system_analytics',
+        'Users',
+        ['User Email', 'URL Count', 'Total Clicks', 'Join Date', 'Is Premium', 'Email Verified'],
+        rows(),
+        summary,
+    )
+
+def _csv_value(value):
+    if isinstance(value, datetime):
+        return value.strftime(DATETIME_FORMAT)
+    if isinstance(value, date):
+        return value.isoformat()
+    return value
+
+def iter_csv(header, rows, buffer_size=64 * 1024):
+    """Encode rows as CSV, yielding bytes in pieces of about `buffer_size`"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    for row in rows:
+        writer.writerow([_csv_value(value) for value in row])
+        if buffer.tell() >= buffer_size:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode()
+
+def iter_gzip(chunks, level=6):
+    """Gzip a byte stream as it is produced"""
+    # wbits=31 writes a gzip header and trailer around the deflate stream
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+def _json_key(title):
+    return re.sub(r'\W+', '_', title.lower()).strip('_')
+
+def _json_value(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+def iter_ndjson(header, rows, buffer_size=64 * 1024):
+    """Encode rows as one JSON object per line, keyed by the snake_cased header"""
+    keys = [_json_key(title) for title in header]
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write(json.dumps(dict(zip(keys, row)), default=_json_value))
+        buffer.write('\n')
+        if buffer.tell() >= buffer_size:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode()
+
+def _xlsx_value(value):
+    # Excel has no time zones; timestamps are written in UTC
+    if isinstance(value, datetime) and value.tzinfo is not None:
+        return value.astimezone(dt_timezone.utc).replace(tzinfo=None)
+    return value
+
+def _append_sheet(workbook, title, header, rows):
+    def new_sheet(number):
+        sheet = workbook.create_sheet(title if number == 1 else f'{title} ({number})')
+        cells = []
+        for value in header:
+            cell = WriteOnlyCell(sheet, value=value)
+            cell.font = Font(bold=True)
+            cells.append(cell)
+        sheet.append(cells)
+        return sheet
+
+    number = 1
+    sheet = new_sheet(number)
+    written = 1
+    for row in rows:
+        if written == XLSX_MAX_ROWS:
+            # Carry on in a new sheet past Excel's row limit
+            number += 1
+            sheet = new_sheet(number)
+            written = 1
+        sheet.append([_xlsx_value(value) for value in row])
+        written += 1
+
+def write_xlsx(dataset, file):
+    """
+    Write a dataset's summary sheets and rows to `file` with openpyxl's
+    write-only workbook, which spools each sheet to disk as rows are appended
+    """
+    workbook = Workbook(write_only=True)
+    for title, header, rows in dataset.summary():
+        _append_sheet(workbook, title, header, rows)
+    _append_sheet(workbook, dataset.title, dataset.header, dataset.rows)
+    workbook.save(file)
+
+def csv_response(dataset, compress=False):
+    """Stream a dataset as a CSV download, optionally gzipped (.csv.gz)"""
+    chunks = iter_csv(dataset.header, dataset.rows)
+    if compress:
+        response = StreamingHttpResponse(iter_gzip(chunks), content_type='application/gzip')
+        response['Content-Disposition'] = f'attachment; filename="{dataset.name}.csv.gz"'
+    else:
+        response = StreamingHttpResponse(chunks, content_type='text/csv')
+        response['Content-Disposition'] = f'attachment; filename="{dataset.name}.csv"'
+    return response
+
+def xlsx_response(dataset):
+    """Build an XLSX workbook in a temporary file and send it from there"""
+    file = tempfile.TemporaryFile()
+    try:
+        write_xlsx(dataset, file)
+    except Exception:
+        file.close()
+        raise
+    file.seek(0)
+    return FileResponse(file, as_attachment=True, filename=f'{dataset.name}.xlsx', content_type=XLSX_CONTENT_TYPE)
+
+def wants_gzip(request):
+    return request.GET.get('compress') == 'gzip'
+
+def export_response(request, dataset):
+    """Export a dataset in the format asked for with ?format= (csv by default, or xlsx)"""
+    if request.GET.get('format') == 'xlsx':
+        return xlsx_response(dataset)
+    return csv_response(dataset, compress=wants_gzip(request))
+
+# Export jobs: the file is written by a background worker and downloaded later
+
+_EXTENSIONS = {
+    ExportJob.FORMAT_CSV: 'csv',
+    ExportJob.FORMAT_XLSX: 'xlsx',
+    ExportJob.FORMAT_NDJSON: 'ndjson',
+}
+
+_CONTENT_TYPES = {
+    ExportJob.FORMAT_CSV: 'text/csv',
+    ExportJob.FORMAT_XLSX: XLSX_CONTENT_TYPE,
+    ExportJob.FORMAT_NDJSON: 'application/x-ndjson',
+}
+
+def export_format(request, default=ExportJob.FORMAT_CSV):
+    """The ?format= of an export request, or None when it isn't one we produce"""
+    value = request.GET.get('format') or default
+    return value if value in _EXTENSIONS else None
+
+def start_export(user, export_format, url=None, compress=False):
+    """
+    Queue an export of a link's clicks (or, without `url`, of all the user's
+    links). When the same export is already pending or running, that job is
+    returned instead, unless its worker has stopped responding. Returns (job, created).
+    """
+    kind = ExportJob.KIND_URL if url is not None else ExportJob.KIND_USER
+    # XLSX is already compressed
+    compress = compress and export_format != ExportJob.FORMAT_XLSX
+    key = f"{kind}:{user.pk}:{url.pk if url is not None else ''}:{export_format}{':gzip' if compress else ''}"
+    # An abandoned job would otherwise hold the key forever; it starts over instead
+    recover_stale_jobs(ExportJob, key=key)
+    active = ExportJob.objects.filter(key=key, status__in=[ExportJob.STATUS_PENDING, ExportJob.STATUS_RUNNING])
+
+    job = active.first()
+    if job is not None:
+        return job, False
+    try:
+        with transaction.atomic():
+            job = ExportJob.objects.create(
+                user=user, url=url, kind=kind, format=export_format, compress=compress, key=key
+            )
+    except IntegrityError:
+        # A concurrent request created the same export first
+        job = active.first()
+        if job is None:
+            raise
+        return job, False
+    enqueue_job(job)
+    return job, True
+
+def _dataset_for(job):
+    """The job's dataset and its row count"""
+    if job.kind == ExportJob.KIND_URL:
+        if job.url is None or job.url.deleted_at is not None:
+            raise JobError('The link no longer exists')
+        return url_clicks_dataset(job.url), Click.objects.filter(url=job.url).count()
+    return user_urls_dataset(job.user), ShortenedURL.objects.filter(user=job.user).count()
+
+def _track_progress(job, rows):
+    """Pass rows through, recording how many have been written every EXPORT_CHUNK_SIZE rows"""
+    every = _chunk_size()
+    processed = 0
+    for row in rows:
+        yield row
+        processed += 1
+        if processed % every == 0:
+            update_job(job, processed=processed)
+    update_job(job, processed=processed)
+
+def _write_export(job, dataset, file):
+    if job.format == ExportJob.FORMAT_XLSX:
+        write_xlsx(dataset, file)
+        return
+    if job.format == ExportJob.FORMAT_NDJSON:
+        chunks = iter_ndjson(dataset.header, dataset.rows)
+    else:
+        chunks = iter_csv(dataset.header, dataset.rows)
+    if job.compress:
+        chunks = iter_gzip(chunks)
+    for chunk in chunks:
+        file.write(chunk)
+
+def run_export_job(job):
+    """Write an export job's file to storage, where it is kept for EXPORT_TTL seconds"""
+    delete_expired_exports()
+    dataset, total = _dataset_for(job)
+    update_job(job, total=total)
+    dataset = dataset._replace(rows=_track_progress(job, dataset.rows))
+
+    filename = f"{dataset.name}.{_EXTENSIONS[job.format]}{'.gz' if job.compress else ''}"
+    with tempfile.TemporaryFile() as file:
+        _write_export(job, dataset, file)
+        size = file.tell()
+        file.seek(0)
+        # The stored name is random, so artifacts can't be found by guessing
+        job.file.save(f'{job.pk}_{uuid.uuid4().hex}_{filename}', File(file), save=False)
+    if not ExportJob.objects.filter(pk=job.pk).exists():
+        # The link was purged while exporting, taking the job with it
+        job.file.delete(save=False)
+        return
+    update_job(
+        job,
+        file=job.file.name,
+        filename=filename,
+        size=size,
+        expires_at=timezone.now() + timedelta(seconds=getattr(settings, 'EXPORT_TTL', 24 * 60 * 60)),
+    )
+
+def delete_expired_exports():
+    """Remove the files of exports past their expiry, returning how many were removed"""
+    expired = ExportJob.objects.filter(expires_at__lte=timezone.now()).exclude(file='')
+    deleted = 0
+    for job in expired.iterator():
+        try:
+            job.file.delete(save=False)
+        except OSError:
+            logger.warning('Could not delete export file %s', job.file.name)
+            continue
+        update_job(job, file='')
+        deleted += 1
+    return deleted
+
+def export_download_response(job):
+    """Send a finished export's file"""
+    content_type = 'application/gzip' if job.compress else _CONTENT_TYPES[job.format]
+    return FileResponse(job.file.open('rb'), as_attachment=True, filename=job.filename, content_type=content_type)
@@ -0,0 +1,152 @@
+from collections import Counter, defaultdict
+from datetime import timedelta
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Count, F, Max, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from shortener.models import ShortenedURL, Click, SystemStats, DailySystemStats, UserStats
+
+User = get_user_model()
+
+# Rows are inserted by concurrent transactions, so ids can commit out of
+# order. Ids this far below the watermark that weren't visible yet are kept
+# as gaps and rechecked by later refreshes; older ones are taken to be rolled
+# back or deleted.
+GAP_OVERLAP = 10000
+
+ROW_COUNT = Count('pk')
+# Clicks of sampled links stand for as many clicks as the sampling rate, as in the rollups
+CLICK_WEIGHT = Sum('url__analytics_sample_every')
+
+def _new_rows(queryset, after, until, gaps, batch_size):
+    """
+    Querysets over rows not counted yet: those in `gaps` that have appeared
+    since, then primary-key windows (after, until]. Returns (windows, gaps
+    still missing); the windows must be consumed before the gaps are read.
+    """
+    missing = []
+    floor = until - GAP_OVERLAP
+
+    def windows():
+        for start in range(0, len(gaps), batch_size):
+            chunk = gaps[start:start + batch_size]
+            found = set(queryset.filter(pk__in=chunk).values_list('pk', flat=True))
+            missing.extend(pk for pk in chunk if pk not in found and pk > floor)
+            if found:
+                yield queryset.filter(pk__in=found)
+
+        lower = after
+        while lower < until:
+            upper = min(lower + batch_size, until)
+            window = queryset.filter(pk__gt=lower, pk__lte=upper)
+            if upper > floor and window.count() < upper - lower:
+                # Ids counted later must not be counted now, even if they commit meanwhile
+                found = set(window.values_list('pk', flat=True))
+                holes = [pk for pk in range(max(lower, floor) + 1, upper + 1) if pk not in found]
+                missing.extend(holes)
+                window = window.exclude(pk__in=holes)
+            yield window
+            lower = upper
+
+    return windows(), missing
+
+def _count_by(window, field, value=ROW_COUNT, **annotations):
+    return dict(
+        window.annotate(**annotations).values(field).annotate(count=value).values_list(field, 'count')
+    )
+
+def _add_daily(daily, window, date_field, name, tz, value=ROW_COUNT):
+    """Count a window's rows per local day into `daily`, returning the window's total"""
+    counts = _count_by(window, 'day', value, day=TruncDate(date_field, tzinfo=tz))
+    for date, count in counts.items():
+        daily[date][name] += count or 0
+    return sum(count or 0 for count in counts.values())
+
+def _apply_daily(daily):
+    for date in sorted(daily):
+        changes = daily[date]
+        updated = DailySystemStats.objects.filter(date=date).update(
+            **{field: F(field) + count for field, count in changes.items()}
+        )
+        if not updated:
+            DailySystemStats.objects.create(date=date, **changes)
+
+def _apply_user_counts(counts, field):
+    existing = set(UserStats.objects.filter(pk__in=counts).values_list('pk', flat=True))
+    for user_id in sorted(existing):
+        UserStats.objects.filter(pk=user_id).update(**{field: F(field) + counts[user_id]})
+    UserStats.objects.bulk_create([
+        UserStats(user_id=user_id, **{field: count})
+        for user_id, count in counts.items() if user_id not in existing
+    ])
+
+def refresh_system_stats(batch_size=None):
+    """
+    Bring the system stats up to date by counting only users, links and clicks
+    created since the last refresh (tracked by primary key, with ids that
+    committed late picked up from the gaps). Counts are of rows created, so
+    links and clicks purged later are still included. Returns the SystemStats row.
+    """
+    batch_size = batch_size or getattr(settings, 'SYSTEM_STATS_BATCH_SIZE', 100000)
+    tz = timezone.get_current_timezone()
+    with transaction.atomic():
+        # One refresh at a time; concurrent ones wait and then find little to do
+        stats, _ = SystemStats.objects.select_for_update().get_or_create(pk=1)
+        daily = defaultdict(Counter)
+
+        users = User.objects.order_by()
+        until = max(users.aggregate(last=Max('pk'))['last'] or 0, stats.last_user_id)
+        windows, stats.user_id_gaps = _new_rows(users, stats.last_user_id, until, stats.user_id_gaps, batch_size)
+        for window in windows:
+            _add_daily(daily, window, 'date_joined', 'new_users', tz)
+        stats.last_user_id = until
+
+        urls = ShortenedURL.all_objects.order_by()
+        until = max(urls.aggregate(last=Max('pk'))['last'] or 0, stats.last_url_id)
+        windows, stats.url_id_gaps = _new_rows(urls, stats.last_url_id, until, stats.url_id_gaps, batch_size)
+        for window in windows:
+            _add_daily(daily, window, 'created_at', 'new_urls', tz)
+            _apply_user_counts(_count_by(window, 'user_id'), 'url_count')
+        stats.last_url_id = until
+
+        clicks = Click.objects.order_by()
+        until = max(clicks.aggregate(last=Max('pk'))['last'] or 0, stats.last_click_id)
+        windows, stats.click_id_gaps = _new_rows(clicks, stats.last_click_id, until, stats.click_id_gaps, batch_size)
+        countries = Counter(stats.country_clicks)
+        for window in windows:
+            stats.total_clicks += _add_daily(daily, window, 'clicked_at', 'clicks', tz, CLICK_WEIGHT)
+            countries.update(_count_by(window, 'country', CLICK_WEIGHT))
+            _apply_user_counts(_count_by(window, 'url__user_id', CLICK_WEIGHT), 'click_count')
+        stats.last_click_id = until
+
+        _apply_daily(daily)
+
+        # Current state rather than history: a few indexed counts and one top-N
+        stats.country_clicks = dict(countries)
+        stats.total_users = User.objects.count()
+        stats.total_urls = ShortenedURL.objects.count()
+        stats.active_urls = ShortenedURL.objects.filter(is_active=True).count()
+        stats.top_urls = list(
+            ShortenedURL.objects.order_by('-click_count', 'pk').values('short_code', 'original_url', 'click_count')[:10]
+        )
+        stats.refreshed_at = timezone.now()
+        stats.save()
+    return stats
+
+def get_system_stats():
+    """
+    The current snapshot, or an empty one (refreshed_at None) until
+    `manage.py refresh_system_stats` has built it
+    """
+    return SystemStats.objects.filter(pk=1).first() or SystemStats(pk=1)
+
+def daily_totals(days, end=None):
+    """{date: DailySystemStats} for the `days` days up to and including `end` (today by default)"""
+    end = end or timezone.localdate()
+    rows = DailySystemStats.objects.filter(date__gt=end - timedelta(days=days), date__lte=end)
+    return {row.date: row for row in rows}
+
+def sum_since(totals, field, start):
+    return sum(getattr(row, field) for date, row in totals.items() if date >= start)
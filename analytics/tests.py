@@ -0,0 +1,81 @@
+from datetime import datetime, timezone as dt_timezone
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from shortener.models import ShortenedURL, Click, SystemStats, DailySystemStats, UserStats
+from shortener.rollups import rebuild_rollups
+from .system_stats import refresh_system_stats, get_system_stats
+from .timeseries import click_series, get_timezone, hour_of_day_distribution
+
+class ClickSeriesTimeZoneTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        user = get_user_model().objects.create_user(
+            username='series', email='series@example.com', password='secret'
+        )
+        cls.url = ShortenedURL.objects.create(
+            user=user, original_url='https://example.com/', short_code='go-series', analytics_sample_every=2
+        )
+        # 00:25 on 17 October in Kathmandu (UTC+5:45), 14:40 on the 16th in New York
+        cls.clicked_at = datetime(2026, 10, 16, 18, 40, tzinfo=dt_timezone.utc)
+        Click.objects.create(url=cls.url, ip_address='10.0.0.1', clicked_at=cls.clicked_at)
+        rebuild_rollups(cls.url)
+
+    def _daily(self, zone):
+        tz = get_timezone(zone)
+        series = click_series('day', 3, end=datetime(2026, 10, 18, 12, tzinfo=dt_timezone.utc), tz=tz, url=self.url)
+        return {bucket.date().isoformat(): value for bucket, value in zip(series.buckets, series.values)}
+
+    def test_quarter_hour_offset_uses_local_day(self):
+        self.assertEqual(self._daily('Asia/Kathmandu'), {'2026-10-16': 0, '2026-10-17': 2, '2026-10-18': 0})
+
+    def test_half_hour_offset_uses_local_hour(self):
+        # 00:10 in Kolkata (UTC+5:30), though its UTC hour starts at 23:30 there
+        distribution = hour_of_day_distribution(tz=get_timezone('Asia/Kolkata'), url=self.url)
+        self.assertEqual(distribution[0], 2)
+        self.assertEqual(sum(distribution), 2)
+
+    def test_whole_hour_offset_reads_rollups(self):
+        self.assertEqual(self._daily('America/New_York'), {'2026-10-16': 2, '2026-10-17': 0, '2026-10-18': 0})
+
+class SystemStatsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(
+            username='stats', email='stats@example.com', password='secret'
+        )
+        cls.url = ShortenedURL.objects.create(
+            user=cls.user, original_url='https://example.com/', short_code='go-stats', analytics_sample_every=3
+        )
+
+    def _click(self, **fields):
+        return Click.objects.create(url=self.url, ip_address='10.0.0.1', country='Nepal', **fields)
+
+    def test_clicks_are_weighted_by_sampling_rate(self):
+        self._click()
+        stats = refresh_system_stats()
+        self.assertEqual(stats.total_clicks, 3)
+        self.assertEqual(stats.country_clicks, {'Nepal': 3})
+        self.assertEqual(UserStats.objects.get(pk=self.user.pk).click_count, 3)
+        self.assertEqual(sum(row.clicks for row in DailySystemStats.objects.all()), 3)
+
+    def test_rows_committed_out_of_order_are_counted_once(self):
+        first, late, last = self._click(), self._click(), self._click()
+        # `late` belongs to a transaction that commits after the refresh
+        late_pk = late.pk
+        late.delete()
+        stats = refresh_system_stats()
+        self.assertEqual(stats.total_clicks, 6)
+        self.assertEqual(stats.click_id_gaps, [late_pk])
+
+        self._click(pk=late_pk)
+        stats = refresh_system_stats()
+        self.assertEqual(stats.total_clicks, 9)
+        self.assertEqual(stats.click_id_gaps, [])
+
+        stats = refresh_system_stats()
+        self.assertEqual(stats.total_clicks, 9)
+
+    def test_snapshot_is_not_built_on_read(self):
+        stats = get_system_stats()
+        self.assertIsNone(stats.refreshed_at)
+        self.assertFalse(SystemStats.objects.exists())
@@ -0,0 +1,190 @@
+from collections import namedtuple
+from datetime import timedelta, timezone as dt_timezone
+from django.conf import settings
+from django.db.models import Count, Sum
+from django.db.models.functions import ExtractHour, Trunc
+from django.utils import timezone
+from shortener.models import Click
+from shortener.rollups import rollups_for
+import zoneinfo
+
+GRANULARITIES = ('minute', 'hour', 'day', 'week', 'month')
+
+_STEPS = {
+    'minute': timedelta(minutes=1),
+    'hour': timedelta(hours=1),
+}
+
+class Series(namedtuple('Series', ['granularity', 'timezone', 'buckets', 'values'])):
+    """Gap-filled counts, one per bucket start (aware datetimes in `timezone`)"""
+    __slots__ = ()
+
+    @property
+    def total(self):
+        return sum(self.values)
+
+    def as_dict(self):
+        """Compact form: bucket starts are implied by start and granularity"""
+        return {
+            'granularity': self.granularity,
+            'timezone': str(self.timezone),
+            'start': self.buckets[0].isoformat() if self.buckets else None,
+            'values': list(self.values),
+        }
+
+def get_timezone(name=None):
+    """Zone for an IANA name (the current time zone when empty), raising ValueError when unknown"""
+    if not name:
+        return timezone.get_current_timezone()
+    try:
+        return zoneinfo.ZoneInfo(name)
+    except (zoneinfo.ZoneInfoNotFoundError, ValueError):
+        raise ValueError(f'Unknown time zone: {name}')
+
+def clamp_days(value, default=30):
+    """Parse a `days` parameter, falling back to `default` and capping it at ANALYTICS_MAX_DAYS"""
+    try:
+        days = int(value) if value not in (None, '') else default
+    except (TypeError, ValueError):
+        days = default
+    return min(max(days, 1), getattr(settings, 'ANALYTICS_MAX_DAYS', 365))
+
+def _truncate(local, granularity):
+    if granularity == 'minute':
+        return local.replace(second=0, microsecond=0)
+    if granularity == 'hour':
+        return local.replace(minute=0, second=0, microsecond=0)
+    local = local.replace(hour=0, minute=0, second=0, microsecond=0)
+    if granularity == 'week':
+        # Weeks start on Monday, as with the database's week truncation
+        return local - timedelta(days=local.weekday())
+    if granularity == 'month':
+        return local.replace(day=1)
+    return local
+
+def _shift(naive, granularity, count):
+    if granularity == 'month':
+        month = naive.month - 1 + count
+        return naive.replace(year=naive.year + month // 12, month=month % 12 + 1)
+    if granularity == 'week':
+        return naive + timedelta(weeks=count)
+    return naive + timedelta(days=count)
+
+def bucket_starts(granularity, periods, end=None, tz=None):
+    """The `periods` bucket starts ending with the one containing `end`, plus the exclusive end"""
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"Granularity must be one of {', '.join(GRANULARITIES)}")
+    max_points = getattr(settings, 'TIMESERIES_MAX_POINTS', 2000)
+    if not 1 <= periods <= max_points:
+        raise ValueError(f'A series can have between 1 and {max_points} points')
+    tz = tz or timezone.get_current_timezone()
+    last = _truncate((end or timezone.now()).astimezone(tz), granularity)
+
+    if granularity in _STEPS:
+        # Step in absolute time so DST changes neither skip nor repeat buckets
+        step = _STEPS[granularity]
+        last = last.astimezone(dt_timezone.utc)
+        starts = [(last - step * offset).astimezone(tz) for offset in range(periods - 1, -1, -1)]
+        return starts, (last + step).astimezone(tz)
+
+    # Calendar buckets follow local midnights, whatever their UTC offset
+    naive = last.replace(tzinfo=None)
+    starts = [
+        timezone.make_aware(_shift(naive, granularity, -offset), tz)
+        for offset in range(periods - 1, -1, -1)
+    ]
+    return starts, timezone.make_aware(_shift(naive, granularity, 1), tz)
+
+def series_for(queryset, field, aggregate, granularity='day', periods=30, end=None, tz=None):
+    """
+    Gap-filled series of `aggregate` over `queryset`, bucketed by the datetime
+    `field` in time zone `tz`. Runs a single GROUP BY query.
+    """
+    tz = tz or timezone.get_current_timezone()
+    starts, stop = bucket_starts(granularity, periods, end, tz)
+    rows = queryset.filter(**{
+        f'{field}__gte': starts[0], f'{field}__lt': stop,
+    }).annotate(
+        series_bucket=Trunc(field, granularity, tzinfo=tz)
+    ).order_by().values('series_bucket').annotate(
+        series_value=aggregate
+    ).values_list('series_bucket', 'series_value')
+
+    counts = {}
+    for bucket, value in rows:
+        key = bucket.astimezone(dt_timezone.utc)
+        counts[key] = counts.get(key, 0) + (value or 0)
+    values = [counts.get(start.astimezone(dt_timezone.utc), 0) for start in starts]
+    return Series(granularity, tz, starts, values)
+
+def _is_utc(moments):
+    return all(moment.utcoffset() == timedelta(0) for moment in moments)
+
+def _on_the_hour(moments):
+    """Whether every moment's UTC offset is a whole number of hours, so UTC hours map onto local ones"""
+    return all(moment.utcoffset() % timedelta(hours=1) == timedelta(0) for moment in moments)
+
+def _raw_clicks(user=None, url=None):
+    clicks = Click.objects.all()
+    if user is not None:
+        clicks = clicks.filter(url__user=user, url__deleted_at__isnull=True)
+    if url is not None:
+        clicks = clicks.filter(url=url)
+    return clicks
+
+# Raw clicks stand for as many clicks as their link's sampling rate
+_RAW_CLICK_WEIGHT = Sum('url__analytics_sample_every')
+
+def click_series(granularity='day', periods=30, end=None, tz=None, user=None, url=None):
+    """
+    Clicks per bucket for a user, a URL or (with neither) every link. Hour and
+    coarser series read the click rollups, which are bucketed by UTC hour.
+    Minute series, and series in zones whose offset isn't a whole number of
+    hours (e.g. Asia/Kathmandu), read raw clicks weighted by each link's
+    sampling rate instead.
+    """
+    tz = tz or timezone.get_current_timezone()
+    starts, stop = bucket_starts(granularity, periods, end, tz)
+    if granularity == 'minute' or not _on_the_hour(starts + [stop]):
+        return series_for(_raw_clicks(user, url), 'clicked_at', _RAW_CLICK_WEIGHT, granularity, periods, end, tz)
+
+    # Daily rollups only line up with calendar buckets in UTC
+    period = 'day' if granularity != 'hour' and _is_utc(starts + [stop]) else 'hour'
+    rollups = rollups_for(user=user, url=url, period=period)
+    return series_for(rollups, 'bucket', Sum('clicks'), granularity, periods, end, tz)
+
+def _local_moments(tz, start=None, end=None):
+    """The range as local times in `tz`, one a day, to check its UTC offsets"""
+    end = end or timezone.now()
+    start = start or end - timedelta(days=365)
+    moment, offsets = start, []
+    while moment < end:
+        offsets.append(moment.astimezone(tz))
+        moment += timedelta(days=1)
+    return offsets + [end.astimezone(tz)]
+
+def hour_of_day_distribution(start=None, end=None, tz=None, user=None, url=None):
+    """Clicks per local hour of the day (24 values) in a single query"""
+    tz = tz or timezone.get_current_timezone()
+    if _on_the_hour(_local_moments(tz, start, end)):
+        rows = rollups_for(start, end, user=user, url=url, period='hour').annotate(
+            series_hour=ExtractHour('bucket', tzinfo=tz)
+        ).order_by().values('series_hour').annotate(series_value=Sum('clicks'))
+    else:
+        clicks = _raw_clicks(user, url)
+        if start is not None:
+            clicks = clicks.filter(clicked_at__gte=start)
+        if end is not None:
+            clicks = clicks.filter(clicked_at__lt=end)
+        rows = clicks.annotate(
+            series_hour=ExtractHour('clicked_at', tzinfo=tz)
+        ).order_by().values('series_hour').annotate(series_value=_RAW_CLICK_WEIGHT)
+
+    values = [0] * 24
+    for hour, value in rows.values_list('series_hour', 'series_value'):
+        values[int(hour)] += value or 0
+    return values
+
+def count_series(queryset, field, granularity='day', periods=30, end=None, tz=None):
+    """Gap-filled row counts of `queryset` bucketed by a datetime field"""
+    return series_for(queryset, field, Count('pk'), granularity, periods, end, tz)
@@ -1,118 +1,45 @@
-from django.db.models import Count, Q
 from django.utils import timezone
 from datetime import timedelta
-from shortener.models import Click, ShortenedURL
+from shortener.models import ShortenedURL
+from shortener.rollups import rollups_for, top_values
+from .timeseries import clamp_days, click_series
 
 class AnalyticsProcessor:
-    """Utility class for processing analytics data"""
+    """Utility class for processing analytics data (read from click rollups)"""
     
     @staticmethod
     def get_click_trends(user=None, url=None, days=30):
         """Get click trends over time"""
-        clicks = Click.objects.all()
+        series = click_series('day', clamp_days(days), user=user, url=url)
         
-        if user:
-            clicks = clicks.filter(url__user=user)
-        if url:
-            clicks = clicks.filter(url=url)
-        
-        end_date = timezone.now().date()
-        start_date = end_date - timedelta(days=days-1)
-        
-        return clicks.filter(
-            clicked_at__date__gte=start_date
-        ).extra(
-            select={'day': 'date(clicked_at)'}
-        ).values('day').annotate(
-            count=Count('id')
-        ).order_by('day')
+        return [
+            {'day': day.date(), 'count': count}
+            for day, count in zip(series.buckets, series.values)
+        ]
     
     @staticmethod
     def get_geographic_distribution(user=None, url=None):
         """Get geographic distribution of clicks"""
-        clicks = Click.objects.all()
-        
-        if user:
-            clicks = clicks.filter(url__user=user)
-        if url:
-            clicks = clicks.filter(url=url)
-        
-        return clicks.exclude(
-            country__in=['', 'Unknown']
-        ).values('country').annotate(
-            count=Count('country')
-        ).order_by('-count')
+        return top_values(rollups_for(user=user, url=url), 'country', limit=None, exclude=['', 'Unknown'])
     
     @staticmethod
     def get_technology_stats(user=None, url=None):
         """Get browser, device, and OS statistics"""
-        clicks = Click.objects.all()
-        
-        if user:
-            clicks = clicks.filter(url__user=user)
-        if url:
-            clicks = clicks.filter(url=url)
-        
-        browsers = clicks.exclude(
-            browser__in=['', 'Unknown']
-        ).values('browser').annotate(
-            count=Count('browser')
-        ).order_by('-count')[:10]
-        
-        devices = clicks.exclude(
-            device__in=['', 'Unknown']
-        ).values('device').annotate(
-            count=Count('device')
-        ).order_by('-count')[:10]
-        
-        operating_systems = clicks.exclude(
-            os__in=['', 'Unknown']
-        ).values('os').annotate(
-            count=Count('os')
-        ).order_by('-count')[:10]
+        rollups = rollups_for(user=user, url=url)
         
         return {
-            'browsers': browsers,
-            'devices': devices,
-            'operating_systems': operating_systems
+            'browsers': top_values(rollups, 'browser', exclude=['', 'Unknown']),
+            'devices': top_values(rollups, 'device', exclude=['', 'Unknown']),
+            'operating_systems': top_values(rollups, 'os', exclude=['', 'Unknown'])
         }
     
     @staticmethod
     def get_referrer_stats(user=None, url=None):
         """Get referrer statistics"""
-        clicks = Click.objects.all()
-        
-        if user:
-            clicks = clicks.filter(url__user=user)
-        if url:
-            clicks = clicks.filter(url=url)
-        
-        # Group similar referrers
-        referrers = clicks.exclude(
-            Q(referrer__isnull=True) | Q(referrer__exact='')
-        ).values('referrer').annotate(
-            count=Count('referrer')
-        ).order_by('-count')[:20]
-        
-        # Process referrers to extract domains
-        processed_referrers = {}
-        for ref in referrers:
-            try:
-                from urllib.parse import urlparse
-                domain = urlparse(ref['referrer']).netloc
-                if domain:
-                    if domain in processed_referrers:
-                        processed_referrers[domain] += ref['count']
-                    else:
-                        processed_referrers[domain] = ref['count']
-            except:
-                continue
+        # Referrers are grouped by domain when clicks are rolled up
+        referrers = top_values(rollups_for(user=user, url=url), 'referrer_domain', exclude=[''])
         
-        return sorted(
-            [{'domain': k, 'count': v} for k, v in processed_referrers.items()],
-            key=lambda x: x['count'],
-            reverse=True
-        )[:10]
+        return [{'domain': ref['referrer_domain'], 'count': ref['count']} for ref in referrers]
     
     @staticmethod
     def get_performance_metrics(user=None):
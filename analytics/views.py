@@ -1,10 +1,14 @@
-from django.shortcuts import render, get_object_or_404
+from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required, user_passes_test
-from django.http import JsonResponse, HttpResponse
-from django.db.models import Count, Q
+from django.http import JsonResponse, HttpResponseBadRequest
+from django.db.models import Q
 from django.utils import timezone
 from datetime import timedelta, datetime
-from shortener.models import ShortenedURL, Click
+from shortener.models import ShortenedURL, Click, UserStats
+from shortener.rollups import rollups_for, day_start, sum_clicks, top_values
+from .timeseries import clamp_days, click_series, hour_of_day_distribution
+from .system_stats import get_system_stats, daily_totals, sum_since
+from .exports import system_users_dataset, export_response, export_format, wants_gzip, start_export
 from django.contrib.auth import get_user_model
 import json
 from collections import defaultdict
@@ -18,28 +22,17 @@ def analytics_dashboard(request):
     
     # Overall statistics
     total_urls = user_urls.count()
-    total_clicks = Click.objects.filter(url__user=request.user).count()
     active_urls = user_urls.filter(is_active=True).count()
     
-    # Time-based statistics
-    today = timezone.now().date()
+    # Click totals come from the daily rollups, not the raw click history
+    today = timezone.localdate()
     week_ago = today - timedelta(days=7)
     month_ago = today - timedelta(days=30)
     
-    clicks_today = Click.objects.filter(
-        url__user=request.user,
-        clicked_at__date=today
-    ).count()
-    
-    clicks_this_week = Click.objects.filter(
-        url__user=request.user,
-        clicked_at__date__gte=week_ago
-    ).count()
-    
-    clicks_this_month = Click.objects.filter(
-        url__user=request.user,
-        clicked_at__date__gte=month_ago
-    ).count()
+    total_clicks = sum_clicks(rollups_for(user=request.user))[0]
+    clicks_today = sum_clicks(rollups_for(day_start(today), user=request.user))[0]
+    clicks_this_week = sum_clicks(rollups_for(day_start(week_ago), user=request.user))[0]
+    clicks_this_month = sum_clicks(rollups_for(day_start(month_ago), user=request.user))[0]
     
     # Top performing URLs
     top_urls = user_urls.order_by('-click_count')[:5]
@@ -68,43 +61,28 @@ def url_analytics_detail(request, pk):
     url = get_object_or_404(ShortenedURL, pk=pk, user=request.user)
     
     # Time range filter
-    days = int(request.GET.get('days', 30))
+    days = clamp_days(request.GET.get('days'), 30)
     start_date = timezone.now() - timedelta(days=days)
     
-    clicks = Click.objects.filter(url=url, clicked_at__gte=start_date)
+    rollups = rollups_for(start_date, url=url)
     
     # Basic statistics
-    total_clicks = clicks.count()
-    unique_visitors = clicks.values('ip_address').distinct().count()
+    total_clicks, unique_visitors = sum_clicks(rollups)
     
     # Time-based analysis
-    daily_clicks = get_daily_clicks(clicks, days)
-    hourly_distribution = get_hourly_distribution(clicks)
+    daily_clicks = get_daily_clicks(days, url=url)
+    hourly_distribution = get_hourly_distribution(start_date, url=url)
     
     # Geographic analysis
-    country_stats = clicks.values('country').annotate(
-        count=Count('country')
-    ).order_by('-count')[:10]
+    country_stats = top_values(rollups, 'country')
     
     # Technology analysis
-    browser_stats = clicks.values('browser').annotate(
-        count=Count('browser')
-    ).order_by('-count')[:10]
-    
-    device_stats = clicks.values('device').annotate(
-        count=Count('device')
-    ).order_by('-count')[:10]
-    
-    os_stats = clicks.values('os').annotate(
-        count=Count('os')
-    ).order_by('-count')[:10]
+    browser_stats = top_values(rollups, 'browser')
+    device_stats = top_values(rollups, 'device')
+    os_stats = top_values(rollups, 'os')
     
     # Referrer analysis
-    referrer_stats = clicks.exclude(referrer__isnull=True).exclude(
-        referrer__exact=''
-    ).values('referrer').annotate(
-        count=Count('referrer')
-    ).order_by('-count')[:10]
+    referrer_stats = top_values(rollups, 'referrer_domain', exclude=[''])
     
     context = {
         'url': url,
@@ -129,16 +107,14 @@ def analytics_api(request):
         action = request.GET.get('action')
         
         if action == 'daily_clicks':
-            days = int(request.GET.get('days', 7))
+            days = clamp_days(request.GET.get('days'), 7)
             url_id = request.GET.get('url_id')
             
             if url_id:
                 url = get_object_or_404(ShortenedURL, pk=url_id, user=request.user)
-                clicks = Click.objects.filter(url=url)
+                data = get_daily_clicks(days, url=url)
             else:
-                clicks = Click.objects.filter(url__user=request.user)
-            
-            data = get_daily_clicks(clicks, days)
+                data = get_daily_clicks(days, user=request.user)
             return JsonResponse({'data': data})
         
         elif action == 'top_countries':
@@ -146,30 +122,26 @@ def analytics_api(request):
             
             if url_id:
                 url = get_object_or_404(ShortenedURL, pk=url_id, user=request.user)
-                clicks = Click.objects.filter(url=url)
+                rollups = rollups_for(url=url)
             else:
-                clicks = Click.objects.filter(url__user=request.user)
+                rollups = rollups_for(user=request.user)
             
-            countries = clicks.values('country').annotate(
-                count=Count('country')
-            ).order_by('-count')[:10]
+            countries = top_values(rollups, 'country')
             
-            return JsonResponse({'data': list(countries)})
+            return JsonResponse({'data': countries})
         
         elif action == 'browser_stats':
             url_id = request.GET.get('url_id')
             
             if url_id:
                 url = get_object_or_404(ShortenedURL, pk=url_id, user=request.user)
-                clicks = Click.objects.filter(url=url)
+                rollups = rollups_for(url=url)
             else:
-                clicks = Click.objects.filter(url__user=request.user)
+                rollups = rollups_for(user=request.user)
             
-            browsers = clicks.values('browser').annotate(
-                count=Count('browser')
-            ).order_by('-count')[:10]
+            browsers = top_values(rollups, 'browser')
             
-            return JsonResponse({'data': list(browsers)})
+            return JsonResponse({'data': browsers})
     
     return JsonResponse({'error': 'Invalid request'}, status=400)
 
@@ -179,58 +151,51 @@ def is_admin(user):
 @user_passes_test(is_admin)
 def admin_analytics(request):
     """Admin analytics dashboard"""
-    # Overall system statistics
-    total_users = User.objects.count()
-    total_urls = ShortenedURL.objects.count()
-    total_clicks = Click.objects.count()
-    active_urls = ShortenedURL.objects.filter(is_active=True).count()
+    # Read from the snapshot kept by `manage.py refresh_system_stats`
+    stats = get_system_stats()
     
     # Time-based statistics
-    today = timezone.now().date()
+    today = timezone.localdate()
     week_ago = today - timedelta(days=7)
     month_ago = today - timedelta(days=30)
+    daily = daily_totals(31, today)
     
-    new_users_today = User.objects.filter(date_joined__date=today).count()
-    new_users_week = User.objects.filter(date_joined__date__gte=week_ago).count()
-    new_users_month = User.objects.filter(date_joined__date__gte=month_ago).count()
+    new_users_today = sum_since(daily, 'new_users', today)
+    new_users_week = sum_since(daily, 'new_users', week_ago)
+    new_users_month = sum_since(daily, 'new_users', month_ago)
     
-    new_urls_today = ShortenedURL.objects.filter(created_at__date=today).count()
-    new_urls_week = ShortenedURL.objects.filter(created_at__date__gte=week_ago).count()
-    new_urls_month = ShortenedURL.objects.filter(created_at__date__gte=month_ago).count()
+    new_urls_today = sum_since(daily, 'new_urls', today)
+    new_urls_week = sum_since(daily, 'new_urls', week_ago)
+    new_urls_month = sum_since(daily, 'new_urls', month_ago)
     
-    clicks_today = Click.objects.filter(clicked_at__date=today).count()
-    clicks_week = Click.objects.filter(clicked_at__date__gte=week_ago).count()
-    clicks_month = Click.objects.filter(clicked_at__date__gte=month_ago).count()
+    clicks_today = sum_since(daily, 'clicks', today)
+    clicks_week = sum_since(daily, 'clicks', week_ago)
+    clicks_month = sum_since(daily, 'clicks', month_ago)
     
     # Top users by URL count
-    top_users = User.objects.annotate(
-        url_count=Count('urls')
-    ).order_by('-url_count')[:10]
+    top_users = [
+        {'username': user_stats.user.username, 'url_count': user_stats.url_count}
+        for user_stats in UserStats.objects.select_related('user').order_by('-url_count')[:10]
+    ]
 
     # Top URLs by clicks
-    top_urls = ShortenedURL.objects.order_by('-click_count')[:10]
+    top_urls = stats.top_urls
 
     # Geographic distribution
-    top_countries = Click.objects.values('country').annotate(
-        count=Count('country')
-    ).order_by('-count')[:10]
+    top_countries = stats.top_countries()
 
     # System activity for last 7 days (for chart)
-    days = 7
-    system_activity_labels = []
-    system_activity_urls = []
-    system_activity_clicks = []
-    for i in range(days-1, -1, -1):
-        day = today - timedelta(days=i)
-        system_activity_labels.append(day.strftime('%b %d'))
-        system_activity_urls.append(ShortenedURL.objects.filter(created_at__date=day).count())
-        system_activity_clicks.append(Click.objects.filter(clicked_at__date=day).count())
+    days = [today - timedelta(days=i) for i in range(6, -1, -1)]
+    system_activity_labels = [day.strftime('%b %d') for day in days]
+    system_activity_urls = [daily[day].new_urls if day in daily else 0 for day in days]
+    system_activity_clicks = [daily[day].clicks if day in daily else 0 for day in days]
 
     context = {
-        'total_users': total_users,
-        'total_urls': total_urls,
-        'total_clicks': total_clicks,
-        'active_urls': active_urls,
+        'stats_refreshed_at': stats.refreshed_at,
+        'total_users': stats.total_users,
+        'total_urls': stats.total_urls,
+        'total_clicks': stats.total_clicks,
+        'active_urls': stats.active_urls,
         'new_users_today': new_users_today,
         'new_users_week': new_users_week,
         'new_users_month': new_users_month,
@@ -252,110 +217,29 @@ def admin_analytics(request):
 
 @login_required
 def export_user_analytics(request):
-    """Export all user analytics to CSV"""
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = 'attachment; filename="my_analytics.csv"'
-    
-    import csv
-    writer = csv.writer(response)
-    
-    # Write header
-    writer.writerow([
-        'URL', 'Short Code', 'Total Clicks', 'Unique Clicks', 
-        'Created Date', 'Is Active', 'Expires At'
-    ])
-    
-    # Write data
-    urls = ShortenedURL.objects.filter(user=request.user).order_by('-created_at')
-    for url in urls:
-        writer.writerow([
-            url.original_url,
-            url.short_code,
-            url.click_count,
-            url.unique_clicks,
-            url.created_at.strftime('%Y-%m-%d %H:%M:%S'),
-            'Yes' if url.is_active else 'No',
-            url.expires_at.strftime('%Y-%m-%d %H:%M:%S') if url.expires_at else 'Never'
-        ])
-    
-    return response
+    """Start a background export of all the user's links (?format=csv, xlsx or ndjson)"""
+    fmt = export_format(request)
+    if fmt is None:
+        return HttpResponseBadRequest('Format must be csv, xlsx or ndjson')
+    job, _ = start_export(request.user, fmt, compress=wants_gzip(request))
+    return redirect('export_job', pk=job.pk)
 
 @user_passes_test(is_admin)
 def export_system_analytics(request):
-    """Export system-wide analytics to CSV"""
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = 'attachment; filename="system_analytics.csv"'
-    
-    import csv
-    writer = csv.writer(response)
-    
-    # Write header
-    writer.writerow([
-        'User Email', 'URL Count', 'Total Clicks', 'Join Date', 
-        'Is Premium', 'Email Verified'
-    ])
-    
-    # Write data
-    users = User.objects.annotate(
-        url_count=Count('urls'),
-        total_clicks=Count('urls__clicks')
-    ).order_by('-total_clicks')
-    
-    for user in users:
-        writer.writerow([
-            user.email,
-            user.url_count,
-            user.total_clicks,
-            user.date_joined.strftime('%Y-%m-%d'),
-            'Yes' if user.is_premium else 'No',
-            'Yes' if user.is_email_verified else 'No'
-        ])
-    
-    return response
+    """Export system-wide analytics to CSV (or XLSX with ?format=xlsx)"""
+    # Per-user counts come from the system stats snapshot
+    return export_response(request, system_users_dataset())
 
 # Utility functions
-def get_daily_clicks(clicks_queryset, days):
+def get_daily_clicks(days, user=None, url=None):
     """Get daily click counts for the last N days"""
-    end_date = timezone.now().date()
-    start_date = end_date - timedelta(days=days-1)
-    
-    # Initialize data structure
-    daily_data = {}
-    current_date = start_date
-    while current_date <= end_date:
-        daily_data[current_date.strftime('%Y-%m-%d')] = 0
-        current_date += timedelta(days=1)
-    
-    # Get actual click counts
-    daily_clicks = clicks_queryset.filter(
-        clicked_at__date__gte=start_date
-    ).extra(
-        select={'day': 'date(clicked_at)'}
-    ).values('day').annotate(
-        count=Count('id')
-    )
-    
-    # Update data structure with actual counts
-    for item in daily_clicks:
-        day_str = item['day'].strftime('%Y-%m-%d')
-        if day_str in daily_data:
-            daily_data[day_str] = item['count']
-    
-    # Convert to list format for charts
-    return [{'date': date, 'clicks': count} for date, count in daily_data.items()]
+    series = click_series('day', days, user=user, url=url)
+    return [
+        {'date': day.strftime('%Y-%m-%d'), 'clicks': count}
+        for day, count in zip(series.buckets, series.values)
+    ]
 
-def get_hourly_distribution(clicks_queryset):
+def get_hourly_distribution(start=None, user=None, url=None):
     """Get hourly distribution of clicks"""
-    hourly_data = {str(i): 0 for i in range(24)}
-    
-    hourly_clicks = clicks_queryset.extra(
-        select={'hour': 'extract(hour from clicked_at)'}
-    ).values('hour').annotate(
-        count=Count('id')
-    )
-    
-    for item in hourly_clicks:
-        hour = str(int(item['hour']))
-        hourly_data[hour] = item['count']
-    
-    return [{'hour': hour, 'clicks': count} for hour, count in hourly_data.items()]
+    values = hour_of_day_distribution(start, user=user, url=url)
+    return [{'hour': str(hour), 'clicks': count} for hour, count in enumerate(values)]
@@ -40,7 +40,11 @@ POST /api/urls/
     "original_url": "https://example.com",
     "custom_alias": "my-link",  // optional
     "is_public": true,          // optional, default: true
-    "expires_at": "2024-12-31T23:59:59Z"  // optional
+    "expires_at": "2024-12-31T23:59:59Z",  // optional
+    "redirect_type": 302,       // optional: 301, 302, 307 or 308
+    "cache_max_age": 0,         // optional, seconds the redirect may be cached (needs analytics_sample_every > 1 or cache_public)
+    "cache_public": false,      // optional, let CDNs cache it too; clicks they answer are not counted
+    "analytics_sample_every": 1 // optional, record one in N clicks
 }
 
 #### URL Details
@@ -51,6 +55,14 @@ DELETE /api/urls/{id}/
 #### URL Analytics
 GET /api/urls/{id}/analytics/?days=30
 - Returns comprehensive analytics for the URL
+- days is capped at 365; daily_clicks lists every day, oldest first, including days without clicks
+
+#### URL Click Series
+GET /api/urls/{id}/timeseries/?granularity=hour&periods=48&tz=Europe/Berlin
+- granularity: minute, hour, day, week or month (default day)
+- periods: number of buckets ending with the current one (default 30, at most 2000)
+- tz: IANA time zone used for bucket boundaries (default UTC)
+- Returns {"granularity", "timezone", "start", "values"}; values holds one count per bucket from start, with empty buckets as 0
 
 #### URL Clicks
 GET /api/urls/{id}/clicks/
@@ -60,6 +72,14 @@ GET /api/urls/{id}/clicks/
 GET /api/urls/{id}/qr/
 - Returns QR code information for the URL
 
+GET /api/urls/{id}/qr/image/?image_format=png&size=medium&fill=000000&back=ffffff
+- Returns the QR code image itself; image_format is png or svg
+- Supports conditional requests: send If-None-Match (ETag) or If-Modified-Since to get 304 Not Modified
+
+#### Download All QR Codes
+GET /api/urls/qr-codes/?image_format=png&size=medium
+- Streams a ZIP file with one QR image per URL, named by short code
+
 ### Bulk Operations
 
 #### Bulk Create URLs
@@ -69,12 +89,66 @@ POST /api/urls/bulk-create/
     "is_public": true,
     "expires_at": "2024-12-31T23:59:59Z"
 }
+- Accepts up to 5000 URLs per request, created in a single transaction
+- Returns id, original_url, short_code, short_url, is_public, expires_at and created_at for each URL
+- QR codes are generated the first time they are requested
+
+#### Import URLs
+POST /api/urls/import/ (multipart/form-data)
+- file: CSV with a header row, or NDJSON (one JSON object or URL string per line)
+- format: "csv" or "ndjson" (optional, guessed from the file name)
+- is_public: true/false (optional, default: true)
+- Columns/keys: original_url (or url), custom_alias (optional), expires_at (optional, ISO 8601)
+- Returns 202 with the import job; the file is processed in the background
+
+#### Import Progress
+GET /api/imports/{id}/
+- Returns status, percent_complete, rows_processed, rows_created, rows_failed
+  and an error report listing the line number and reason for rejected rows
 
 #### Bulk Delete URLs
 DELETE /api/urls/bulk-delete/
 {
     "url_ids": [1, 2, 3]
 }
+- URLs stop resolving immediately; their clicks and QR codes are removed by a
+  background purge job returned as "purge_job"
+
+#### Bulk Update URLs
+PATCH /api/urls/bulk-update/
+{
+    "url_ids": [1, 2, 3],                      // and/or "filter"
+    "filter": {"is_active": true, "is_public": true, "search": "example"},
+    "changes": {"is_active": false, "is_public": false, "expires_at": "2024-12-31T23:59:59Z"}
+}
+- Selects the URLs matching url_ids and every given filter (use "filter": {} for all URLs)
+- "changes" needs at least one field; "expires_at": null removes the expiry
+- Applies the changes in a single UPDATE and returns "updated_count"
+
+#### Purge Progress
+GET /api/purges/{id}/
+- Returns status, percent_complete, urls_purged and clicks_deleted
+
+### Exports
+
+#### Start an Export
+POST /api/exports/
+{
+    "url": 1,            // optional; without it, every URL of the user is exported
+    "format": "csv",     // "csv", "xlsx" or "ndjson"
+    "compress": false    // gzip CSV and NDJSON files
+}
+- Returns 202 with the export job; the file is written in the background
+- An identical export that is already pending or running is returned instead of a new one
+
+#### Export Progress
+GET /api/exports/{id}/
+- Returns status, percent_complete, processed and total rows, and once finished
+  filename, size, expires_at and download_url
+
+#### Download an Export
+GET /api/exports/{id}/download/
+- Returns the file; 409 while the export is running, 410 once it has expired or failed
 
 ### User Data
 
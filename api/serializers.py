@@ -1,5 +1,8 @@
 from rest_framework import serializers
-from shortener.models import ShortenedURL, Click, QRCode
+from django.conf import settings
+from django.urls import reverse
+from shortener.models import ShortenedURL, Click, QRCode, ImportJob, PurgeJob, ExportJob
+from shortener.middleware import get_reserved_prefixes
 from django.contrib.auth import get_user_model
 from django.core.validators import URLValidator
 from django.core.exceptions import ValidationError
@@ -24,7 +27,8 @@ class ShortenedURLSerializer(serializers.ModelSerializer):
         model = ShortenedURL
         fields = [
             'id', 'original_url', 'short_code', 'custom_alias', 'short_url',
-            'is_active', 'is_public', 'expires_at', 'click_count', 'unique_clicks',
+            'is_active', 'is_public', 'expires_at', 'redirect_type', 'cache_max_age', 'cache_public',
+            'analytics_sample_every', 'click_count', 'unique_clicks',
             'is_expired', 'created_at', 'updated_at', 'user'
         ]
         read_only_fields = ['id', 'short_code', 'short_url', 'click_count', 'unique_clicks', 'created_at', 'updated_at', 'user']
@@ -60,29 +64,40 @@ class ShortenedURLSerializer(serializers.ModelSerializer):
                 raise serializers.ValidationError("Custom alias can only contain letters, numbers, and hyphens.")
             
             # Check if already exists
-            if ShortenedURL.objects.filter(short_code=value).exists():
+            if ShortenedURL.all_objects.filter(short_code=value).exists():
                 raise serializers.ValidationError("This custom alias is already taken.")
             
             # Check reserved words
-            reserved_words = ['admin', 'api', 'www', 'dashboard', 'accounts', 'static', 'media']
-            if value.lower() in reserved_words:
+            if value.lower() in {code.lower() for code in get_reserved_prefixes()}:
                 raise serializers.ValidationError("This alias is reserved and cannot be used.")
         
         return value
 
+    def validate(self, data):
+        cache_max_age = data.get('cache_max_age', getattr(self.instance, 'cache_max_age', 0))
+        sample_every = data.get('analytics_sample_every', getattr(self.instance, 'analytics_sample_every', 1))
+        cache_public = data.get('cache_public', getattr(self.instance, 'cache_public', False))
+        if cache_max_age and sample_every == 1 and not cache_public:
+            # Privately cached hits would be lost clicks, so only sampled links are cached that way
+            raise serializers.ValidationError({
+                'cache_max_age': (
+                    'Caching needs click sampling (analytics_sample_every of 2 or more) '
+                    'or cache_public, or use 0.'
+                )
+            })
+        return data
+
 class ShortenedURLCreateSerializer(ShortenedURLSerializer):
     """Serializer for creating URLs with custom alias handling"""
     
     def create(self, validated_data):
-        # Handle custom alias
+        # Handle custom alias. Short codes are set before the first save so
+        # they never change once the row exists.
         custom_alias = validated_data.pop('custom_alias', None)
-        url = ShortenedURL.objects.create(**validated_data)
-        
         if custom_alias:
-            url.short_code = custom_alias
-            url.save()
+            validated_data['short_code'] = custom_alias
         
-        return url
+        return ShortenedURL.objects.create(**validated_data)
 
 class ClickSerializer(serializers.ModelSerializer):
     class Meta:
@@ -116,11 +131,101 @@ class BulkURLCreateSerializer(serializers.Serializer):
     urls = serializers.ListField(
         child=serializers.URLField(),
         min_length=1,
-        max_length=50
+        max_length=getattr(settings, 'BULK_CREATE_MAX_URLS', 5000)
     )
     is_public = serializers.BooleanField(default=True)
     expires_at = serializers.DateTimeField(required=False)
 
+class URLImportSerializer(serializers.Serializer):
+    """Serializer for streaming URL imports"""
+    file = serializers.FileField()
+    format = serializers.ChoiceField(choices=ImportJob.FORMAT_CHOICES, required=False)
+    is_public = serializers.BooleanField(default=True)
+
+class ImportJobSerializer(serializers.ModelSerializer):
+    percent_complete = serializers.ReadOnlyField()
+    
+    class Meta:
+        model = ImportJob
+        fields = [
+            'id', 'status', 'format', 'is_public', 'percent_complete', 'processed', 'total',
+            'rows_processed', 'rows_created', 'rows_failed', 'errors', 'error',
+            'created_at', 'started_at', 'finished_at'
+        ]
+        read_only_fields = fields
+
+class PurgeJobSerializer(serializers.ModelSerializer):
+    percent_complete = serializers.ReadOnlyField()
+    
+    class Meta:
+        model = PurgeJob
+        fields = [
+            'id', 'status', 'percent_complete', 'processed', 'total', 'urls_purged',
+            'clicks_deleted', 'error', 'created_at', 'started_at', 'finished_at'
+        ]
+        read_only_fields = fields
+
+class ExportRequestSerializer(serializers.Serializer):
+    """Serializer for starting an export of one link's clicks, or of all links without `url`"""
+    url = serializers.IntegerField(required=False)
+    format = serializers.ChoiceField(choices=ExportJob.FORMAT_CHOICES, default=ExportJob.FORMAT_CSV)
+    compress = serializers.BooleanField(default=False)
+
+class ExportJobSerializer(serializers.ModelSerializer):
+    percent_complete = serializers.ReadOnlyField()
+    download_url = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = ExportJob
+        fields = [
+            'id', 'status', 'kind', 'url', 'format', 'compress', 'percent_complete', 'processed', 'total',
+            'filename', 'size', 'expires_at', 'download_url', 'error',
+            'created_at', 'started_at', 'finished_at'
+        ]
+        read_only_fields = fields
+    
+    def get_download_url(self, obj):
+        if not obj.is_downloadable:
+            return None
+        path = reverse('api_export_download', args=[obj.pk])
+        request = self.context.get('request')
+        return request.build_absolute_uri(path) if request else path
+
+class BulkURLFilterSerializer(serializers.Serializer):
+    """Selects the user's URLs a bulk update applies to, like the list endpoint's filters"""
+    is_active = serializers.BooleanField(required=False)
+    is_public = serializers.BooleanField(required=False)
+    search = serializers.CharField(required=False)
+
+class BulkURLChangesSerializer(serializers.Serializer):
+    is_active = serializers.BooleanField(required=False)
+    is_public = serializers.BooleanField(required=False)
+    expires_at = serializers.DateTimeField(required=False, allow_null=True)
+    
+    def validate(self, data):
+        if not data:
+            raise serializers.ValidationError("Provide at least one of is_active, is_public or expires_at.")
+        return data
+
+class BulkURLUpdateSerializer(serializers.Serializer):
+    """Serializer for bulk URL updates"""
+    url_ids = serializers.ListField(child=serializers.IntegerField(), required=False, min_length=1)
+    filter = BulkURLFilterSerializer(required=False)
+    changes = BulkURLChangesSerializer()
+    
+    def validate(self, data):
+        if 'url_ids' not in data and 'filter' not in data:
+            raise serializers.ValidationError("Provide url_ids or a filter (use {} to update every URL).")
+        return data
+
+class BulkCreatedURLSerializer(serializers.ModelSerializer):
+    """Compact representation of URLs returned by bulk creation"""
+    short_url = serializers.ReadOnlyField()
+    
+    class Meta:
+        model = ShortenedURL
+        fields = ['id', 'original_url', 'short_code', 'short_url', 'is_public', 'expires_at', 'created_at']
+
 class URLStatsSerializer(serializers.Serializer):
     """Serializer for user URL statistics"""
     total_urls = serializers.IntegerField()
@@ -9,13 +9,25 @@ urlpatterns = [
     path('urls/', views.ShortenedURLListCreateView.as_view(), name='api_url_list_create'),
     path('urls/<int:pk>/', views.ShortenedURLDetailView.as_view(), name='api_url_detail'),
     path('urls/<int:pk>/analytics/', views.url_analytics_view, name='api_url_analytics'),
+    path('urls/<int:pk>/timeseries/', views.url_timeseries_view, name='api_url_timeseries'),
     path('urls/<int:pk>/clicks/', views.url_clicks_view, name='api_url_clicks'),
     path('urls/<int:pk>/qr/', views.url_qr_code_view, name='api_url_qr'),
+    path('urls/<int:pk>/qr/image/', views.url_qr_image_view, name='api_url_qr_image'),
+    path('urls/qr-codes/', views.qr_codes_zip_view, name='api_qr_codes_zip'),
     path('urls/<int:pk>/toggle/', views.toggle_url_status_view, name='api_url_toggle'),
     
     # Bulk operations
     path('urls/bulk-create/', views.bulk_create_urls_view, name='api_bulk_create_urls'),
     path('urls/bulk-delete/', views.bulk_delete_urls_view, name='api_bulk_delete_urls'),
+    path('urls/bulk-update/', views.bulk_update_urls_view, name='api_bulk_update_urls'),
+    path('urls/import/', views.import_urls_view, name='api_import_urls'),
+    path('imports/<int:pk>/', views.import_job_view, name='api_import_job'),
+    path('purges/<int:pk>/', views.purge_job_view, name='api_purge_job'),
+    
+    # Exports
+    path('exports/', views.create_export_view, name='api_create_export'),
+    path('exports/<int:pk>/', views.export_job_view, name='api_export_job'),
+    path('exports/<int:pk>/download/', views.export_download_view, name='api_export_download'),
     
     # User data
     path('user/stats/', views.user_stats_view, name='api_user_stats'),
@@ -1,21 +1,33 @@
 from rest_framework import generics, status, permissions
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, permission_classes, parser_classes
+from rest_framework.parsers import MultiPartParser, FormParser
 from rest_framework.response import Response
 from rest_framework.authtoken.models import Token
 from rest_framework.authtoken.views import ObtainAuthToken
 from rest_framework.pagination import PageNumberPagination
 from django.contrib.auth import authenticate
-from django.db.models import Count, Q, Sum
+from django.db.models import Q, Sum
 from django.utils import timezone
 from datetime import timedelta
 from django_ratelimit.decorators import ratelimit
 from django.utils.decorators import method_decorator
-from shortener.models import ShortenedURL, Click, QRCode
+from shortener.models import ShortenedURL, Click, ImportJob, PurgeJob, ExportJob
 from shortener.utils import generate_qr_code, get_client_info, get_location_info
+from shortener.bulk import bulk_create_urls, bulk_update_urls
+from shortener.imports import guess_format
+from shortener.jobs import enqueue_job
+from shortener.lifecycle import soft_delete_urls
+from shortener.rollups import rollups_for, day_start, sum_clicks, top_values
+from analytics.timeseries import clamp_days, click_series, get_timezone
+from analytics.exports import start_export, export_download_response
+from shortener.qr import build_spec, spec_from_params, qr_response, qr_zip_response
 from .serializers import (
     ShortenedURLSerializer, ShortenedURLCreateSerializer, ClickSerializer,
     URLAnalyticsSerializer, QRCodeSerializer, BulkURLCreateSerializer,
-    URLStatsSerializer, UserSerializer
+    URLStatsSerializer, UserSerializer, BulkCreatedURLSerializer,
+    URLImportSerializer, ImportJobSerializer, PurgeJobSerializer,
+    ExportRequestSerializer, ExportJobSerializer,
+    BulkURLUpdateSerializer
 )
 from django.contrib.auth import get_user_model
 
@@ -93,10 +105,8 @@ class ShortenedURLListCreateView(generics.ListCreateAPIView):
                     status=status.HTTP_429_TOO_MANY_REQUESTS
                 )
         
-        url = serializer.save(user=self.request.user)
-        
-        # Generate QR code
-        generate_qr_code(url)
+        # QR codes are rendered when first requested
+        serializer.save(user=self.request.user)
 
 class ShortenedURLDetailView(generics.RetrieveUpdateDestroyAPIView):
     """Retrieve, update, or delete a shortened URL"""
@@ -105,6 +115,10 @@ class ShortenedURLDetailView(generics.RetrieveUpdateDestroyAPIView):
     
     def get_queryset(self):
         return ShortenedURL.objects.filter(user=self.request.user)
+    
+    def perform_destroy(self, instance):
+        # Clicks and QR files are removed by a background purge job
+        soft_delete_urls(ShortenedURL.objects.filter(pk=instance.pk), user=self.request.user)
 
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
@@ -116,66 +130,71 @@ def url_analytics_view(request, pk):
         return Response({'error': 'URL not found'}, status=status.HTTP_404_NOT_FOUND)
     
     # Time range filter
-    days = int(request.GET.get('days', 30))
+    days = clamp_days(request.GET.get('days'), 30)
     start_date = timezone.now() - timedelta(days=days)
     
-    clicks = Click.objects.filter(url=url, clicked_at__gte=start_date)
+    # Read from the click rollups, so cost doesn't grow with click history
+    rollups = rollups_for(start_date, url=url)
     
     # Basic statistics
-    total_clicks = clicks.count()
-    unique_visitors = clicks.values('ip_address').distinct().count()
+    total_clicks = sum_clicks(rollups)[0]
     
     # Time-based statistics
-    today = timezone.now().date()
-    clicks_today = clicks.filter(clicked_at__date=today).count()
-    clicks_this_week = clicks.filter(clicked_at__gte=today - timedelta(days=7)).count()
-    clicks_this_month = clicks.filter(clicked_at__gte=today - timedelta(days=30)).count()
+    today = timezone.localdate()
+    clicks_today = sum_clicks(rollups_for(day_start(today), url=url))[0]
+    clicks_this_week = sum_clicks(rollups_for(day_start(today - timedelta(days=7)), url=url))[0]
+    clicks_this_month = sum_clicks(rollups_for(day_start(today - timedelta(days=30)), url=url))[0]
     
     # Geographic statistics
-    top_countries = list(clicks.exclude(
-        country__in=['', 'Unknown']
-    ).values('country').annotate(
-        count=Count('country')
-    ).order_by('-count')[:10])
+    top_countries = top_values(rollups, 'country', exclude=['', 'Unknown'])
     
     # Technology statistics
-    top_browsers = list(clicks.exclude(
-        browser__in=['', 'Unknown']
-    ).values('browser').annotate(
-        count=Count('browser')
-    ).order_by('-count')[:10])
-    
-    top_devices = list(clicks.exclude(
-        device__in=['', 'Unknown']
-    ).values('device').annotate(
-        count=Count('device')
-    ).order_by('-count')[:10])
-    
-    # Daily clicks for the period
-    daily_clicks = []
-    for i in range(days):
-        date = (timezone.now() - timedelta(days=i)).date()
-        count = clicks.filter(clicked_at__date=date).count()
-        daily_clicks.append({
-            'date': date.strftime('%Y-%m-%d'),
-            'clicks': count
-        })
+    top_browsers = top_values(rollups, 'browser', exclude=['', 'Unknown'])
+    top_devices = top_values(rollups, 'device', exclude=['', 'Unknown'])
+    
+    # Daily clicks for the period, gap-filled in one query
+    series = click_series('day', days, url=url)
+    daily_clicks = [
+        {'date': day.strftime('%Y-%m-%d'), 'clicks': count}
+        for day, count in zip(series.buckets, series.values)
+    ]
     
     analytics_data = {
         'total_clicks': total_clicks,
-        'unique_clicks': url.unique_clicks,
+        'unique_clicks': url.get_click_totals()['unique_clicks'],
         'clicks_today': clicks_today,
         'clicks_this_week': clicks_this_week,
         'clicks_this_month': clicks_this_month,
         'top_countries': top_countries,
         'top_browsers': top_browsers,
         'top_devices': top_devices,
-        'daily_clicks': daily_clicks[::-1]  # Reverse to show oldest first
+        'daily_clicks': daily_clicks
     }
     
     serializer = URLAnalyticsSerializer(analytics_data)
     return Response(serializer.data)
 
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def url_timeseries_view(request, pk):
+    """Get a gap-filled click series for a specific URL"""
+    try:
+        url = ShortenedURL.objects.get(pk=pk, user=request.user)
+    except ShortenedURL.DoesNotExist:
+        return Response({'error': 'URL not found'}, status=status.HTTP_404_NOT_FOUND)
+    
+    try:
+        series = click_series(
+            request.query_params.get('granularity', 'day'),
+            int(request.query_params.get('periods', 30)),
+            tz=get_timezone(request.query_params.get('tz')),
+            url=url,
+        )
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    return Response(series.as_dict())
+
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
 def url_clicks_view(request, pk):
@@ -207,18 +226,46 @@ def url_qr_code_view(request, pk):
     except ShortenedURL.DoesNotExist:
         return Response({'error': 'URL not found'}, status=status.HTTP_404_NOT_FOUND)
     
-    try:
-        qr_code = url.qr_code
-    except QRCode.DoesNotExist:
-        # Generate QR code if it doesn't exist
-        qr_code = generate_qr_code(url)
+    # Renders the image only when it isn't already cached
+    qr_code = generate_qr_code(url)
     
     serializer = QRCodeSerializer(qr_code)
     return Response(serializer.data)
 
-@method_decorator(ratelimit(key='user', rate='10/h', method='POST'), name='post')
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def url_qr_image_view(request, pk):
+    """Get the QR code image for a specific URL"""
+    try:
+        url = ShortenedURL.objects.get(pk=pk, user=request.user)
+    except ShortenedURL.DoesNotExist:
+        return Response({'error': 'URL not found'}, status=status.HTTP_404_NOT_FOUND)
+    
+    # `format` selects DRF's renderer, so the image format has its own parameter
+    params = {**request.query_params.dict(), 'format': request.query_params.get('image_format')}
+    try:
+        spec = spec_from_params(url, params)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    return qr_response(request, spec, f'{url.short_code}_qr')
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def qr_codes_zip_view(request):
+    """Download the QR codes of all of the user's URLs as one ZIP file"""
+    options = {'format': request.query_params.get('image_format'), 'size': request.query_params.get('size')}
+    try:
+        build_spec(ShortenedURL(short_code='x'), **options)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    urls = ShortenedURL.objects.filter(user=request.user).only('short_code').order_by('pk').iterator()
+    return qr_zip_response(urls, 'qr_codes', **options)
+
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated])
+@ratelimit(key='user', rate='10/h', method='POST')
 def bulk_create_urls_view(request):
     """Create multiple URLs at once"""
     serializer = BulkURLCreateSerializer(data=request.data)
@@ -244,20 +291,107 @@ def bulk_create_urls_view(request):
                 status=status.HTTP_429_TOO_MANY_REQUESTS
             )
     
-    created_urls = []
-    for original_url in urls_data:
-        url = ShortenedURL.objects.create(
-            user=request.user,
-            original_url=original_url,
-            is_public=is_public,
-            expires_at=expires_at
-        )
-        generate_qr_code(url)
-        created_urls.append(url)
+    # QR codes are generated on first request rather than per created URL
+    created_urls = bulk_create_urls(
+        request.user,
+        urls_data,
+        is_public=is_public,
+        expires_at=expires_at
+    )
     
-    serializer = ShortenedURLSerializer(created_urls, many=True)
+    serializer = BulkCreatedURLSerializer(created_urls, many=True)
     return Response(serializer.data, status=status.HTTP_201_CREATED)
 
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+@parser_classes([MultiPartParser, FormParser])
+@ratelimit(key='user', rate='10/h', method='POST')
+def import_urls_view(request):
+    """Start a background import of URLs from an uploaded CSV or NDJSON file"""
+    serializer = URLImportSerializer(data=request.data)
+    
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    
+    upload = serializer.validated_data['file']
+    job = ImportJob.objects.create(
+        user=request.user,
+        file=upload,
+        format=serializer.validated_data.get('format') or guess_format(upload.name, upload.content_type),
+        is_public=serializer.validated_data['is_public'],
+        total=upload.size
+    )
+    enqueue_job(job)
+    
+    return Response(ImportJobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def import_job_view(request, pk):
+    """Get progress and the error report of an import job"""
+    try:
+        job = ImportJob.objects.get(pk=pk, user=request.user)
+    except ImportJob.DoesNotExist:
+        return Response({'error': 'Import not found'}, status=status.HTTP_404_NOT_FOUND)
+    
+    serializer = ImportJobSerializer(job)
+    return Response(serializer.data)
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+@ratelimit(key='user', rate='30/h', method='POST')
+def create_export_view(request):
+    """Start a background analytics export, or join the identical one already running"""
+    serializer = ExportRequestSerializer(data=request.data)
+    
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    
+    url = None
+    if serializer.validated_data.get('url') is not None:
+        try:
+            url = ShortenedURL.objects.get(pk=serializer.validated_data['url'], user=request.user)
+        except ShortenedURL.DoesNotExist:
+            return Response({'error': 'URL not found'}, status=status.HTTP_404_NOT_FOUND)
+    
+    job, _ = start_export(
+        request.user,
+        serializer.validated_data['format'],
+        url=url,
+        compress=serializer.validated_data['compress']
+    )
+    
+    serializer = ExportJobSerializer(job, context={'request': request})
+    return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def export_job_view(request, pk):
+    """Get progress of an export job, and its download link once finished"""
+    try:
+        job = ExportJob.objects.get(pk=pk, user=request.user)
+    except ExportJob.DoesNotExist:
+        return Response({'error': 'Export not found'}, status=status.HTTP_404_NOT_FOUND)
+    
+    serializer = ExportJobSerializer(job, context={'request': request})
+    return Response(serializer.data)
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def export_download_view(request, pk):
+    """Download the file of a finished export"""
+    try:
+        job = ExportJob.objects.get(pk=pk, user=request.user)
+    except ExportJob.DoesNotExist:
+        return Response({'error': 'Export not found'}, status=status.HTTP_404_NOT_FOUND)
+    
+    if job.is_finished and not job.is_downloadable:
+        return Response({'error': 'Export has expired or failed'}, status=status.HTTP_410_GONE)
+    if not job.is_downloadable:
+        return Response({'error': 'Export is not finished yet'}, status=status.HTTP_409_CONFLICT)
+    
+    return export_download_response(job)
+
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
 def user_stats_view(request):
@@ -267,8 +401,7 @@ def user_stats_view(request):
     # Basic counts
     total_urls = ShortenedURL.objects.filter(user=user).count()
     active_urls = ShortenedURL.objects.filter(user=user, is_active=True).count()
-    total_clicks = Click.objects.filter(url__user=user).count()
-    unique_visitors = Click.objects.filter(url__user=user).values('ip_address').distinct().count()
+    total_clicks, unique_visitors = sum_clicks(rollups_for(user=user))
     
     # Calculate average clicks per URL
     avg_clicks_per_url = total_clicks / total_urls if total_urls > 0 else 0
@@ -304,16 +437,63 @@ def bulk_delete_urls_view(request):
     if not url_ids:
         return Response({'error': 'No URL IDs provided'}, status=status.HTTP_400_BAD_REQUEST)
     
-    deleted_count = ShortenedURL.objects.filter(
-        id__in=url_ids,
+    # Links disappear immediately; their clicks and QR files are purged in the background
+    deleted_count, purge_job = soft_delete_urls(
+        ShortenedURL.objects.filter(id__in=url_ids, user=request.user),
         user=request.user
-    ).delete()[0]
+    )
     
     return Response({
         'message': f'Successfully deleted {deleted_count} URLs',
-        'deleted_count': deleted_count
+        'deleted_count': deleted_count,
+        'purge_job': PurgeJobSerializer(purge_job).data if purge_job else None
+    })
+
+@api_view(['PATCH'])
+@permission_classes([permissions.IsAuthenticated])
+def bulk_update_urls_view(request):
+    """Apply the same changes to many URLs at once"""
+    serializer = BulkURLUpdateSerializer(data=request.data)
+    
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    
+    queryset = ShortenedURL.objects.filter(user=request.user)
+    
+    url_ids = serializer.validated_data.get('url_ids')
+    if url_ids is not None:
+        queryset = queryset.filter(id__in=url_ids)
+    
+    filters = serializer.validated_data.get('filter', {})
+    if 'is_active' in filters:
+        queryset = queryset.filter(is_active=filters['is_active'])
+    if 'is_public' in filters:
+        queryset = queryset.filter(is_public=filters['is_public'])
+    if filters.get('search'):
+        queryset = queryset.filter(
+            Q(original_url__icontains=filters['search']) |
+            Q(short_code__icontains=filters['search'])
+        )
+    
+    updated_count = bulk_update_urls(queryset, **serializer.validated_data['changes'])
+    
+    return Response({
+        'message': f'Successfully updated {updated_count} URLs',
+        'updated_count': updated_count
     })
 
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def purge_job_view(request, pk):
+    """Get progress of the background purge of deleted URLs"""
+    try:
+        job = PurgeJob.objects.get(pk=pk, user=request.user)
+    except PurgeJob.DoesNotExist:
+        return Response({'error': 'Purge job not found'}, status=status.HTTP_404_NOT_FOUND)
+    
+    serializer = PurgeJobSerializer(job)
+    return Response(serializer.data)
+
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated])
 def toggle_url_status_view(request, pk):
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import ShortenedURL, Click, QRCode
+from .models import ShortenedURL, Click, QRCode, ImportJob, PurgeJob, ExportJob
 
 @admin.register(ShortenedURL)
 class ShortenedURLAdmin(admin.ModelAdmin):
@@ -21,3 +21,26 @@ class ClickAdmin(admin.ModelAdmin):
 class QRCodeAdmin(admin.ModelAdmin):
     list_display = ('url', 'created_at')
     readonly_fields = ('created_at',)
+
+@admin.register(ImportJob)
+class ImportJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'format', 'status', 'rows_created', 'rows_failed', 'created_at')
+    list_filter = ('status', 'format', 'created_at')
+    search_fields = ('user__email',)
+    readonly_fields = ('processed', 'total', 'rows_processed', 'rows_created', 'rows_failed', 'errors', 'created_at', 'started_at', 'finished_at')
+    ordering = ('-created_at',)
+
+@admin.register(PurgeJob)
+class PurgeJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'status', 'urls_purged', 'clicks_deleted', 'created_at')
+    list_filter = ('status', 'created_at')
+    readonly_fields = ('url_ids', 'processed', 'total', 'urls_purged', 'clicks_deleted', 'created_at', 'started_at', 'finished_at')
+    ordering = ('-created_at',)
+
+@admin.register(ExportJob)
+class ExportJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'kind', 'format', 'status', 'processed', 'size', 'expires_at', 'created_at')
+    list_filter = ('status', 'kind', 'format', 'created_at')
+    search_fields = ('user__email', 'key')
+    readonly_fields = ('key', 'file', 'filename', 'size', 'processed', 'total', 'expires_at', 'created_at', 'started_at', 'finished_at')
+    ordering = ('-created_at',)
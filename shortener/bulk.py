@@ -0,0 +1,82 @@
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from .cache import invalidate_short_codes
+from .codegen import allocate_short_codes
+from .codeset import short_code_filter, publish_new_codes
+from .models import ShortenedURL
+
+def _taken_codes(codes, batch_size):
+    taken = set()
+    for start in range(0, len(codes), batch_size):
+        taken.update(ShortenedURL.all_objects.filter(
+            short_code__in=codes[start:start + batch_size]
+        ).values_list('short_code', flat=True))
+    return taken
+
+def allocate_free_codes(count, batch_size=1000, exclude=()):
+    """Allocate `count` codes, replacing any that collide with existing aliases in one query per batch"""
+    codes = allocate_short_codes(count)
+    taken = _taken_codes(codes, batch_size) | (set(codes) & set(exclude))
+    while taken:
+        replacements = allocate_short_codes(len(taken))
+        codes = [code for code in codes if code not in taken] + replacements
+        taken = _taken_codes(replacements, batch_size) | (set(replacements) & set(exclude))
+    return codes
+
+def announce_new_urls(urls):
+    """Tell the short-code filters about rows inserted without post_save"""
+    for url in urls:
+        short_code_filter.add(url.short_code)
+    max_id = max((url.pk for url in urls if url.pk), default=None)
+    if max_id is not None:
+        publish_new_codes(max_id)
+
+def insert_urls(urls, batch_size=None):
+    """
+    Insert unsaved links with bulk_create in a single transaction. Links
+    without a short code get one from the block allocator; links with one
+    (custom aliases) keep it and must already be known to be free.
+    """
+    batch_size = batch_size or getattr(settings, 'BULK_CREATE_BATCH_SIZE', 500)
+    needs_code = [url for url in urls if not url.short_code]
+    if needs_code:
+        aliases = [url.short_code for url in urls if url.short_code]
+        codes = allocate_free_codes(len(needs_code), batch_size, exclude=aliases)
+        for url, short_code in zip(needs_code, codes):
+            url.short_code = short_code
+
+    created = []
+    with transaction.atomic():
+        for start in range(0, len(urls), batch_size):
+            created.extend(ShortenedURL.objects.bulk_create(urls[start:start + batch_size]))
+
+    announce_new_urls(created)
+    return created
+
+def bulk_create_urls(user, original_urls, batch_size=None, **fields):
+    """
+    Create a link for each URL in a single transaction. Codes are allocated up
+    front and rows are inserted with bulk_create, so no per-link queries run.
+    QR codes are not generated here; they are created when first requested.
+    """
+    return insert_urls(
+        [ShortenedURL(user=user, original_url=original_url, **fields) for original_url in original_urls],
+        batch_size,
+    )
+
+def bulk_update_urls(queryset, **changes):
+    """
+    Apply the same field changes to every link in a queryset with a single
+    UPDATE, then evict their cached redirect records in one round trip.
+    Returns the number of links updated.
+    """
+    with transaction.atomic():
+        # Lock the rows so the evicted codes are exactly the updated ones
+        short_codes = list(queryset.select_for_update().values_list('short_code', flat=True))
+        if not short_codes:
+            return 0
+        updated = queryset.update(updated_at=timezone.now(), **changes)
+        # QuerySet.update() skips post_save; evict only once the change is visible
+        transaction.on_commit(lambda: invalidate_short_codes(short_codes))
+    return updated
@@ -0,0 +1,159 @@
+from collections import OrderedDict, namedtuple
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+import threading
+import time
+
+class LRUCache:
+    """Small thread-safe LRU with optional per-entry expiry"""
+
+    def __init__(self, max_size=1024, ttl=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                value, expires = entry
+                if expires is None or expires > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        expires = time.monotonic() + ttl if ttl is not None else None
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    @property
+    def hit_ratio(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+_RESOLVED_COLUMNS = (
+    'id', 'original_url', 'is_active', 'expires_at',
+    'redirect_type', 'cache_max_age', 'cache_public', 'analytics_sample_every',
+)
+
+class ResolvedURL(namedtuple('ResolvedURL', _RESOLVED_COLUMNS + ('is_expired',))):
+    """
+    Compact record of everything a redirect needs to know about a short code.
+    is_expired is worked out once when the row is loaded; cached copies never
+    outlive the link's remaining lifetime, so it can't go stale.
+    """
+    __slots__ = ()
+
+    @classmethod
+    def from_row(cls, row):
+        resolved = cls(*row, is_expired=False)
+        if resolved.expires_at and resolved.expires_at <= timezone.now():
+            resolved = resolved._replace(is_expired=True)
+        return resolved
+
+    def remaining_lifetime(self):
+        """Seconds until the link expires, or None when it never will (or already has)"""
+        if self.expires_at is None or self.is_expired:
+            return None
+        return max((self.expires_at - timezone.now()).total_seconds(), 0)
+
+_local_cache = LRUCache(
+    max_size=getattr(settings, 'RESOLUTION_CACHE_LOCAL_SIZE', 10000),
+    ttl=getattr(settings, 'RESOLUTION_CACHE_LOCAL_TTL', 5),
+)
+
+def _cache_key(short_code):
+    # Bump the version whenever ResolvedURL's fields change
+    return f'shortener:resolve:v4:{short_code}'
+
+def _lookup_queryset(short_code):
+    from .models import ShortenedURL
+    return ShortenedURL.objects.filter(short_code=short_code).values_list(*_RESOLVED_COLUMNS)
+
+def _capped(timeout, resolved):
+    # An unexpired record must be evicted before the link expires
+    remaining = resolved.remaining_lifetime()
+    if remaining is None:
+        return timeout
+    if timeout is None:
+        return int(remaining)
+    return min(timeout, int(remaining))
+
+def _cache_timeout(resolved):
+    return _capped(getattr(settings, 'RESOLUTION_CACHE_TIMEOUT', 3600), resolved)
+
+def _remember(short_code, resolved):
+    _local_cache.set(short_code, resolved, _capped(_local_cache.ttl, resolved))
+    return resolved
+
+def resolve_short_code(short_code):
+    """Resolve a short code, checking the process LRU and shared cache before the database"""
+    resolved = _local_cache.get(short_code)
+    if resolved is not None:
+        return resolved
+
+    data = cache.get(_cache_key(short_code))
+    if data is not None:
+        return _remember(short_code, ResolvedURL(*data))
+
+    row = _lookup_queryset(short_code).first()
+    if row is None:
+        return None
+
+    resolved = ResolvedURL.from_row(row)
+    cache.set(_cache_key(short_code), tuple(resolved), _cache_timeout(resolved))
+    return _remember(short_code, resolved)
+
+async def aresolve_short_code(short_code):
+    """Async variant of resolve_short_code using the async cache and ORM APIs"""
+    resolved = _local_cache.get(short_code)
+    if resolved is not None:
+        return resolved
+
+    data = await cache.aget(_cache_key(short_code))
+    if data is not None:
+        return _remember(short_code, ResolvedURL(*data))
+
+    row = await _lookup_queryset(short_code).afirst()
+    if row is None:
+        return None
+
+    resolved = ResolvedURL.from_row(row)
+    await cache.aset(_cache_key(short_code), tuple(resolved), _cache_timeout(resolved))
+    return _remember(short_code, resolved)
+
+def invalidate_short_code(short_code):
+    """Drop a short code from both cache layers"""
+    _local_cache.delete(short_code)
+    cache.delete(_cache_key(short_code))
+
+def invalidate_short_codes(short_codes):
+    """Drop many short codes from both cache layers in one shared-cache round trip"""
+    for short_code in short_codes:
+        _local_cache.delete(short_code)
+    cache.delete_many([_cache_key(short_code) for short_code in short_codes])
@@ -0,0 +1,200 @@
+from django.conf import settings
+from django.db import connections, transaction
+import hashlib
+import os
+import string
+import threading
+
+ALPHABET = string.ascii_letters + string.digits
+BASE = len(ALPHABET)
+
+SEQUENCE_NAME = 'short_code'
+
+def encode_base62(value, length):
+    """Encode a non-negative integer as a fixed-width base62 string"""
+    chars = []
+    while value:
+        value, remainder = divmod(value, BASE)
+        chars.append(ALPHABET[remainder])
+    return ''.join(reversed(chars)).rjust(length, ALPHABET[0])
+
+def decode_base62(code):
+    value = 0
+    for char in code:
+        value = value * BASE + ALPHABET.index(char)
+    return value
+
+class CodePermutation:
+    """
+    Keyed bijection on [0, 62**length) so sequential ids don't produce
+    guessable codes: a 4-round Feistel network over the smallest even bit
+    width covering the range, cycle-walked until the result falls inside it.
+    """
+
+    ROUNDS = 4
+
+    def __init__(self, secret, length):
+        self.key = hashlib.sha256(secret.encode()).digest()
+        self.domain = BASE ** length
+        bits = (self.domain - 1).bit_length()
+        self.half_bits = (bits + 1) // 2
+        self.mask = (1 << self.half_bits) - 1
+
+    def _round(self, value, round_number):
+        digest = hashlib.blake2b(
+            value.to_bytes(8, 'little') + bytes([round_number]),
+            key=self.key, digest_size=8,
+        ).digest()
+        return int.from_bytes(digest, 'little') & self.mask
+
+    def _feistel(self, value):
+        left, right = value >> self.half_bits, value & self.mask
+        for round_number in range(self.ROUNDS):
+            left, right = right, left ^ self._round(right, round_number)
+        return (left << self.half_bits) | right
+
+    def __call__(self, value):
+        value = self._feistel(value)
+        while value >= self.domain:
+            value = self._feistel(value)
+        return value
+
+def _sequence_connection():
+    from .models import ShortCodeSequence
+    return connections[ShortCodeSequence.objects.db]
+
+def reserves_durably():
+    """
+    Whether a reservation made now commits whatever the caller's transaction
+    does. SQLite has a single writer, so inside a transaction the reservation
+    has to share it (and is undone with it).
+    """
+    connection = _sequence_connection()
+    return not connection.in_atomic_block or connection.vendor != 'sqlite'
+
+def _reserve_on_own_connection(size):
+    """Bump the sequence on a separate autocommit connection, out of reach of the caller's rollback"""
+    from .models import ShortCodeSequence
+    connection = connections.create_connection(ShortCodeSequence.objects.db)
+    quote = connection.ops.quote_name
+    table = quote(ShortCodeSequence._meta.db_table)
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {table} ({quote("name")}, {quote("next_value")}) VALUES (%s, 0) '
+                f'ON CONFLICT ({quote("name")}) DO NOTHING',
+                [SEQUENCE_NAME],
+            )
+            cursor.execute(
+                f'UPDATE {table} SET {quote("next_value")} = {quote("next_value")} + %s '
+                f'WHERE {quote("name")} = %s RETURNING {quote("next_value")}',
+                [size, SEQUENCE_NAME],
+            )
+            end = cursor.fetchone()[0]
+    finally:
+        connection.close()
+    return end - size, end
+
+def reserve_block(size):
+    """Reserve `size` consecutive ids from the shared sequence, returning (start, end)"""
+    from .models import ShortCodeSequence
+    if _sequence_connection().in_atomic_block and reserves_durably():
+        # A savepoint of the caller's transaction would be rolled back with
+        # it, and another process could then reserve the same ids
+        return _reserve_on_own_connection(size)
+    with transaction.atomic():
+        sequence, _ = ShortCodeSequence.objects.select_for_update().get_or_create(name=SEQUENCE_NAME)
+        start = sequence.next_value
+        sequence.next_value = start + size
+        sequence.save(update_fields=['next_value'])
+    return start, start + size
+
+class ShortCodeAllocator:
+    """Hands out short codes from blocks of ids reserved in a single query each"""
+
+    def __init__(self, block_size=1000, length=6, permute=True, secret=''):
+        self.block_size = block_size
+        self.length = length
+        self.permute = permute
+        self.secret = secret
+        self.blocks_reserved = 0
+        self._permutations = {}
+        self._reserved = None
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._next = self._end = 0
+        self._pid = os.getpid()
+
+    def _encode(self, value):
+        # Ids past 62**length spill into longer codes rather than wrapping
+        length = self.length
+        while value >= BASE ** length:
+            value -= BASE ** length
+            length += 1
+        if self.permute:
+            permutation = self._permutations.get(length)
+            if permutation is None:
+                permutation = self._permutations[length] = CodePermutation(self.secret, length)
+            value = permutation(value)
+        return encode_base62(value, length)
+
+    def _is_reserved(self, code):
+        if self._reserved is None:
+            from .middleware import get_reserved_prefixes
+            self._reserved = get_reserved_prefixes()
+        return code in self._reserved
+
+    def _take_ids(self, count):
+        with self._lock:
+            if self._pid != os.getpid():
+                # Forked worker: never hand out the parent's remaining ids
+                self._reset()
+            ids = []
+            while len(ids) < count:
+                if self._next >= self._end:
+                    needed = count - len(ids)
+                    # Ids left over from a reservation that may still be rolled
+                    # back can't be kept for later calls
+                    size = max(self.block_size, needed) if reserves_durably() else needed
+                    self._next, self._end = reserve_block(size)
+                    self.blocks_reserved += 1
+                take = min(count - len(ids), self._end - self._next)
+                ids.extend(range(self._next, self._next + take))
+                self._next += take
+            return ids
+
+    def allocate(self, count=1):
+        """Return `count` distinct short codes"""
+        codes = []
+        while len(codes) < count:
+            for value in self._take_ids(count - len(codes)):
+                code = self._encode(value)
+                if not self._is_reserved(code):
+                    codes.append(code)
+        return codes
+
+    def allocate_one(self):
+        return self.allocate(1)[0]
+
+_allocator = None
+_allocator_lock = threading.Lock()
+
+def get_allocator():
+    """Return the process-wide short code allocator"""
+    global _allocator
+    if _allocator is None:
+        with _allocator_lock:
+            if _allocator is None:
+                _allocator = ShortCodeAllocator(
+                    block_size=getattr(settings, 'SHORT_CODE_BLOCK_SIZE', 1000),
+                    length=getattr(settings, 'SHORT_URL_LENGTH', 6),
+                    permute=getattr(settings, 'SHORT_CODE_PERMUTE', True),
+                    secret=getattr(settings, 'SHORT_CODE_SECRET', '') or settings.SECRET_KEY,
+                )
+    return _allocator
+
+def allocate_short_codes(count):
+    """Allocate `count` new short codes without querying per code"""
+    return get_allocator().allocate(count)
@@ -0,0 +1,240 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections
+from django.template.loader import render_to_string
+from django.http import HttpResponseNotFound
+from asgiref.sync import sync_to_async
+import hashlib
+import logging
+import math
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+MAX_ID_KEY = 'shortener:codes:max_id'
+GENERATION_KEY = 'shortener:codes:generation'
+
+# Rows committed out of id order can land below the highest id already seen
+# (a bulk insert holds up to BULK_CREATE_MAX_URLS ids until it commits). Ids
+# this far below it that weren't visible yet are kept as gaps and rechecked by
+# later syncs; older ones are taken to be rolled back or deleted.
+SYNC_OVERLAP = 10000
+
+# Gap ids looked up per query
+GAP_BATCH_SIZE = 500
+
+# Codes inserted without the max-id hint (e.g. raw bulk inserts) are picked up
+# by an incremental sync at least this often, in seconds
+SYNC_FALLBACK_INTERVAL = 30
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings"""
+
+    def __init__(self, capacity, error_rate=0.001):
+        capacity = max(int(capacity), 1000)
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.capacity = capacity
+        self.count = 0
+        self._bits = bytearray((self.size + 7) // 8)
+
+    @property
+    def nbytes(self):
+        return len(self._bits)
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return [(first + i * second) % self.size for i in range(self.hash_count)]
+
+    def add(self, item):
+        for position in self._positions(item):
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+class ShortCodeFilter:
+    """Per-process filter of existing short codes used to reject unknown codes without a query"""
+
+    def __init__(self):
+        self._bloom = None
+        self._removed = set()
+        self._pending = set()
+        self._max_id = 0
+        self._gaps = []
+        self._generation = None
+        self._built_at = 0.0
+        self._last_sync = 0.0
+        self._last_check = 0.0
+        self._last_attempt = None
+        self._building = False
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return getattr(settings, 'SHORT_CODE_FILTER_ENABLED', True)
+
+    @property
+    def is_ready(self):
+        return self._bloom is not None
+
+    def _contains(self, short_code):
+        bloom = self._bloom
+        if bloom is None:
+            # Not built yet: assume the code may exist
+            self.start_rebuild()
+            return True
+        return short_code not in self._removed and (short_code in bloom or short_code in self._pending)
+
+    def add(self, short_code):
+        with self._lock:
+            self._removed.discard(short_code)
+            if self._bloom is not None:
+                self._bloom.add(short_code)
+            if self._building:
+                self._pending.add(short_code)
+
+    def discard(self, short_code):
+        # Bloom filters can't forget; deleted codes are masked until the next rebuild
+        with self._lock:
+            self._removed.add(short_code)
+            self._pending.discard(short_code)
+
+    def _sync_due(self, hints):
+        max_id = hints.get(MAX_ID_KEY)
+        generation = hints.get(GENERATION_KEY)
+        rebuild_interval = getattr(settings, 'SHORT_CODE_FILTER_REBUILD_INTERVAL', 3600)
+        if generation != self._generation or time.monotonic() - self._built_at > rebuild_interval:
+            self.start_rebuild()
+        return (
+            max_id is None
+            or max_id > self._max_id
+            or time.monotonic() - self._last_sync > SYNC_FALLBACK_INTERVAL
+        )
+
+    def _check_due(self):
+        now = time.monotonic()
+        if now - self._last_check < getattr(settings, 'SHORT_CODE_FILTER_SYNC_INTERVAL', 1.0):
+            return False
+        self._last_check = now
+        return True
+
+    def might_exist(self, short_code):
+        """False only when the short code definitely does not exist"""
+        if not self.enabled or self._contains(short_code):
+            return True
+        if self._check_due() and self._sync_due(cache.get_many([MAX_ID_KEY, GENERATION_KEY])):
+            self.sync()
+            return self._contains(short_code)
+        return False
+
+    async def amight_exist(self, short_code):
+        """Async variant of might_exist"""
+        if not self.enabled or self._contains(short_code):
+            return True
+        if self._check_due() and self._sync_due(await cache.aget_many([MAX_ID_KEY, GENERATION_KEY])):
+            await sync_to_async(self.sync)()
+            return self._contains(short_code)
+        return False
+
+    def _recent_gaps(self, candidates, seen, max_id):
+        """Ids among `candidates` not seen yet and still within SYNC_OVERLAP of max_id"""
+        floor = max_id - SYNC_OVERLAP
+        return sorted(pk for pk in candidates if pk > floor and pk not in seen)
+
+    def sync(self):
+        """Add codes created since the last sync, by any process"""
+        if self._bloom is None:
+            return
+        from .models import ShortenedURL
+        rows = ShortenedURL.objects.values_list('id', 'short_code')
+        with self._lock:
+            previous_max, gaps = self._max_id, self._gaps
+            found = []
+            for start in range(0, len(gaps), GAP_BATCH_SIZE):
+                found.extend(rows.filter(id__in=gaps[start:start + GAP_BATCH_SIZE]))
+            found.extend(rows.filter(id__gt=previous_max).iterator(chunk_size=2000))
+            for pk, short_code in found:
+                self._bloom.add(short_code)
+                self._removed.discard(short_code)
+                self._max_id = max(self._max_id, pk)
+            seen = {pk for pk, _ in found}
+            skipped = range(max(previous_max, self._max_id - SYNC_OVERLAP) + 1, self._max_id + 1)
+            self._gaps = self._recent_gaps([*gaps, *skipped], seen, self._max_id)
+            self._last_sync = time.monotonic()
+
+    def rebuild(self):
+        """Build a fresh filter from every short code in the database"""
+        from .models import ShortenedURL
+        with self._lock:
+            self._building = True
+            self._last_attempt = time.monotonic()
+        try:
+            generation = cache.get(GENERATION_KEY)
+            queryset = ShortenedURL.objects.values_list('id', 'short_code')
+            # Leave headroom so codes added before the next rebuild keep the error rate
+            bloom = BloomFilter(
+                queryset.count() * 2,
+                getattr(settings, 'SHORT_CODE_FILTER_ERROR_RATE', 0.001),
+            )
+            max_id = 0
+            for pk, short_code in queryset.iterator(chunk_size=5000):
+                bloom.add(short_code)
+                max_id = max(max_id, pk)
+            recent = set(queryset.filter(id__gt=max_id - SYNC_OVERLAP).values_list('id', flat=True))
+            gaps = self._recent_gaps(range(max(max_id - SYNC_OVERLAP, 0) + 1, max_id + 1), recent, max_id)
+            with self._lock:
+                for short_code in self._pending:
+                    bloom.add(short_code)
+                self._bloom = bloom
+                self._removed = set()
+                self._pending = set()
+                self._max_id = max_id
+                self._gaps = gaps
+                self._generation = generation
+                self._built_at = self._last_sync = time.monotonic()
+        finally:
+            self._building = False
+        return bloom
+
+    def _rebuild_in_background(self):
+        try:
+            self.rebuild()
+        except Exception:
+            logger.exception('Failed to build the short code filter')
+        finally:
+            close_old_connections()
+
+    def start_rebuild(self):
+        with self._lock:
+            # Back off after a failed or very recent attempt
+            if self._building or (
+                self._last_attempt is not None and time.monotonic() - self._last_attempt < 30
+            ):
+                return
+            self._building = True
+            self._last_attempt = time.monotonic()
+        threading.Thread(target=self._rebuild_in_background, name='short-code-filter', daemon=True).start()
+
+short_code_filter = ShortCodeFilter()
+
+def publish_new_codes(max_id):
+    """Tell other processes that codes up to max_id exist"""
+    cache.set(MAX_ID_KEY, max_id, None)
+
+def invalidate_all_filters():
+    """Make every process rebuild its filter on its next negative lookup"""
+    cache.set(GENERATION_KEY, time.time_ns(), None)
+
+_not_found_body = None
+
+def not_found_response():
+    """Pre-rendered 404 page for unknown short codes"""
+    global _not_found_body
+    if _not_found_body is None:
+        _not_found_body = render_to_string('errors/404.html', {'message': 'Short URL not found'})
+    return HttpResponseNotFound(_not_found_body)
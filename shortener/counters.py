@@ -0,0 +1,65 @@
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q, Sum
+from .models import ShortenedURL, ClickCounterShard
+import random
+
+def increment_click_counters(url_id, clicks=1, unique_clicks=0):
+    """Add clicks to a randomly chosen counter shard of a URL"""
+    shard = random.randrange(getattr(settings, 'CLICK_COUNTER_SHARDS', 8))
+    shard_rows = ClickCounterShard.objects.filter(url_id=url_id, shard=shard)
+    changes = {
+        'clicks': F('clicks') + clicks,
+        'unique_clicks': F('unique_clicks') + unique_clicks,
+    }
+    if shard_rows.update(**changes):
+        return
+    try:
+        with transaction.atomic():
+            ClickCounterShard.objects.create(
+                url_id=url_id, shard=shard, clicks=clicks, unique_clicks=unique_clicks
+            )
+    except IntegrityError:
+        # Another writer created the shard first
+        shard_rows.update(**changes)
+
+def get_pending_counts(url_id):
+    """Sum of shard increments not yet folded into ShortenedURL"""
+    totals = ClickCounterShard.objects.filter(url_id=url_id).aggregate(
+        clicks=Sum('clicks'), unique_clicks=Sum('unique_clicks')
+    )
+    return totals['clicks'] or 0, totals['unique_clicks'] or 0
+
+def fold_click_counters(url_ids=None):
+    """Move shard totals into ShortenedURL.click_count/unique_clicks, returning the number of URLs folded"""
+    pending = ClickCounterShard.objects.filter(Q(clicks__gt=0) | Q(unique_clicks__gt=0))
+    if url_ids is not None:
+        pending = pending.filter(url_id__in=url_ids)
+
+    folded = 0
+    for url_id in sorted(set(pending.values_list('url_id', flat=True))):
+        with transaction.atomic():
+            rows = list(
+                ClickCounterShard.objects.select_for_update()
+                .filter(url_id=url_id)
+                .order_by('shard')
+                .values_list('id', 'clicks', 'unique_clicks')
+            )
+            clicks = sum(row[1] for row in rows)
+            unique_clicks = sum(row[2] for row in rows)
+            if not clicks and not unique_clicks:
+                continue
+            ShortenedURL.objects.filter(pk=url_id).update(
+                click_count=F('click_count') + clicks,
+                unique_clicks=F('unique_clicks') + unique_clicks,
+            )
+            # Subtract what was read rather than zeroing, which stays correct
+            # on backends where select_for_update() does not lock rows
+            for shard_id, shard_clicks, shard_unique in rows:
+                if shard_clicks or shard_unique:
+                    ClickCounterShard.objects.filter(pk=shard_id).update(
+                        clicks=F('clicks') - shard_clicks,
+                        unique_clicks=F('unique_clicks') - shard_unique,
+                    )
+        folded += 1
+    return folded
@@ -2,6 +2,7 @@ from django import forms
 from django.core.validators import URLValidator
 from django.core.exceptions import ValidationError
 from .models import ShortenedURL
+from .middleware import get_reserved_prefixes
 import re
 
 class URLShortenForm(forms.ModelForm):
@@ -82,12 +83,11 @@ class URLShortenForm(forms.ModelForm):
                 raise ValidationError("Custom alias can only contain letters, numbers, and hyphens.")
             
             # Check if already exists
-            if ShortenedURL.objects.filter(short_code=alias).exists():
+            if ShortenedURL.all_objects.filter(short_code=alias).exists():
                 raise ValidationError("This custom alias is already taken.")
             
             # Check reserved words
-            reserved_words = ['admin', 'api', 'www', 'dashboard', 'accounts', 'static', 'media']
-            if alias.lower() in reserved_words:
+            if alias.lower() in {code.lower() for code in get_reserved_prefixes()}:
                 raise ValidationError("This alias is reserved and cannot be used.")
         
         return alias
@@ -120,7 +120,52 @@ class URLEditForm(forms.ModelForm):
             'class': 'h-4 w-4 accent-teal-600 focus:ring-teal-500 border-gray-300 rounded'
         })
     )
+    
+    redirect_type = forms.TypedChoiceField(
+        choices=ShortenedURL.REDIRECT_TYPE_CHOICES,
+        coerce=int,
+        widget=forms.Select(attrs={
+            'class': 'w-full px-4 py-3 border border-gray-300 rounded-lg focus:outline-none focus:ring-2 focus:ring-teal-500 focus:border-transparent'
+        })
+    )
+    
+    cache_max_age = forms.IntegerField(
+        min_value=0,
+        widget=forms.NumberInput(attrs={
+            'class': 'w-full px-4 py-3 border border-gray-300 rounded-lg focus:outline-none focus:ring-2 focus:ring-teal-500 focus:border-transparent'
+        })
+    )
+    
+    cache_public = forms.BooleanField(
+        required=False,
+        widget=forms.CheckboxInput(attrs={
+            'class': 'h-4 w-4 accent-teal-600 focus:ring-teal-500 border-gray-300 rounded'
+        })
+    )
+    
+    analytics_sample_every = forms.IntegerField(
+        min_value=1,
+        widget=forms.NumberInput(attrs={
+            'class': 'w-full px-4 py-3 border border-gray-300 rounded-lg focus:outline-none focus:ring-2 focus:ring-teal-500 focus:border-transparent'
+        })
+    )
 
     class Meta:
         model = ShortenedURL
-        fields = ['original_url', 'expires_at', 'is_public', 'is_active']
+        fields = [
+            'original_url', 'expires_at', 'is_public', 'is_active',
+            'redirect_type', 'cache_max_age', 'cache_public', 'analytics_sample_every',
+        ]
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if (
+            cleaned_data.get('cache_max_age') and cleaned_data.get('analytics_sample_every') == 1
+            and not cleaned_data.get('cache_public')
+        ):
+            # Privately cached hits would be lost clicks, so only sampled links are cached that way
+            self.add_error(
+                'cache_max_age',
+                'Caching needs click sampling (record one in 2 or more clicks) or shared caching, or use 0.'
+            )
+        return cleaned_data
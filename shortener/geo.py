@@ -0,0 +1,116 @@
+from django.conf import settings
+from django.utils.module_loading import import_string
+from .cache import LRUCache
+import ipaddress
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+UNKNOWN = ('Unknown', 'Unknown')
+
+class BaseGeoBackend:
+    """Interface for IP geolocation backends"""
+
+    def lookup(self, ip_address):
+        """Return a (country, city) tuple for an IP address"""
+        raise NotImplementedError
+
+class NullGeoBackend(BaseGeoBackend):
+    """Backend that never resolves a location"""
+
+    def lookup(self, ip_address):
+        return UNKNOWN
+
+class MaxMindGeoBackend(BaseGeoBackend):
+    """Looks up locations in a local MaxMind (GeoLite2/GeoIP2) MMDB file"""
+
+    def __init__(self, path=None):
+        self.path = str(path or getattr(settings, 'GEOIP_DATABASE_PATH', ''))
+        self._reader = None
+        self._has_city = False
+        self._unavailable = False
+        self._lock = threading.Lock()
+
+    def _get_reader(self):
+        if self._reader is not None or self._unavailable:
+            return self._reader
+        with self._lock:
+            if self._reader is None and not self._unavailable:
+                try:
+                    import geoip2.database
+                    from maxminddb import MODE_MMAP
+                    self._reader = geoip2.database.Reader(self.path, mode=MODE_MMAP)
+                    self._has_city = 'City' in self._reader.metadata().database_type
+                except Exception as exc:
+                    logger.warning('GeoIP database %s unavailable: %s', self.path, exc)
+                    self._unavailable = True
+        return self._reader
+
+    def lookup(self, ip_address):
+        reader = self._get_reader()
+        if reader is None:
+            return UNKNOWN
+        try:
+            if self._has_city:
+                response = reader.city(ip_address)
+                return (
+                    response.country.name or 'Unknown',
+                    response.city.name or 'Unknown',
+                )
+            response = reader.country(ip_address)
+            return (response.country.name or 'Unknown', 'Unknown')
+        except Exception:
+            # AddressNotFoundError, malformed addresses and the like
+            return UNKNOWN
+
+class IPAPIGeoBackend(BaseGeoBackend):
+    """Legacy backend calling the free ip-api.com HTTP service (needs network access)"""
+
+    def lookup(self, ip_address):
+        import requests
+        try:
+            url = f'http://ip-api.com/json/{ip_address}?fields=status,country,city'
+            response = requests.get(url, timeout=2)
+            data = response.json()
+            if data.get('status') == 'success':
+                return (data.get('country', 'Unknown'), data.get('city', 'Unknown'))
+        except Exception:
+            pass
+        return UNKNOWN
+
+_backend = None
+_backend_lock = threading.Lock()
+_location_cache = LRUCache(max_size=getattr(settings, 'GEOIP_CACHE_SIZE', 50000))
+
+def get_geo_backend():
+    """Return the configured geolocation backend instance"""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                backend_path = getattr(settings, 'GEOIP_BACKEND', 'shortener.geo.MaxMindGeoBackend')
+                _backend = import_string(backend_path)()
+    return _backend
+
+def lookup_location(ip_address):
+    """Resolve an IP address to a (country, city) tuple, memoizing recent addresses"""
+    if not ip_address:
+        return UNKNOWN
+
+    location = _location_cache.get(ip_address)
+    if location is not None:
+        return location
+
+    try:
+        address = ipaddress.ip_address(ip_address.strip())
+    except ValueError:
+        return UNKNOWN
+
+    if not address.is_global:
+        location = UNKNOWN
+    else:
+        location = get_geo_backend().lookup(str(address))
+
+    _location_cache.set(ip_address, location)
+    return location
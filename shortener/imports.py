@@ -0,0 +1,238 @@
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.validators import URLValidator
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from .bulk import insert_urls
+from .jobs import JobError, update_job
+from .middleware import get_reserved_prefixes
+from .models import ShortenedURL, ImportJob
+import csv
+import io
+import json
+import re
+
+URL_COLUMNS = ('original_url', 'url')
+ALIAS_COLUMNS = ('custom_alias', 'alias', 'short_code')
+
+QUOTA_ERROR = 'Daily URL limit reached'
+
+_validate_url = URLValidator(schemes=['http', 'https'])
+
+class RowError(Exception):
+    pass
+
+def guess_format(filename, content_type=''):
+    """Pick the import format from an upload's name or content type"""
+    name = (filename or '').lower()
+    if name.endswith(('.ndjson', '.jsonl', '.json')) or 'json' in (content_type or ''):
+        return ImportJob.FORMAT_NDJSON
+    return ImportJob.FORMAT_CSV
+
+def _first(row, columns):
+    for column in columns:
+        value = row.get(column)
+        if value:
+            return str(value).strip()
+    return ''
+
+def read_rows(stream, format):
+    """Yield (line_number, row dict or RowError) from a binary stream without reading it all"""
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    try:
+        if format == ImportJob.FORMAT_CSV:
+            yield from _read_csv(text)
+        else:
+            yield from _read_ndjson(text)
+    finally:
+        # Leave the underlying stream open for progress reporting
+        text.detach()
+
+def _read_csv(text):
+    reader = csv.DictReader(text)
+    if not reader.fieldnames or not set(URL_COLUMNS) & set(reader.fieldnames):
+        raise JobError('The CSV file needs a header row with an original_url (or url) column')
+    for row in reader:
+        yield reader.line_num, row
+
+def _read_ndjson(text):
+    for line_number, line in enumerate(text, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            yield line_number, RowError('Invalid JSON')
+            continue
+        if isinstance(row, str):
+            row = {'original_url': row}
+        if not isinstance(row, dict):
+            yield line_number, RowError('Expected a JSON object or URL string')
+            continue
+        yield line_number, row
+
+def build_url(user, row, is_public, reserved):
+    """Validate one row and return an unsaved ShortenedURL"""
+    original_url = _first(row, URL_COLUMNS)
+    if not original_url:
+        raise RowError('Missing URL')
+    if len(original_url) > 2048:
+        raise RowError('URL is longer than 2048 characters')
+    try:
+        _validate_url(original_url)
+    except ValidationError:
+        raise RowError('Invalid URL')
+
+    alias = _first(row, ALIAS_COLUMNS)
+    if alias:
+        if len(alias) > ShortenedURL._meta.get_field('short_code').max_length:
+            raise RowError('Custom alias is too long')
+        if not re.match(r'^[a-zA-Z0-9-]+$', alias):
+            raise RowError('Custom alias can only contain letters, numbers, and hyphens')
+        if alias.lower() in reserved:
+            raise RowError('Custom alias is reserved')
+
+    expires_at = None
+    value = _first(row, ('expires_at',))
+    if value:
+        try:
+            expires_at = parse_datetime(value)
+        except ValueError:
+            expires_at = None
+        if expires_at is None:
+            raise RowError('Invalid expires_at date')
+        if timezone.is_naive(expires_at):
+            expires_at = timezone.make_aware(expires_at)
+
+    return ShortenedURL(
+        user=user,
+        original_url=original_url,
+        short_code=alias,
+        custom_alias=alias or None,
+        is_public=is_public,
+        expires_at=expires_at,
+    )
+
+def _insert_one_by_one(urls, errors):
+    # Only reached when a concurrent create took an alias mid-import
+    created = []
+    for line_number, url in urls:
+        try:
+            with transaction.atomic():
+                url.save()
+            created.append(url)
+        except IntegrityError:
+            errors.append((line_number, 'Custom alias is already taken'))
+    return created
+
+def import_chunk(job, chunk, reserved, remaining=None):
+    """Validate and insert one chunk of rows, returning (created count, [(line, error)])"""
+    if remaining == 0:
+        # Nothing more can be created today, so there is nothing to validate
+        return 0, [(line_number, QUOTA_ERROR) for line_number, _ in chunk]
+    errors = []
+    urls = []
+    aliases = set()
+    for line_number, row in chunk:
+        if isinstance(row, RowError):
+            errors.append((line_number, str(row)))
+            continue
+        try:
+            url = build_url(job.user, row, job.is_public, reserved)
+        except RowError as exc:
+            errors.append((line_number, str(exc)))
+            continue
+        if url.short_code:
+            if url.short_code in aliases:
+                errors.append((line_number, 'Custom alias appears more than once'))
+                continue
+            aliases.add(url.short_code)
+        urls.append((line_number, url))
+
+    # One query for every alias in the chunk
+    taken = set(ShortenedURL.all_objects.filter(short_code__in=aliases).values_list('short_code', flat=True))
+    if taken:
+        errors.extend((line_number, 'Custom alias is already taken') for line_number, url in urls if url.short_code in taken)
+        urls = [(line_number, url) for line_number, url in urls if url.short_code not in taken]
+
+    if remaining is not None and len(urls) > remaining:
+        errors.extend((line_number, QUOTA_ERROR) for line_number, _ in urls[remaining:])
+        urls = urls[:remaining]
+
+    try:
+        created = insert_urls([url for _, url in urls])
+    except IntegrityError:
+        for _, url in urls:
+            if not url.custom_alias:
+                url.short_code = ''
+        created = _insert_one_by_one(urls, errors)
+
+    errors.sort()
+    return len(created), errors
+
+def _remaining_quota(user):
+    if user.is_premium:
+        return None
+    today_count = ShortenedURL.objects.filter(user=user, created_at__date=timezone.now().date()).count()
+    return max(user.daily_url_limit - today_count, 0)
+
+def import_stream(job, stream, chunk_size=None, on_progress=None):
+    """Import links from a binary CSV/NDJSON stream in fixed-size chunks, recording progress on the job"""
+    chunk_size = chunk_size or getattr(settings, 'IMPORT_CHUNK_SIZE', 1000)
+    max_errors = getattr(settings, 'IMPORT_MAX_ERRORS', 1000)
+    # Route prefixes too, as for generated codes and the create form
+    reserved = {code.lower() for code in get_reserved_prefixes()}
+    remaining = _remaining_quota(job.user)
+    over_quota = 0
+
+    def flush(chunk):
+        nonlocal remaining, over_quota
+        created, errors = import_chunk(job, chunk, reserved, remaining)
+        if remaining is not None:
+            remaining -= created
+            over_quota += sum(message == QUOTA_ERROR for _, message in errors)
+        progress = {
+            'processed': stream.tell(),
+            'rows_processed': job.rows_processed + len(chunk),
+            'rows_created': job.rows_created + created,
+            'rows_failed': job.rows_failed + len(errors),
+        }
+        if errors and len(job.errors) < max_errors:
+            progress['errors'] = job.errors + [
+                {'line': line_number, 'error': message} for line_number, message in errors
+            ][:max_errors - len(job.errors)]
+        update_job(job, **progress)
+        if on_progress:
+            on_progress(job)
+
+    try:
+        chunk = []
+        for item in read_rows(stream, job.format):
+            chunk.append(item)
+            if len(chunk) >= chunk_size:
+                flush(chunk)
+                chunk = []
+        if chunk:
+            flush(chunk)
+    except UnicodeDecodeError:
+        raise JobError('The file is not valid UTF-8')
+    except csv.Error as exc:
+        raise JobError(f'Malformed CSV: {exc}')
+    if over_quota:
+        raise JobError(
+            f'Daily limit of {job.user.daily_url_limit} URLs reached; {over_quota} rows were not imported'
+        )
+
+def run_import_job(job):
+    """Process an uploaded import file, deleting the upload afterwards"""
+    if not job.file:
+        raise JobError('No file was uploaded')
+    try:
+        update_job(job, total=job.file.size)
+        with job.file.open('rb') as stream:
+            import_stream(job, stream)
+    finally:
+        job.file.delete(save=False)
+        update_job(job, file='')
@@ -0,0 +1,137 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.apps import apps
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Models whose pending jobs `manage.py run_jobs` picks up
+JOB_MODELS = [
+    'shortener.ImportJob',
+    'shortener.PurgeJob',
+    'shortener.ExportJob',
+]
+
+class JobError(Exception):
+    """Raised by a job to fail with a message meant for its owner"""
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+def _get_executor():
+    global _executor, _executor_pid
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            # Forked worker: the parent's threads don't exist here
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'JOBS_MAX_WORKERS', 2),
+                thread_name_prefix='background-job',
+            )
+            _executor_pid = os.getpid()
+    return _executor
+
+def claim_job(model, pk):
+    """Atomically move a pending job to running, so only one worker ever runs it"""
+    now = timezone.now()
+    return model.objects.filter(pk=pk, status=model.STATUS_PENDING).update(
+        status=model.STATUS_RUNNING, started_at=now, heartbeat_at=now
+    ) == 1
+
+def update_job(job, **fields):
+    """Save progress fields with a single UPDATE and mirror them on the instance"""
+    # Every progress report also shows the job is still alive
+    fields.setdefault('heartbeat_at', timezone.now())
+    type(job).objects.filter(pk=job.pk).update(**fields)
+    for name, value in fields.items():
+        setattr(job, name, value)
+
+def finish_job(job, error=''):
+    update_job(
+        job,
+        status=job.STATUS_FAILED if error else job.STATUS_COMPLETED,
+        error=error,
+        finished_at=timezone.now(),
+    )
+
+def run_job(model, pk):
+    """Claim and run a pending job, recording its outcome"""
+    if not claim_job(model, pk):
+        return None
+    job = model.objects.get(pk=pk)
+    try:
+        job.execute()
+    except JobError as exc:
+        finish_job(job, str(exc))
+    except Exception as exc:
+        logger.exception('%s %s failed', model.__name__, pk)
+        finish_job(job, f'Unexpected error: {exc}')
+    else:
+        finish_job(job)
+    return job
+
+def _run_in_background(model, pk):
+    try:
+        run_job(model, pk)
+    finally:
+        close_old_connections()
+
+def enqueue_job(job):
+    """Start a saved job once the current transaction commits"""
+    if not getattr(settings, 'JOBS_RUN_IN_PROCESS', True):
+        # Left for `manage.py run_jobs`
+        return
+    model, pk = type(job), job.pk
+    transaction.on_commit(lambda: _get_executor().submit(_run_in_background, model, pk))
+
+def stale_cutoff():
+    """Jobs without a heartbeat since this moment are considered abandoned"""
+    return timezone.now() - timedelta(seconds=getattr(settings, 'JOBS_STALE_AFTER', 1800))
+
+def recover_stale_jobs(model, **filters):
+    """
+    Requeue or fail pending and running jobs that have shown no sign of life
+    for JOBS_STALE_AFTER seconds, e.g. because their process was restarted.
+    Pending jobs and models with RETRY_WHEN_STALE start over; running jobs of
+    other models are failed. Returns the number of jobs recovered.
+    """
+    active = [model.STATUS_PENDING, model.STATUS_RUNNING]
+    stale = model.objects.filter(status__in=active, heartbeat_at__lt=stale_cutoff(), **filters)
+    count = 0
+    for job in list(stale.only('pk', 'status', 'heartbeat_at')):
+        # Matching the heartbeat leaves alone a job whose worker reported progress meanwhile
+        current = model.objects.filter(pk=job.pk, status=job.status, heartbeat_at=job.heartbeat_at)
+        now = timezone.now()
+        if job.status == model.STATUS_PENDING or model.RETRY_WHEN_STALE:
+            recovered = current.update(
+                status=model.STATUS_PENDING, started_at=None, processed=0, total=None, heartbeat_at=now
+            )
+            if recovered:
+                logger.warning('Requeued stale %s %s', model.__name__, job.pk)
+                enqueue_job(job)
+        else:
+            recovered = current.update(
+                status=model.STATUS_FAILED, error='The job stopped responding before it finished',
+                finished_at=now, heartbeat_at=now,
+            )
+            if recovered:
+                logger.warning('Failed stale %s %s', model.__name__, job.pk)
+        count += recovered
+    return count
+
+def run_pending_jobs():
+    """Run every pending job of every registered type in this thread, oldest first"""
+    count = 0
+    for label in JOB_MODELS:
+        model = apps.get_model(label)
+        recover_stale_jobs(model)
+        pending = model.objects.filter(status=model.STATUS_PENDING).order_by('created_at')
+        for pk in list(pending.values_list('pk', flat=True)):
+            if run_job(model, pk) is not None:
+                count += 1
+    return count
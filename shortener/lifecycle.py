@@ -0,0 +1,104 @@
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from .cache import invalidate_short_codes
+from .codeset import short_code_filter
+from .jobs import enqueue_job, update_job
+from .models import ShortenedURL, Click, ClickCounterShard, HourlyClickRollup, DailyClickRollup, QRCode, PurgeJob, ExportJob
+
+def get_due_links(now=None):
+    """Active links whose expiry date has passed, found through the expires_at index"""
+    return ShortenedURL.objects.filter(
+        is_active=True,
+        expires_at__lte=now or timezone.now(),
+    ).order_by('expires_at')
+
+def expire_links(batch_size=1000, now=None):
+    """Deactivate expired links in batches and evict them from the redirect caches"""
+    now = now or timezone.now()
+    expired = 0
+    while True:
+        rows = list(get_due_links(now).values_list('id', 'short_code')[:batch_size])
+        if not rows:
+            break
+
+        with transaction.atomic():
+            # QuerySet.update() skips post_save, so caches are invalidated below
+            expired += ShortenedURL.objects.filter(
+                pk__in=[pk for pk, _ in rows], is_active=True
+            ).update(is_active=False, updated_at=now)
+        invalidate_short_codes([short_code for _, short_code in rows])
+
+        if len(rows) < batch_size:
+            break
+    return expired
+
+def next_expiry(now=None):
+    """When the next active link is due to expire, or None"""
+    return ShortenedURL.objects.filter(
+        is_active=True,
+        expires_at__gt=now or timezone.now(),
+    ).order_by('expires_at').values_list('expires_at', flat=True).first()
+
+def soft_delete_urls(queryset, user=None):
+    """
+    Hide links from resolution and listings immediately, leaving the heavy
+    deletion of their clicks and files to a background PurgeJob. Returns
+    (deleted count, purge job or None).
+    """
+    rows = list(queryset.values_list('id', 'short_code'))
+    if not rows:
+        return 0, None
+
+    url_ids = [pk for pk, _ in rows]
+    short_codes = [short_code for _, short_code in rows]
+    with transaction.atomic():
+        deleted = ShortenedURL.objects.filter(pk__in=url_ids).update(deleted_at=timezone.now())
+        job = PurgeJob.objects.create(user=user, url_ids=url_ids)
+        enqueue_job(job)
+
+    invalidate_short_codes(short_codes)
+    for short_code in short_codes:
+        short_code_filter.discard(short_code)
+    return deleted, job
+
+def _delete_in_chunks(queryset, chunk_size):
+    """Delete matching rows chunk by chunk so no statement holds locks for long"""
+    while True:
+        ids = list(queryset.values_list('pk', flat=True)[:chunk_size])
+        if not ids:
+            return
+        # Click and ClickCounterShard have no dependents or delete signals,
+        # so this is a single DELETE rather than a collector walk
+        deleted = queryset.filter(pk__in=ids).delete()[0]
+        yield deleted
+
+def run_purge_job(job, chunk_size=None):
+    """Permanently remove a purge job's soft-deleted links, one chunk at a time"""
+    chunk_size = chunk_size or getattr(settings, 'PURGE_CHUNK_SIZE', 5000)
+    # Links restored or never soft-deleted are left alone
+    url_ids = list(ShortenedURL.all_objects.filter(
+        pk__in=job.url_ids, deleted_at__isnull=False
+    ).values_list('pk', flat=True))
+
+    clicks = Click.objects.filter(url_id__in=url_ids)
+    update_job(job, total=clicks.count() + len(url_ids))
+
+    for deleted in _delete_in_chunks(clicks.order_by(), chunk_size):
+        update_job(job, clicks_deleted=job.clicks_deleted + deleted, processed=job.processed + deleted)
+
+    for start in range(0, len(url_ids), chunk_size):
+        batch = url_ids[start:start + chunk_size]
+        for qr_code in QRCode.objects.filter(url_id__in=batch):
+            qr_code.image.delete(save=False)
+        # Export files of the links' clicks would otherwise outlive their rows
+        for export in ExportJob.objects.filter(url_id__in=batch).exclude(file=''):
+            export.file.delete(save=False)
+        with transaction.atomic():
+            QRCode.objects.filter(url_id__in=batch).delete()
+            ExportJob.objects.filter(url_id__in=batch).delete()
+            ClickCounterShard.objects.filter(url_id__in=batch).delete()
+            HourlyClickRollup.objects.filter(url_id__in=batch).delete()
+            DailyClickRollup.objects.filter(url_id__in=batch).delete()
+            purged = ShortenedURL.all_objects.filter(pk__in=batch).delete()[1].get(ShortenedURL._meta.label, 0)
+        update_job(job, urls_purged=job.urls_purged + purged, processed=job.processed + len(batch))
@@ -0,0 +1,96 @@
+from datetime import timedelta
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from analytics.exports import url_clicks_dataset, iter_csv, iter_gzip, write_xlsx
+from shortener.models import ShortenedURL, Click
+import tempfile
+import time
+import tracemalloc
+
+class Rollback(Exception):
+    pass
+
+class Command(BaseCommand):
+    help = 'Check that CSV and XLSX exports use the same peak memory however many rows they contain'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', default='10000,100000', help='Comma-separated click counts to export')
+        parser.add_argument('--user', help='Email of the user owning the temporary benchmark link')
+        parser.add_argument('--format', choices=['csv', 'xlsx'], default='csv', help='Export format to measure')
+        parser.add_argument('--gzip', action='store_true', help='Compress the CSV stream as well')
+        parser.add_argument(
+            '--max-growth', type=float, default=1.5,
+            help='Fail when the largest export peaks at more than this multiple of the smallest'
+        )
+
+    def _insert_clicks(self, url, count):
+        now = timezone.now()
+        for start in range(0, count, 5000):
+            Click.objects.bulk_create([
+                Click(
+                    url=url,
+                    ip_address=f'10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}',
+                    user_agent='benchmark',
+                    referrer='https://example.com/' if i % 3 else None,
+                    browser='Chrome', device='PC', os='Linux', country='Nepal', city='Kathmandu',
+                    clicked_at=now - timedelta(seconds=i),
+                )
+                for i in range(start, min(start + 5000, count))
+            ])
+
+    def _export(self, dataset, export_format, compress):
+        """Produce the whole export, returning its size in bytes"""
+        if export_format == 'xlsx':
+            with tempfile.TemporaryFile() as file:
+                write_xlsx(dataset, file)
+                return file.tell()
+        chunks = iter_csv(dataset.header, dataset.rows)
+        if compress:
+            chunks = iter_gzip(chunks)
+        return sum(len(chunk) for chunk in chunks)
+
+    def _measure(self, user, count, export_format, compress):
+        # The link and its clicks only exist inside a rolled-back transaction
+        try:
+            with transaction.atomic():
+                url = ShortenedURL.objects.create(user=user, original_url='https://example.com/export-benchmark')
+                self._insert_clicks(url, count)
+
+                dataset = url_clicks_dataset(url)
+                tracemalloc.start()
+                started = time.perf_counter()
+                size = self._export(dataset, export_format, compress)
+                elapsed = time.perf_counter() - started
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                raise Rollback
+        except Rollback:
+            pass
+        return size, elapsed, peak
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        user = User.objects.get(email=options['user']) if options['user'] else User.objects.order_by('pk').first()
+        if user is None:
+            raise CommandError('Create a user first')
+
+        sizes = sorted(int(value) for value in options['rows'].split(','))
+        peaks = []
+        for count in sizes:
+            size, elapsed, peak = self._measure(user, count, options['format'], options['gzip'])
+            peaks.append(peak)
+            self.stdout.write(
+                f'{count:>10} rows: {size / 1024 / 1024:8.1f} MiB in {elapsed:6.2f}s '
+                f'({count / elapsed:8.0f} rows/s, {elapsed * 1000000 / count:6.0f}s per million), '
+                f'peak {peak / 1024:8.0f} KiB'
+            )
+
+        growth = peaks[-1] / peaks[0]
+        if growth > options['max_growth']:
+            raise CommandError(
+                f'Peak memory grew {growth:.2f}x from {sizes[0]} to {sizes[-1]} rows '
+                f'(allowed {options["max_growth"]}x)'
+            )
+        self.stdout.write(self.style.SUCCESS(f'Peak memory stayed flat ({growth:.2f}x across {sizes[0]}-{sizes[-1]} rows)'))
@@ -0,0 +1,55 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.test import Client, override_settings
+from shortener.models import ShortenedURL
+from shortener.tracking import click_queue
+import time
+
+FAST_PATH = 'shortener.middleware.RedirectFastPathMiddleware'
+
+class Command(BaseCommand):
+    help = 'Measure per-request redirect overhead with and without the fast-path middleware'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument('--user', help='Email of the user owning the temporary benchmark link')
+
+    def _run(self, short_code, middleware, count):
+        with override_settings(MIDDLEWARE=middleware, ALLOWED_HOSTS=['testserver']):
+            client = Client(HTTP_USER_AGENT='benchmark')
+            # Warm up caches and load the middleware chain
+            for _ in range(50):
+                client.get(f'/{short_code}/')
+            started = time.perf_counter()
+            for _ in range(count):
+                response = client.get(f'/{short_code}/')
+            elapsed = time.perf_counter() - started
+        assert response.status_code == 302, response.status_code
+        return elapsed / count
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        user = User.objects.get(email=options['user']) if options['user'] else User.objects.order_by('pk').first()
+        if user is None:
+            self.stderr.write('Create a user first')
+            return
+
+        url = ShortenedURL.objects.create(user=user, original_url='https://example.com/benchmark')
+        count = options['requests']
+        full_stack = [m for m in settings.MIDDLEWARE if m != FAST_PATH]
+        try:
+            results = [
+                ('full stack', self._run(url.short_code, full_stack, count)),
+                ('fast path', self._run(url.short_code, [FAST_PATH] + full_stack, count)),
+            ]
+            click_queue.drain()
+        finally:
+            url.delete()
+
+        baseline = results[0][1]
+        for label, per_request in results:
+            self.stdout.write(
+                f'{label:>10}: {per_request * 1e6:8.1f} us/request '
+                f'({1 / per_request:8.0f} req/s, {per_request / baseline:.0%} of full stack)'
+            )
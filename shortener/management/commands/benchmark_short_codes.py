@@ -0,0 +1,77 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from shortener.codegen import ShortCodeAllocator
+from shortener.models import ShortenedURL
+import random
+import string
+import time
+
+class Rollback(Exception):
+    pass
+
+def legacy_short_code():
+    """The previous generator: random candidates checked one query at a time"""
+    length = getattr(settings, 'SHORT_URL_LENGTH', 6)
+    characters = string.ascii_letters + string.digits
+    while True:
+        code = ''.join(random.choice(characters) for _ in range(length))
+        if not ShortenedURL.objects.filter(short_code=code).exists():
+            return code
+
+class Command(BaseCommand):
+    help = 'Compare the block allocator with the old random-and-check short code generator'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=2000, help='Codes generated per run')
+        parser.add_argument('--block-size', type=int, default=getattr(settings, 'SHORT_CODE_BLOCK_SIZE', 1000))
+        parser.add_argument('--user', help='Email of the user owning the temporary benchmark links')
+
+    def _timed(self, func):
+        # Everything runs in a rolled-back transaction, including reserved blocks
+        started = time.perf_counter()
+        try:
+            with transaction.atomic():
+                func()
+                elapsed = time.perf_counter() - started
+                raise Rollback
+        except Rollback:
+            pass
+        return elapsed
+
+    def _create_urls(self, user, count, generate):
+        for i in range(count):
+            ShortenedURL.objects.create(
+                user=user,
+                original_url=f'https://example.com/benchmark/{i}',
+                short_code=generate(),
+            )
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        user = User.objects.get(email=options['user']) if options['user'] else User.objects.order_by('pk').first()
+        if user is None:
+            self.stderr.write('Create a user first')
+            return
+
+        count = options['count']
+
+        def allocator():
+            return ShortCodeAllocator(
+                block_size=options['block_size'],
+                length=getattr(settings, 'SHORT_URL_LENGTH', 6),
+                secret=settings.SECRET_KEY,
+            )
+
+        results = [
+            ('legacy codes', self._timed(lambda: [legacy_short_code() for _ in range(count)])),
+            ('block codes', self._timed(lambda: allocator().allocate(count))),
+            ('legacy create', self._timed(lambda: self._create_urls(user, count, legacy_short_code))),
+            ('block create', self._timed(lambda: self._create_urls(user, count, allocator().allocate_one))),
+        ]
+
+        for label, elapsed in results:
+            self.stdout.write(
+                f'{label:>13}: {elapsed / count * 1e6:8.1f} us/code ({count / elapsed:9.0f} codes/s)'
+            )
@@ -0,0 +1,9 @@
+from django.core.management.base import BaseCommand
+from analytics.exports import delete_expired_exports
+
+class Command(BaseCommand):
+    help = 'Delete the files of analytics exports past their expiry'
+
+    def handle(self, *args, **options):
+        deleted = delete_expired_exports()
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} expired exports'))
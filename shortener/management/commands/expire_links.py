@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.utils import timezone
+from shortener.lifecycle import expire_links, next_expiry
+import time
+
+class Command(BaseCommand):
+    help = 'Deactivate links past their expiry date and evict them from the redirect caches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Links deactivated per transaction')
+        parser.add_argument(
+            '--interval', type=float, default=0,
+            help='Keep running, sweeping at most this many seconds apart (or sooner when a link is due)'
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            expired = expire_links(batch_size=options['batch_size'])
+            if expired or not options['interval']:
+                self.stdout.write(self.style.SUCCESS(f'Expired {expired} links'))
+            if not options['interval']:
+                return
+
+            # Sleep until the next link is due, but no longer than the interval
+            delay = options['interval']
+            due = next_expiry()
+            if due is not None:
+                delay = min(delay, max((due - timezone.now()).total_seconds(), 0) + 0.5)
+            close_old_connections()
+            time.sleep(delay)
@@ -0,0 +1,9 @@
+from django.core.management.base import BaseCommand
+from shortener.counters import fold_click_counters
+
+class Command(BaseCommand):
+    help = 'Fold sharded click counters back into ShortenedURL click totals'
+
+    def handle(self, *args, **options):
+        folded = fold_click_counters()
+        self.stdout.write(self.style.SUCCESS(f'Folded click counters for {folded} URLs'))
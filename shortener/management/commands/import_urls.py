@@ -0,0 +1,62 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from shortener.imports import guess_format, import_stream
+from shortener.jobs import JobError, finish_job
+from shortener.models import ImportJob
+import os
+
+class Command(BaseCommand):
+    help = 'Stream-import links for a user from a CSV or NDJSON file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV (with a header row) or NDJSON file')
+        parser.add_argument('--user', required=True, help='Email of the user who will own the links')
+        parser.add_argument('--format', choices=[ImportJob.FORMAT_CSV, ImportJob.FORMAT_NDJSON])
+        parser.add_argument('--private', action='store_true', help='Create the links as private')
+        parser.add_argument('--chunk-size', type=int, help='Rows validated and inserted together')
+
+    def _report(self, job):
+        self.stdout.write(
+            f'{job.percent_complete:5.1f}%  {job.rows_processed} rows, '
+            f'{job.rows_created} created, {job.rows_failed} failed'
+        )
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        try:
+            user = User.objects.get(email=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f"No user with email {options['user']}")
+
+        path = options['path']
+        if not os.path.isfile(path):
+            raise CommandError(f'{path} does not exist')
+
+        # The job row records progress and errors just like API imports
+        job = ImportJob.objects.create(
+            user=user,
+            format=options['format'] or guess_format(path),
+            is_public=not options['private'],
+            status=ImportJob.STATUS_RUNNING,
+            started_at=timezone.now(),
+            total=os.path.getsize(path),
+        )
+        try:
+            with open(path, 'rb') as stream:
+                import_stream(job, stream, options['chunk_size'], on_progress=self._report)
+        except JobError as exc:
+            finish_job(job, str(exc))
+            raise CommandError(f'Import {job.pk} stopped: {exc}')
+        except BaseException as exc:
+            finish_job(job, f'Unexpected error: {exc}')
+            raise
+        finish_job(job)
+
+        for entry in job.errors[:20]:
+            self.stderr.write(f"line {entry['line']}: {entry['error']}")
+        if job.rows_failed > 20:
+            self.stderr.write(f'... see import {job.pk} for the full error report')
+        self.stdout.write(self.style.SUCCESS(
+            f'Import {job.pk}: created {job.rows_created} of {job.rows_processed} rows'
+        ))
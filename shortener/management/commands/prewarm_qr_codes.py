@@ -0,0 +1,108 @@
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from shortener.models import ShortenedURL
+from shortener.qr import CONTENT_TYPES, SIZES, build_spec, prune_qr_cache, render_batch
+import os
+import time
+
+def _init_worker():
+    # Needed when workers are spawned rather than forked
+    import django
+    django.setup()
+
+class Command(BaseCommand):
+    help = 'Render QR images ahead of time for one account or every link, spread across processes'
+
+    def add_arguments(self, parser):
+        scope = parser.add_mutually_exclusive_group(required=True)
+        scope.add_argument('--user', help='Email of the account whose links to render')
+        scope.add_argument('--all', action='store_true', help='Render for every link')
+        parser.add_argument('--formats', default='png,svg', help=f"Comma-separated, from: {', '.join(CONTENT_TYPES)}")
+        parser.add_argument('--sizes', default='medium', help=f"Comma-separated PNG sizes: {', '.join(SIZES)} or box sizes")
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+        parser.add_argument('--batch-size', type=int, default=200, help='Images per task sent to a worker')
+        parser.add_argument('--force', action='store_true', help='Re-render images that are already cached')
+
+    def _specs(self, queryset, formats, sizes):
+        for short_code in queryset.values_list('short_code', flat=True).iterator(chunk_size=2000):
+            url = ShortenedURL(short_code=short_code)
+            # SVG ignores size, so several sizes can map to one spec
+            yield from dict.fromkeys(build_spec(url, fmt, size) for fmt in formats for size in sizes)
+
+    def _batches(self, specs, size):
+        batch = []
+        for spec in specs:
+            batch.append(spec)
+            if len(batch) >= size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def handle(self, *args, **options):
+        queryset = ShortenedURL.objects.order_by('pk')
+        if options['user']:
+            User = get_user_model()
+            try:
+                queryset = queryset.filter(user=User.objects.get(email=options['user']))
+            except User.DoesNotExist:
+                raise CommandError(f"No user with email {options['user']}")
+
+        formats = [fmt.strip() for fmt in options['formats'].split(',') if fmt.strip()]
+        sizes = [size.strip() for size in options['sizes'].split(',') if size.strip()]
+        try:
+            if not formats or not sizes:
+                raise ValueError('Give at least one format and size')
+            for fmt in formats:
+                for size in sizes:
+                    build_spec(ShortenedURL(short_code='x'), fmt, size)
+        except ValueError as exc:
+            raise CommandError(str(exc))
+
+        workers = max(options['workers'], 1)
+        stats = defaultdict(lambda: [0, 0, 0.0])
+        batches = self._batches(self._specs(queryset, formats, sizes), options['batch_size'])
+        started = time.perf_counter()
+
+        # Forked workers must not share the parent's database connections
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+            pending = set()
+            # Keep only a few batches in flight so memory stays flat on large systems
+            for batch in batches:
+                pending.add(pool.submit(render_batch, batch, options['force']))
+                if len(pending) >= workers * 2:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    self._collect(done, stats)
+            self._collect(pending, stats)
+        elapsed = time.perf_counter() - started
+
+        rendered = skipped = 0
+        for pid, (worker_rendered, worker_skipped, busy) in sorted(stats.items()):
+            rendered += worker_rendered
+            skipped += worker_skipped
+            rate = worker_rendered / busy if busy else 0
+            self.stdout.write(
+                f'worker {pid}: {worker_rendered} rendered, {worker_skipped} unchanged, '
+                f'{busy:.1f}s busy, {rate:.0f} images/s'
+            )
+
+        pruned = prune_qr_cache()
+        self.stdout.write(self.style.SUCCESS(
+            f'Rendered {rendered} images ({skipped} unchanged) in {elapsed:.1f}s '
+            f'with {workers} workers ({rendered / elapsed if elapsed else 0:.0f} images/s)'
+        ))
+        if pruned:
+            self.stdout.write(self.style.WARNING(
+                f'Pruned {pruned} older images to stay within QR_CACHE_MAX_BYTES'
+            ))
+
+    def _collect(self, futures, stats):
+        for future in futures:
+            pid, rendered, skipped, busy = future.result()
+            stats[pid][0] += rendered
+            stats[pid][1] += skipped
+            stats[pid][2] += busy
@@ -0,0 +1,29 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from shortener.qr import prune_qr_cache
+import time
+
+class Command(BaseCommand):
+    help = 'Delete the oldest cached QR images until the cache fits in QR_CACHE_MAX_BYTES'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--max-bytes', type=int, default=None,
+            help='Cache size to prune down to (default: QR_CACHE_MAX_BYTES)'
+        )
+        parser.add_argument(
+            '--interval', type=float, default=0,
+            help='Keep running, pruning this many seconds apart'
+        )
+
+    def handle(self, *args, **options):
+        max_bytes = options['max_bytes']
+        if max_bytes is None:
+            max_bytes = getattr(settings, 'QR_CACHE_MAX_BYTES', 512 * 1024 * 1024)
+        while True:
+            pruned = prune_qr_cache(max_bytes)
+            if pruned or not options['interval']:
+                self.stdout.write(self.style.SUCCESS(f'Pruned {pruned} cached QR images'))
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,48 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from shortener.codeset import short_code_filter, invalidate_all_filters
+from shortener.models import ShortenedURL
+import random
+import string
+import time
+
+class Command(BaseCommand):
+    help = 'Rebuild the short code filter in every process and optionally verify it'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verify', action='store_true', help='Check the rebuilt filter against the database')
+        parser.add_argument('--samples', type=int, default=100000, help='Random codes probed to measure the false-positive rate')
+
+    def handle(self, *args, **options):
+        invalidate_all_filters()
+        self.stdout.write('Web processes will rebuild their filters on their next negative lookup')
+
+        started = time.monotonic()
+        bloom = short_code_filter.rebuild()
+        self.stdout.write(
+            f'Built filter with {bloom.count} codes in {time.monotonic() - started:.2f}s '
+            f'({bloom.nbytes / 1024:.0f} KiB, {bloom.hash_count} hashes)'
+        )
+
+        if not options['verify']:
+            return
+
+        missing = 0
+        for short_code in ShortenedURL.objects.values_list('short_code', flat=True).iterator(chunk_size=5000):
+            if not short_code_filter.might_exist(short_code):
+                missing += 1
+        if missing:
+            raise CommandError(f'{missing} existing short codes are rejected by the filter')
+        self.stdout.write(self.style.SUCCESS('Every existing short code passes the filter'))
+
+        length = getattr(settings, 'SHORT_URL_LENGTH', 6)
+        characters = string.ascii_letters + string.digits
+        probes = {''.join(random.choices(characters, k=length)) for _ in range(options['samples'])}
+        hits = [code for code in probes if code in bloom]
+        existing = set(ShortenedURL.objects.filter(short_code__in=hits).values_list('short_code', flat=True))
+        false_positives = len(hits) - len(existing)
+        rate = false_positives / max(len(probes) - len(existing), 1)
+        self.stdout.write(
+            f'False-positive rate: {rate:.5f} over {len(probes)} random codes '
+            f'(target {getattr(settings, "SHORT_CODE_FILTER_ERROR_RATE", 0.001)})'
+        )
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from analytics.system_stats import refresh_system_stats
+import time
+
+class Command(BaseCommand):
+    help = 'Update the admin dashboard statistics with users, links and clicks added since the last run'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, help='Rows counted per query while catching up')
+        parser.add_argument('--interval', type=float, default=0, help='Keep running, refreshing this many seconds apart')
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.monotonic()
+            stats = refresh_system_stats(batch_size=options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(
+                f'Refreshed system stats up to click {stats.last_click_id} in {time.monotonic() - started:.2f}s'
+            ))
+            if not options['interval']:
+                return
+            close_old_connections()
+            time.sleep(options['interval'])
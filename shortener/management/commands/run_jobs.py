@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from shortener.jobs import run_pending_jobs
+import time
+
+class Command(BaseCommand):
+    help = 'Run pending background jobs (imports and the like) in this process'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval', type=float, default=0,
+            help='Keep running, checking for new jobs this many seconds apart'
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            count = run_pending_jobs()
+            if count or not options['interval']:
+                self.stdout.write(self.style.SUCCESS(f'Ran {count} jobs'))
+            if not options['interval']:
+                return
+            close_old_connections()
+            time.sleep(options['interval'])
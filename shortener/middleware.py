@@ -0,0 +1,85 @@
+from asgiref.sync import async_to_sync, iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.urls import get_resolver
+from .redirects import follow_short_code, afollow_short_code
+import re
+
+_SHORT_CODE_PATH = re.compile(r'/([A-Za-z0-9-]+)/?')
+
+def get_reserved_prefixes():
+    """First path segments owned by other routes, which must never be treated as short codes"""
+    reserved = set(getattr(settings, 'RESERVED_SHORT_CODES', []))
+    for pattern in get_resolver().url_patterns:
+        prefix = str(pattern.pattern).lstrip('^').split('/')[0]
+        if prefix and '<' not in prefix:
+            reserved.add(prefix)
+    for url in (settings.STATIC_URL, settings.MEDIA_URL):
+        reserved.add(url.strip('/').split('/')[0])
+    return reserved
+
+class RedirectFastPathMiddleware:
+    """
+    Serve short-code redirects before sessions, CSRF, auth, messages and the
+    URL resolver run. Anything it can't answer with a redirect or a
+    definite 404 (reserved prefixes, disabled or expired links) falls
+    through to the normal stack.
+
+    Redirects take the same code path as the redirect view would: the async
+    one when ASYNC_REDIRECTS is set, the sync one otherwise, whichever way
+    the server calls the middleware.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self._reserved = None
+        self._async_redirects = getattr(settings, 'ASYNC_REDIRECTS', False)
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def _match(self, request):
+        if request.method not in ('GET', 'HEAD'):
+            return None
+        match = _SHORT_CODE_PATH.fullmatch(request.path_info)
+        if match is None:
+            return None
+        if self._reserved is None:
+            self._reserved = get_reserved_prefixes()
+        short_code = match.group(1)
+        if short_code in self._reserved:
+            return None
+        # Validate the Host header as CommonMiddleware would
+        request.get_host()
+        return short_code
+
+    def _finish(self, response):
+        if response.status_code == 404:
+            # XFrameOptionsMiddleware doesn't run for fast-path responses
+            response['X-Frame-Options'] = getattr(settings, 'X_FRAME_OPTIONS', 'DENY')
+        return response
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        short_code = self._match(request)
+        if short_code is not None:
+            if self._async_redirects:
+                response, error = async_to_sync(afollow_short_code)(request, short_code)
+            else:
+                response, error = follow_short_code(request, short_code)
+            if error is None:
+                return self._finish(response)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        short_code = self._match(request)
+        if short_code is not None:
+            if self._async_redirects:
+                response, error = await afollow_short_code(request, short_code)
+            else:
+                response, error = await sync_to_async(follow_short_code)(request, short_code)
+            if error is None:
+                return self._finish(response)
+        return await self.get_response(request)
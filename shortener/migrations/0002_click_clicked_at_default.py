@@ -0,0 +1,19 @@
+# Generated by Django 4.2.7 on 2026-10-16 22:29
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shortener', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='click',
+            name='clicked_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
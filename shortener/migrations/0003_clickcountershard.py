@@ -0,0 +1,28 @@
+# Generated by Django 4.2.7 on 2026-10-16 22:31
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shortener', '0002_click_clicked_at_default'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClickCounterShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shard', models.PositiveSmallIntegerField()),
+                ('clicks', models.PositiveIntegerField(default=0)),
+                ('unique_clicks', models.PositiveIntegerField(default=0)),
+                ('url', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='counter_shards', to='shortener.shortenedurl')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='clickcountershard',
+            constraint=models.UniqueConstraint(fields=('url', 'shard'), name='unique_click_counter_shard'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.7 on 2026-10-16 22:36
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shortener', '0003_clickcountershard'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shortenedurl',
+            name='analytics_sample_every',
+            field=models.PositiveIntegerField(default=1, help_text='Record one in N clicks, each counting as N (1 records every click)', validators=[django.core.validators.MinValueValidator(1)]),
+        ),
+        migrations.AddField(
+            model_name='shortenedurl',
+            name='cache_max_age',
+            field=models.PositiveIntegerField(default=0, help_text='Seconds browsers and CDNs may cache the redirect (0 disables caching)'),
+        ),
+        migrations.AddField(
+            model_name='shortenedurl',
+            name='redirect_type',
+            field=models.PositiveSmallIntegerField(choices=[(302, 'Temporary (302)'), (307, 'Temporary, keep method (307)'), (301, 'Permanent (301)'), (308, 'Permanent, keep method (308)')], default=302),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-16 22:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shortener', '0004_redirect_policy'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='shortenedurl',
+            index=models.Index(condition=models.Q(('expires_at__isnull', False)), fields=['expires_at'], name='shortener_url_expires_idx'),
+        ),
+    ]
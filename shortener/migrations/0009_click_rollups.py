@@ -0,0 +1,63 @@
+# Generated by Django 4.2.7 on 2026-10-16 23:10
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shortener', '0008_soft_delete'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyClickRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.DateTimeField()),
+                ('country', models.CharField(blank=True, max_length=100)),
+                ('browser', models.CharField(blank=True, max_length=100)),
+                ('device', models.CharField(blank=True, max_length=100)),
+                ('os', models.CharField(blank=True, max_length=100)),
+                ('referrer_domain', models.CharField(blank=True, max_length=255)),
+                ('clicks', models.PositiveBigIntegerField(default=0)),
+                ('unique_clicks', models.PositiveBigIntegerField(default=0)),
+                ('url', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='shortener.shortenedurl')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='HourlyClickRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.DateTimeField()),
+                ('country', models.CharField(blank=True, max_length=100)),
+                ('browser', models.CharField(blank=True, max_length=100)),
+                ('device', models.CharField(blank=True, max_length=100)),
+                ('os', models.CharField(blank=True, max_length=100)),
+                ('referrer_domain', models.CharField(blank=True, max_length=255)),
+                ('clicks', models.PositiveBigIntegerField(default=0)),
+                ('unique_clicks', models.PositiveBigIntegerField(default=0)),
+                ('url', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='shortener.shortenedurl')),
+            ],
+            options={
+                'abstract': False,
+                'indexes': [models.Index(fields=['bucket'], name='hourlyclickrollup_bucket_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='hourlyclickrollup',
+            constraint=models.UniqueConstraint(fields=('url', 'bucket', 'country', 'browser', 'device', 'os', 'referrer_domain'), name='unique_hourlyclickrollup'),
+        ),
+        migrations.AddIndex(
+            model_name='dailyclickrollup',
+            index=models.Index(fields=['bucket'], name='dailyclickrollup_bucket_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailyclickrollup',
+            constraint=models.UniqueConstraint(fields=('url', 'bucket', 'country', 'browser', 'device', 'os', 'referrer_domain'), name='unique_dailyclickrollup'),
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 4.2.7 on 2026-10-16 23:40
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0001_initial'),
+        ('shortener', '0009_click_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySystemStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True)),
+                ('new_users', models.PositiveIntegerField(default=0)),
+                ('new_urls', models.PositiveIntegerField(default=0)),
+                ('clicks', models.PositiveBigIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name_plural': 'daily system stats',
+                'ordering': ['-date'],
+            },
+        ),
+        migrations.CreateModel(
+            name='SystemStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_users', models.PositiveBigIntegerField(default=0)),
+                ('total_urls', models.PositiveBigIntegerField(default=0)),
+                ('active_urls', models.PositiveBigIntegerField(default=0)),
+                ('total_clicks', models.PositiveBigIntegerField(default=0)),
+                ('country_clicks', models.JSONField(default=dict)),
+                ('top_urls', models.JSONField(default=list)),
+                ('last_user_id', models.BigIntegerField(default=0)),
+                ('last_url_id', models.BigIntegerField(default=0)),
+                ('last_click_id', models.BigIntegerField(default=0)),
+                ('refreshed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name_plural': 'system stats',
+            },
+        ),
+        migrations.CreateModel(
+            name='UserStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('url_count', models.PositiveIntegerField(db_index=True, default=0)),
+                ('click_count', models.PositiveBigIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name_plural': 'user stats',
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.7 on 2026-10-16 23:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shortener', '0011_export_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='systemstats',
+            name='click_id_gaps',
+            field=models.JSONField(default=list),
+        ),
+        migrations.AddField(
+            model_name='systemstats',
+            name='url_id_gaps',
+            field=models.JSONField(default=list),
+        ),
+        migrations.AddField(
+            model_name='systemstats',
+            name='user_id_gaps',
+            field=models.JSONField(default=list),
+        ),
+    ]
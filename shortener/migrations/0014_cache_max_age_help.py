@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-16 23:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shortener', '0013_job_heartbeats'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='shortenedurl',
+            name='cache_max_age',
+            field=models.PositiveIntegerField(default=0, help_text='Seconds browsers outside the analytics sample may cache the redirect (0 disables caching)'),
+        ),
+    ]
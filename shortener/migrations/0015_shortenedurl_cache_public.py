@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-16 23:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shortener', '0014_cache_max_age_help'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shortenedurl',
+            name='cache_public',
+            field=models.BooleanField(default=False, help_text='Let CDNs and other shared caches store the redirect; clicks they answer are not counted'),
+        ),
+        migrations.AlterField(
+            model_name='shortenedurl',
+            name='cache_max_age',
+            field=models.PositiveIntegerField(default=0, help_text='Seconds the redirect may be cached (0 disables caching)'),
+        ),
+    ]
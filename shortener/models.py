@@ -1,12 +1,24 @@
-from django.db import models
+from django.db import models, transaction, IntegrityError
+from django.core.validators import MinValueValidator
 from django.contrib.auth import get_user_model
 from django.utils import timezone
-import string
-import random
 
 User = get_user_model()
 
+class ShortenedURLManager(models.Manager):
+    """Default manager that hides soft-deleted links"""
+    
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
+
 class ShortenedURL(models.Model):
+    REDIRECT_TYPE_CHOICES = [
+        (302, 'Temporary (302)'),
+        (307, 'Temporary, keep method (307)'),
+        (301, 'Permanent (301)'),
+        (308, 'Permanent, keep method (308)'),
+    ]
+    
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='urls')
     original_url = models.URLField(max_length=2048)
     short_code = models.CharField(max_length=20, unique=True, db_index=True)
@@ -17,6 +29,22 @@ class ShortenedURL(models.Model):
     is_public = models.BooleanField(default=True)
     expires_at = models.DateTimeField(blank=True, null=True)
     
+    # Redirect policy
+    redirect_type = models.PositiveSmallIntegerField(choices=REDIRECT_TYPE_CHOICES, default=302)
+    cache_max_age = models.PositiveIntegerField(
+        default=0,
+        help_text='Seconds the redirect may be cached (0 disables caching)'
+    )
+    cache_public = models.BooleanField(
+        default=False,
+        help_text='Let CDNs and other shared caches store the redirect; clicks they answer are not counted'
+    )
+    analytics_sample_every = models.PositiveIntegerField(
+        default=1,
+        validators=[MinValueValidator(1)],
+        help_text='Record one in N clicks, each counting as N (1 records every click)'
+    )
+    
     # Tracking
     click_count = models.PositiveIntegerField(default=0)
     unique_clicks = models.PositiveIntegerField(default=0)
@@ -24,9 +52,22 @@ class ShortenedURL(models.Model):
     # Timestamps
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    deleted_at = models.DateTimeField(blank=True, null=True)
+    
+    objects = ShortenedURLManager()
+    # Includes soft-deleted links waiting to be purged, which still hold their short codes
+    all_objects = models.Manager()
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Most links never expire, so only index the ones that do
+            models.Index(
+                fields=['expires_at'],
+                name='shortener_url_expires_idx',
+                condition=models.Q(expires_at__isnull=False),
+            ),
+        ]
     
     def __str__(self):
         return f"{self.short_code} -> {self.original_url[:50]}"
@@ -42,20 +83,34 @@ class ShortenedURL(models.Model):
         from django.conf import settings
         return f"{settings.BASE_URL}/{self.short_code}"
     
+    def get_click_totals(self):
+        """Click counts including increments not yet folded into this row"""
+        from .counters import get_pending_counts
+        pending_clicks, pending_unique = get_pending_counts(self.pk)
+        return {
+            'click_count': self.click_count + pending_clicks,
+            'unique_clicks': self.unique_clicks + pending_unique,
+        }
+    
     def save(self, *args, **kwargs):
-        if not self.short_code:
+        if self.short_code:
+            return super().save(*args, **kwargs)
+        
+        # Allocated codes never repeat, but can still hit a custom alias or a
+        # code issued by the old random generator; skip to the next one then
+        for attempt in range(10):
             self.short_code = self.generate_short_code()
-        super().save(*args, **kwargs)
+            try:
+                with transaction.atomic():
+                    return super().save(*args, **kwargs)
+            except IntegrityError:
+                if not ShortenedURL.all_objects.filter(short_code=self.short_code).exists():
+                    raise
+        raise IntegrityError('Could not allocate a free short code')
     
     def generate_short_code(self):
-        from django.conf import settings
-        length = getattr(settings, 'SHORT_URL_LENGTH', 6)
-        characters = string.ascii_letters + string.digits
-        
-        while True:
-            code = ''.join(random.choice(characters) for _ in range(length))
-            if not ShortenedURL.objects.filter(short_code=code).exists():
-                return code
+        from .codegen import allocate_short_codes
+        return allocate_short_codes(1)[0]
 
 class Click(models.Model):
     url = models.ForeignKey(ShortenedURL, on_delete=models.CASCADE, related_name='clicks')
@@ -74,8 +129,8 @@ class Click(models.Model):
     country = models.CharField(max_length=100, blank=True)
     city = models.CharField(max_length=100, blank=True)
     
-    # Timestamp
-    clicked_at = models.DateTimeField(auto_now_add=True)
+    # Timestamp (set when the click happens, not when the batch is written)
+    clicked_at = models.DateTimeField(default=timezone.now)
     
     class Meta:
         ordering = ['-clicked_at']
@@ -83,6 +138,70 @@ class Click(models.Model):
     def __str__(self):
         return f"Click on {self.url.short_code} at {self.clicked_at}"
 
+class ClickCounterShard(models.Model):
+    """One of several counter rows per URL, so concurrent clicks don't contend on a single row"""
+    url = models.ForeignKey(ShortenedURL, on_delete=models.CASCADE, related_name='counter_shards')
+    shard = models.PositiveSmallIntegerField()
+    clicks = models.PositiveIntegerField(default=0)
+    unique_clicks = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['url', 'shard'], name='unique_click_counter_shard'),
+        ]
+    
+    def __str__(self):
+        return f"Shard {self.shard} for {self.url_id}"
+
+class ClickRollup(models.Model):
+    """
+    Click totals for one URL, time bucket and combination of visitor
+    attributes, kept up to date as clicks are written
+    """
+    DIMENSIONS = ('country', 'browser', 'device', 'os', 'referrer_domain')
+
+    url = models.ForeignKey(ShortenedURL, on_delete=models.CASCADE, related_name='+')
+    bucket = models.DateTimeField()
+    country = models.CharField(max_length=100, blank=True)
+    browser = models.CharField(max_length=100, blank=True)
+    device = models.CharField(max_length=100, blank=True)
+    os = models.CharField(max_length=100, blank=True)
+    referrer_domain = models.CharField(max_length=255, blank=True)
+    # Weighted like the click counters, so sampled links report estimated totals
+    clicks = models.PositiveBigIntegerField(default=0)
+    unique_clicks = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        abstract = True
+        constraints = [
+            models.UniqueConstraint(
+                fields=['url', 'bucket', 'country', 'browser', 'device', 'os', 'referrer_domain'],
+                name='unique_%(class)s',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['bucket'], name='%(class)s_bucket_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.clicks} clicks on {self.url_id} at {self.bucket}"
+
+class HourlyClickRollup(ClickRollup):
+    """Click rollup per hour (bucket is the start of the hour, UTC)"""
+    PERIOD = 'hour'
+
+class DailyClickRollup(ClickRollup):
+    """Click rollup per day (bucket is midnight UTC)"""
+    PERIOD = 'day'
+
+class ShortCodeSequence(models.Model):
+    """Shared counter that short code blocks are reserved from"""
+    name = models.CharField(max_length=50, unique=True)
+    next_value = models.BigIntegerField(default=0)
+    
+    def __str__(self):
+        return f"{self.name}: {self.next_value}"
+
 class QRCode(models.Model):
     url = models.OneToOneField(ShortenedURL, on_delete=models.CASCADE, related_name='qr_code')
     image = models.ImageField(upload_to='qr_codes/')
@@ -90,3 +209,216 @@ class QRCode(models.Model):
     
     def __str__(self):
         return f"QR Code for {self.url.short_code}"
+
+class BackgroundJob(models.Model):
+    """Common state for long-running work done outside the request cycle"""
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_COMPLETED = 'completed'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_COMPLETED, 'Completed'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+    # Whether a job abandoned by its worker can safely start over (otherwise it is failed)
+    RETRY_WHEN_STALE = False
+    
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING, db_index=True)
+    processed = models.PositiveBigIntegerField(default=0)
+    total = models.PositiveBigIntegerField(blank=True, null=True)
+    error = models.TextField(blank=True)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+    # Last sign of life (creation, claim or progress), used to spot abandoned jobs
+    heartbeat_at = models.DateTimeField(default=timezone.now, db_index=True)
+    
+    class Meta:
+        abstract = True
+        ordering = ['-created_at']
+    
+    @property
+    def is_finished(self):
+        return self.status in (self.STATUS_COMPLETED, self.STATUS_FAILED)
+    
+    @property
+    def percent_complete(self):
+        if self.status == self.STATUS_COMPLETED:
+            return 100
+        if not self.total:
+            return 0
+        return min(100, round(self.processed * 100 / self.total, 1))
+    
+    def execute(self):
+        """Do the job's work; called by shortener.jobs once the job is claimed"""
+        raise NotImplementedError
+
+class ImportJob(BackgroundJob):
+    """Streaming import of links from an uploaded CSV or NDJSON file (progress is in bytes read)"""
+    FORMAT_CSV = 'csv'
+    FORMAT_NDJSON = 'ndjson'
+    FORMAT_CHOICES = [
+        (FORMAT_CSV, 'CSV'),
+        (FORMAT_NDJSON, 'NDJSON'),
+    ]
+    
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='import_jobs')
+    file = models.FileField(upload_to='imports/', blank=True)
+    format = models.CharField(max_length=10, choices=FORMAT_CHOICES)
+    is_public = models.BooleanField(default=True)
+    
+    rows_processed = models.PositiveIntegerField(default=0)
+    rows_created = models.PositiveIntegerField(default=0)
+    rows_failed = models.PositiveIntegerField(default=0)
+    errors = models.JSONField(default=list, blank=True)
+    
+    class Meta(BackgroundJob.Meta):
+        pass
+    
+    def __str__(self):
+        return f"Import {self.pk} by {self.user_id} ({self.status})"
+    
+    def execute(self):
+        from .imports import run_import_job
+        run_import_job(self)
+
+class PurgeJob(BackgroundJob):
+    """Chunked removal of soft-deleted links with their clicks and QR files (progress is in rows deleted)"""
+    RETRY_WHEN_STALE = True  # already purged rows are simply not found again
+    
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, blank=True, null=True, related_name='purge_jobs')
+    url_ids = models.JSONField(default=list)
+    
+    urls_purged = models.PositiveIntegerField(default=0)
+    clicks_deleted = models.PositiveBigIntegerField(default=0)
+    
+    class Meta(BackgroundJob.Meta):
+        pass
+    
+    def __str__(self):
+        return f"Purge {self.pk} of {len(self.url_ids)} URLs ({self.status})"
+    
+    def execute(self):
+        from .lifecycle import run_purge_job
+        run_purge_job(self)
+
+class ExportJob(BackgroundJob):
+    """Analytics export written to a file in the background (progress is in rows written)"""
+    RETRY_WHEN_STALE = True  # the file is written from scratch
+
+    KIND_URL = 'url'
+    KIND_USER = 'user'
+    KIND_CHOICES = [
+        (KIND_URL, 'Link clicks'),
+        (KIND_USER, 'All links'),
+    ]
+
+    FORMAT_CSV = 'csv'
+    FORMAT_XLSX = 'xlsx'
+    FORMAT_NDJSON = 'ndjson'
+    FORMAT_CHOICES = [
+        (FORMAT_CSV, 'CSV'),
+        (FORMAT_XLSX, 'XLSX'),
+        (FORMAT_NDJSON, 'NDJSON'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='export_jobs')
+    url = models.ForeignKey(ShortenedURL, on_delete=models.CASCADE, blank=True, null=True, related_name='export_jobs')
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    format = models.CharField(max_length=10, choices=FORMAT_CHOICES, default=FORMAT_CSV)
+    compress = models.BooleanField(default=False)
+    # Identifies identical exports, so a repeated request joins the job already under way
+    key = models.CharField(max_length=100)
+
+    file = models.FileField(upload_to='exports/', blank=True)
+    filename = models.CharField(max_length=255, blank=True)
+    size = models.PositiveBigIntegerField(default=0)
+    expires_at = models.DateTimeField(blank=True, null=True, db_index=True)
+
+    class Meta(BackgroundJob.Meta):
+        constraints = [
+            models.UniqueConstraint(
+                fields=['key'],
+                condition=models.Q(status__in=['pending', 'running']),
+                name='unique_active_export',
+            ),
+        ]
+
+    def __str__(self):
+        return f"Export {self.pk} of {self.key} ({self.status})"
+
+    @property
+    def is_expired(self):
+        return self.expires_at is not None and timezone.now() >= self.expires_at
+
+    @property
+    def is_downloadable(self):
+        return self.status == self.STATUS_COMPLETED and bool(self.file) and not self.is_expired
+
+    def execute(self):
+        from analytics.exports import run_export_job
+        run_export_job(self)
+
+class SystemStats(models.Model):
+    """
+    Site-wide totals for the admin dashboard, refreshed by
+    `manage.py refresh_system_stats` from the rows added since the last run
+    """
+    total_users = models.PositiveBigIntegerField(default=0)
+    total_urls = models.PositiveBigIntegerField(default=0)
+    active_urls = models.PositiveBigIntegerField(default=0)
+    total_clicks = models.PositiveBigIntegerField(default=0)
+    # Clicks per country, e.g. {"Nepal": 120}
+    country_clicks = models.JSONField(default=dict)
+    # [{"short_code", "original_url", "click_count"}] for the most clicked links
+    top_urls = models.JSONField(default=list)
+    
+    # Highest primary keys already counted
+    last_user_id = models.BigIntegerField(default=0)
+    last_url_id = models.BigIntegerField(default=0)
+    last_click_id = models.BigIntegerField(default=0)
+    # Ids at or below those that weren't visible when counted (rows whose
+    # transaction hadn't committed yet), rechecked on each refresh
+    user_id_gaps = models.JSONField(default=list)
+    url_id_gaps = models.JSONField(default=list)
+    click_id_gaps = models.JSONField(default=list)
+    refreshed_at = models.DateTimeField(blank=True, null=True)
+    
+    class Meta:
+        verbose_name_plural = 'system stats'
+    
+    def __str__(self):
+        return f"System stats as of {self.refreshed_at}"
+    
+    def top_countries(self, limit=10):
+        ranked = sorted(self.country_clicks.items(), key=lambda item: (-item[1], item[0]))
+        return [{'country': country, 'count': count} for country, count in ranked[:limit]]
+
+class DailySystemStats(models.Model):
+    """New users, links and clicks per day (in the site time zone)"""
+    date = models.DateField(unique=True)
+    new_users = models.PositiveIntegerField(default=0)
+    new_urls = models.PositiveIntegerField(default=0)
+    clicks = models.PositiveBigIntegerField(default=0)
+    
+    class Meta:
+        ordering = ['-date']
+        verbose_name_plural = 'daily system stats'
+    
+    def __str__(self):
+        return f"System stats for {self.date}"
+
+class UserStats(models.Model):
+    """Links created by and clicks received by one user, counted alongside SystemStats"""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    url_count = models.PositiveIntegerField(default=0, db_index=True)
+    click_count = models.PositiveBigIntegerField(default=0)
+    
+    class Meta:
+        verbose_name_plural = 'user stats'
+    
+    def __str__(self):
+        return f"Stats for {self.user_id}"
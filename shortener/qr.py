@@ -0,0 +1,290 @@
+from collections import namedtuple
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import add_never_cache_headers, get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from io import BytesIO
+import copy
+import functools
+import hashlib
+import logging
+import os
+import re
+import shutil
+import time
+import zipfile
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = 'qr_cache'
+
+# Bump when rendering changes so every cached image is re-rendered
+RENDER_VERSION = 1
+
+DEFAULT_SIZE = 10
+MIN_SIZE = 1
+MAX_SIZE = 40
+
+# Named PNG sizes (module box size in pixels) for web and print use
+SIZES = {
+    'small': 4,
+    'medium': 10,
+    'large': 20,
+    'print': 40,
+}
+
+CONTENT_TYPES = {
+    'png': 'image/png',
+    'svg': 'image/svg+xml',
+}
+
+_COLOR = re.compile(r'^#?([0-9a-fA-F]{6})$')
+
+class QRSpec(namedtuple('QRSpec', ['data', 'format', 'size', 'fill_color', 'back_color'])):
+    """Everything that determines a QR image's bytes"""
+    __slots__ = ()
+
+    @property
+    def key(self):
+        source = '|'.join(str(part) for part in (RENDER_VERSION,) + tuple(self))
+        return hashlib.sha256(source.encode()).hexdigest()
+
+    @property
+    def etag(self):
+        # Strong: equal keys always mean byte-identical images
+        return f'"{self.key}"'
+
+    @property
+    def name(self):
+        key = self.key
+        return f'{CACHE_DIR}/{key[:2]}/{key}.{self.format}'
+
+    @property
+    def content_type(self):
+        return CONTENT_TYPES[self.format]
+
+def _color(value, default):
+    if not value:
+        return default
+    match = _COLOR.match(value)
+    if match is None:
+        raise ValueError(f'Invalid color: {value}')
+    return f'#{match.group(1).lower()}'
+
+def build_spec(url, format='png', size=None, fill_color=None, back_color=None):
+    """Validate rendering options for a link's QR code, raising ValueError when they are invalid"""
+    format = (format or 'png').lower()
+    if format not in CONTENT_TYPES:
+        raise ValueError(f'Unsupported format: {format}')
+    size = SIZES.get(size, size)
+    try:
+        size = int(size) if size else DEFAULT_SIZE
+    except (TypeError, ValueError):
+        raise ValueError(f"Size must be a number or one of {', '.join(SIZES)}")
+    if not MIN_SIZE <= size <= MAX_SIZE:
+        raise ValueError(f'Size must be between {MIN_SIZE} and {MAX_SIZE}')
+    if format == 'svg':
+        # Vector output scales freely, so every size shares one image
+        size = DEFAULT_SIZE
+    return QRSpec(
+        data=url.short_url,
+        format=format,
+        size=size,
+        fill_color=_color(fill_color, '#000000'),
+        back_color=_color(back_color, '#ffffff'),
+    )
+
+def spec_from_params(url, params):
+    """Build a spec from query parameters (format, size, fill, back)"""
+    return build_spec(
+        url,
+        format=params.get('format'),
+        size=params.get('size'),
+        fill_color=params.get('fill'),
+        back_color=params.get('back'),
+    )
+
+@functools.lru_cache(maxsize=64)
+def _encode(data):
+    # Choosing the mask pattern dominates small renders, and the module matrix
+    # only depends on the data, so it is shared by every format and size
+    import qrcode
+    qr = qrcode.QRCode(error_correction=qrcode.constants.ERROR_CORRECT_L, border=4)
+    qr.add_data(data)
+    qr.make(fit=True)
+    return qr
+
+def render_qr(spec):
+    """Render a QR image to bytes"""
+    qr = copy.copy(_encode(spec.data))
+    qr.box_size = spec.size
+
+    if spec.format == 'svg':
+        from qrcode.image.svg import SvgPathImage
+        factory = type('ColoredSvgPathImage', (SvgPathImage,), {
+            'background': spec.back_color,
+            'QR_PATH_STYLE': {**SvgPathImage.QR_PATH_STYLE, 'fill': spec.fill_color},
+        })
+        return qr.make_image(image_factory=factory).to_string()
+
+    img = qr.make_image(fill_color=spec.fill_color, back_color=spec.back_color)
+    buffer = BytesIO()
+    img.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+def ensure_qr_image(spec, force=False):
+    """Return the storage name of a spec's image, rendering it only if it isn't cached yet"""
+    name = spec.name
+    if default_storage.exists(name):
+        if not force:
+            return name
+        default_storage.delete(name)
+
+    saved = default_storage.save(name, ContentFile(render_qr(spec)))
+    if saved != name:
+        # Rendered concurrently by another request; the content is identical
+        default_storage.delete(saved)
+    return name
+
+def render_batch(specs, force=False):
+    """
+    Make sure every spec's image is cached. Meant to run in a worker process;
+    returns (pid, rendered, skipped, busy seconds).
+    """
+    started = time.perf_counter()
+    rendered = skipped = 0
+    for spec in specs:
+        if not force and default_storage.exists(spec.name):
+            # Same inputs, same key: the cached image is already correct
+            skipped += 1
+            continue
+        ensure_qr_image(spec, force=force)
+        rendered += 1
+    return os.getpid(), rendered, skipped, time.perf_counter() - started
+
+def _cached_files():
+    try:
+        directories, _ = default_storage.listdir(CACHE_DIR)
+    except FileNotFoundError:
+        return
+    for directory in directories:
+        _, files = default_storage.listdir(f'{CACHE_DIR}/{directory}')
+        for filename in files:
+            yield f'{CACHE_DIR}/{directory}/{filename}'
+
+def prune_qr_cache(max_bytes=None):
+    """
+    Delete the oldest cached images until the cache fits in max_bytes; returns
+    the number deleted. This lists the whole cache, so it runs from
+    `manage.py prune_qr_cache` rather than in requests.
+    """
+    if max_bytes is None:
+        max_bytes = getattr(settings, 'QR_CACHE_MAX_BYTES', 512 * 1024 * 1024)
+    entries = []
+    total = 0
+    for name in _cached_files():
+        try:
+            size = default_storage.size(name)
+            entries.append((default_storage.get_modified_time(name), size, name))
+        except (FileNotFoundError, NotImplementedError):
+            continue
+        total += size
+
+    deleted = 0
+    for _, size, name in sorted(entries):
+        if total <= max_bytes:
+            break
+        default_storage.delete(name)
+        total -= size
+        deleted += 1
+    if deleted:
+        logger.info('Pruned %d cached QR images', deleted)
+    return deleted
+
+def _file_response(name, spec, filename):
+    """Response whose body is streamed by the web server (sendfile offload) or from the open file"""
+    backend = getattr(settings, 'QR_SENDFILE_BACKEND', '')
+    if backend == 'x-accel-redirect':
+        # nginx serves the file from an `internal` location mapped to MEDIA_ROOT
+        response = HttpResponse(content_type=spec.content_type)
+        response['X-Accel-Redirect'] = f"{settings.QR_SENDFILE_PREFIX.rstrip('/')}/{name}"
+    elif backend == 'x-sendfile':
+        response = HttpResponse(content_type=spec.content_type)
+        response['X-Sendfile'] = default_storage.path(name)
+    else:
+        # Served with wsgi.file_wrapper (sendfile where the server supports it)
+        return FileResponse(
+            default_storage.open(name, 'rb'),
+            content_type=spec.content_type,
+            filename=f'{filename}.{spec.format}',
+        )
+    response['Content-Disposition'] = f'inline; filename="{filename}.{spec.format}"'
+    return response
+
+def qr_response(request, spec, filename):
+    """Serve a spec's image, answering 304 when the client already has it"""
+    # The ETag is known without touching storage, so If-None-Match is answered first
+    response = get_conditional_response(request, etag=spec.etag)
+    if response is None:
+        name = ensure_qr_image(spec)
+        try:
+            last_modified = int(default_storage.get_modified_time(name).timestamp())
+        except NotImplementedError:
+            last_modified = None
+        response = get_conditional_response(request, etag=spec.etag, last_modified=last_modified)
+        if response is None:
+            response = _file_response(name, spec, filename)
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+    response['ETag'] = spec.etag
+    patch_cache_control(response, private=True, max_age=getattr(settings, 'QR_CACHE_MAX_AGE', 3600))
+    return response
+
+class _ZipStream:
+    """Write-only file object handing what zipfile writes back to a generator"""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+def stream_qr_zip(urls, **options):
+    """
+    Yield a ZIP archive of the QR images of `urls` (ShortenedURL instances)
+    piece by piece, so only one image is held in memory at a time
+    """
+    stream = _ZipStream()
+    # PNG is already deflated, so entries are stored rather than compressed again
+    with zipfile.ZipFile(stream, 'w', compression=zipfile.ZIP_STORED) as archive:
+        for url in urls:
+            spec = build_spec(url, **options)
+            name = ensure_qr_image(spec)
+            with default_storage.open(name, 'rb') as image, \
+                    archive.open(f'{url.short_code}.{spec.format}', 'w') as entry:
+                shutil.copyfileobj(image, entry, 64 * 1024)
+            yield stream.pop()
+    yield stream.pop()
+
+def qr_zip_response(urls, filename, **options):
+    """Streaming download of every QR image in `urls` as one ZIP file"""
+    response = StreamingHttpResponse(stream_qr_zip(urls, **options), content_type='application/zip')
+    response['Content-Disposition'] = f'attachment; filename="{filename}.zip"'
+    add_never_cache_headers(response)
+    return response
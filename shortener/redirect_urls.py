@@ -1,7 +1,8 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 
 urlpatterns = [
-    path('', views.redirect_view, name='redirect'),
+    path('', views.redirect_view_async if settings.ASYNC_REDIRECTS else views.redirect_view, name='redirect'),
     path('preview/', views.url_preview_view, name='url_preview'),
 ]
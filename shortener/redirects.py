@@ -0,0 +1,95 @@
+from django.http import HttpResponseRedirect
+from django.utils.cache import add_never_cache_headers, patch_cache_control
+from django.utils.http import http_date
+from .cache import resolve_short_code, aresolve_short_code
+from .codeset import short_code_filter, not_found_response
+from .tracking import record_click, arecord_click, sample_window
+import time
+
+def check_redirect(url):
+    """Return (template, message, status) when a resolved short code can't be followed"""
+    if url is None:
+        return 'errors/404.html', 'Short URL not found', 404
+    
+    # Check if URL is expired (before is_active, as the sweeper also deactivates expired links)
+    if url.is_expired:
+        return 'errors/410.html', 'This link has expired', 410
+    
+    # Check if URL is active
+    if not url.is_active:
+        return 'errors/410.html', 'This link has been disabled', 410
+    
+    return None
+
+def get_cache_lifetime(url, sampled=True):
+    """
+    Seconds a redirect may be cached, at most for the link's remaining
+    lifetime. Links with public caching are cached for their full max-age by
+    every client and shared cache, and the clicks those caches answer are lost.
+    Otherwise cached hits never reach the app, so only links that sample clicks
+    are cached, and only for clients outside the current sample (`sampled`
+    False), until the sampling window ends. Every click that should be counted
+    then reaches the app.
+    """
+    if not url.cache_max_age:
+        return 0
+    if url.cache_public:
+        max_age = url.cache_max_age
+    elif url.analytics_sample_every <= 1 or sampled:
+        return 0
+    else:
+        _, max_age = sample_window(url)
+    remaining = url.remaining_lifetime()
+    if remaining is not None:
+        max_age = min(max_age, remaining)
+    return max(int(max_age), 0)
+
+def build_redirect_response(url, sampled=True):
+    """Redirect following the link's status code and HTTP caching policy"""
+    response = HttpResponseRedirect(url.original_url)
+    response.status_code = url.redirect_type
+    
+    max_age = get_cache_lifetime(url, sampled)
+    if max_age and url.cache_public:
+        patch_cache_control(response, public=True, max_age=max_age, s_maxage=max_age)
+        response['Expires'] = http_date(time.time() + max_age)
+    elif max_age:
+        # Private: a shared cache would also answer the sampled clients
+        patch_cache_control(response, private=True, max_age=max_age)
+        response['Expires'] = http_date(time.time() + max_age)
+    else:
+        # Without explicit headers browsers keep permanent redirects forever,
+        # which would outlive disabling or expiring the link
+        add_never_cache_headers(response)
+    return response
+
+def follow_short_code(request, short_code):
+    """
+    Resolve a short code and record the click. Returns (response, error):
+    the redirect (or pre-rendered 404), or check_redirect's error for the
+    caller to render.
+    """
+    # Reject codes that can't exist without touching the database
+    if not short_code_filter.might_exist(short_code):
+        return not_found_response(), None
+    
+    url = resolve_short_code(short_code)
+    error = check_redirect(url)
+    if error:
+        return None, error
+    
+    sampled = record_click(request, url)
+    return build_redirect_response(url, sampled), None
+
+async def afollow_short_code(request, short_code):
+    """Async variant of follow_short_code"""
+    if not await short_code_filter.amight_exist(short_code):
+        return not_found_response(), None
+    
+    url = await aresolve_short_code(short_code)
+    error = check_redirect(url)
+    if error:
+        return None, error
+    
+    sampled = await arecord_click(request, url)
+    return build_redirect_response(url, sampled), None
@@ -0,0 +1,157 @@
+from collections import defaultdict
+from datetime import datetime, time, timezone as dt_timezone
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.utils import timezone
+from urllib.parse import urlsplit
+from .models import Click, ClickRollup, HourlyClickRollup, DailyClickRollup
+
+ROLLUP_MODELS = (HourlyClickRollup, DailyClickRollup)
+
+def referrer_domain(referrer):
+    """Host part of a referrer URL, lowercased, without a leading www."""
+    if not referrer:
+        return ''
+    try:
+        host = (urlsplit(referrer).hostname or '').lower()
+    except ValueError:
+        return ''
+    if host.startswith('www.'):
+        host = host[4:]
+    return host[:255]
+
+def bucket_start(moment, period):
+    """Start of the UTC hour or day containing `moment`"""
+    moment = moment.astimezone(dt_timezone.utc)
+    if period == DailyClickRollup.PERIOD:
+        return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+def _dimensions(country, browser, device, os, referrer):
+    return (
+        (country or '')[:100],
+        (browser or '')[:100],
+        (device or '')[:100],
+        (os or '')[:100],
+        referrer_domain(referrer),
+    )
+
+class RollupBatch:
+    """Click increments summed in memory, written with one upsert per rollup table"""
+
+    def __init__(self):
+        self.increments = {model: defaultdict(lambda: [0, 0]) for model in ROLLUP_MODELS}
+
+    def add(self, url_id, clicked_at, country, browser, device, os, referrer, weight=1, is_unique=False):
+        dimensions = _dimensions(country, browser, device, os, referrer)
+        for model in ROLLUP_MODELS:
+            counts = self.increments[model][(url_id, bucket_start(clicked_at, model.PERIOD)) + dimensions]
+            counts[0] += weight
+            if is_unique:
+                counts[1] += weight
+
+    def __len__(self):
+        return len(self.increments[HourlyClickRollup])
+
+    def write(self):
+        """Add the increments to the rollup tables; call inside the transaction writing the clicks"""
+        for model, increments in self.increments.items():
+            _upsert_increments(model, increments)
+        self.increments = {model: defaultdict(lambda: [0, 0]) for model in ROLLUP_MODELS}
+
+def _upsert_increments(model, increments):
+    if not increments:
+        return
+    quote = connection.ops.quote_name
+    table = quote(model._meta.db_table)
+    key_columns = ['url_id', 'bucket'] + list(ClickRollup.DIMENSIONS)
+    columns = ', '.join(quote(column) for column in key_columns + ['clicks', 'unique_clicks'])
+    # ON CONFLICT ... DO UPDATE is supported by PostgreSQL and SQLite; adding
+    # to the stored totals keeps concurrent writers from overwriting each other
+    sql = (
+        f'INSERT INTO {table} ({columns}) VALUES ({", ".join(["%s"] * (len(key_columns) + 2))}) '
+        f'ON CONFLICT ({", ".join(quote(column) for column in key_columns)}) DO UPDATE SET '
+        f'{quote("clicks")} = {table}.{quote("clicks")} + EXCLUDED.{quote("clicks")}, '
+        f'{quote("unique_clicks")} = {table}.{quote("unique_clicks")} + EXCLUDED.{quote("unique_clicks")}'
+    )
+    rows = []
+    # A stable order keeps concurrent writers from deadlocking
+    for key in sorted(increments):
+        url_id, bucket, *dimensions = key
+        clicks, unique_clicks = increments[key]
+        rows.append([url_id, connection.ops.adapt_datetimefield_value(bucket), *dimensions, clicks, unique_clicks])
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, rows)
+
+def rebuild_rollups(url, batch_size=None):
+    """
+    Recompute a URL's rollups from its raw clicks. Click rows don't record
+    whether the visit was unique or how it was sampled, so the first click
+    from each IP counts as unique and every row is weighted by the link's
+    current sampling rate. Returns the number of clicks read.
+    """
+    batch_size = batch_size or getattr(settings, 'ROLLUP_BACKFILL_BATCH_SIZE', 5000)
+    weight = max(url.analytics_sample_every, 1)
+    batch = RollupBatch()
+    seen = set()
+    count = 0
+    rows = Click.objects.filter(url_id=url.pk).order_by('clicked_at', 'pk').values_list(
+        'clicked_at', 'ip_address', 'country', 'browser', 'device', 'os', 'referrer'
+    )
+    with transaction.atomic():
+        for model in ROLLUP_MODELS:
+            model.objects.filter(url_id=url.pk).delete()
+        for clicked_at, ip_address, country, browser, device, os, referrer in rows.iterator(chunk_size=batch_size):
+            is_unique = ip_address not in seen
+            seen.add(ip_address)
+            batch.add(url.pk, clicked_at, country, browser, device, os, referrer, weight, is_unique)
+            count += 1
+            if len(batch) >= batch_size:
+                batch.write()
+        batch.write()
+    return count
+
+def rollups_for(start=None, end=None, user=None, url=None, period=None):
+    """
+    Rollup rows for a user's or URL's clicks in [start, end). Unless `period`
+    asks for one, daily rollups are used when both ends fall on UTC midnight
+    and hourly ones otherwise; either way the row count depends on the range,
+    not on how many clicks there were.
+    """
+    if period is None:
+        daily = all(
+            moment is None or bucket_start(moment, DailyClickRollup.PERIOD) == moment
+            for moment in (start, end)
+        )
+    else:
+        daily = period == DailyClickRollup.PERIOD
+    if start is not None and not daily:
+        # Hourly buckets can't split an hour; round out to whole hours
+        start = bucket_start(start, HourlyClickRollup.PERIOD)
+    rollups = (DailyClickRollup if daily else HourlyClickRollup).objects.all()
+    if user is not None:
+        rollups = rollups.filter(url__user=user, url__deleted_at__isnull=True)
+    if url is not None:
+        rollups = rollups.filter(url=url)
+    if start is not None:
+        rollups = rollups.filter(bucket__gte=start)
+    if end is not None:
+        rollups = rollups.filter(bucket__lt=end)
+    return rollups
+
+def day_start(date):
+    """Aware start of a (current time zone) date"""
+    return timezone.make_aware(datetime.combine(date, time.min))
+
+def sum_clicks(rollups):
+    """(clicks, unique clicks) summed over rollup rows"""
+    totals = rollups.aggregate(clicks=Sum('clicks'), unique_clicks=Sum('unique_clicks'))
+    return totals['clicks'] or 0, totals['unique_clicks'] or 0
+
+def top_values(rollups, dimension, limit=10, exclude=()):
+    """Most clicked values of a dimension, as [{dimension: value, 'count': clicks}]"""
+    if exclude:
+        rollups = rollups.exclude(**{f'{dimension}__in': exclude})
+    values = rollups.values(dimension).annotate(count=Sum('clicks')).order_by('-count', dimension)
+    return list(values if limit is None else values[:limit])
@@ -0,0 +1,22 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import ShortenedURL
+from .cache import invalidate_short_code
+from .codeset import short_code_filter, publish_new_codes
+
+@receiver(post_save, sender=ShortenedURL)
+@receiver(post_delete, sender=ShortenedURL)
+def invalidate_resolution_cache(sender, instance, **kwargs):
+    """Keep cached redirect records in sync with the database"""
+    invalidate_short_code(instance.short_code)
+
+@receiver(post_save, sender=ShortenedURL)
+def add_to_short_code_filter(sender, instance, created, **kwargs):
+    """Make new short codes resolvable in this and other processes"""
+    if created:
+        short_code_filter.add(instance.short_code)
+        publish_new_codes(instance.pk)
+
+@receiver(post_delete, sender=ShortenedURL)
+def remove_from_short_code_filter(sender, instance, **kwargs):
+    short_code_filter.discard(instance.short_code)
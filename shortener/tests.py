@@ -0,0 +1,456 @@
+from asgiref.sync import async_to_sync
+from datetime import timedelta
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.test import AsyncClient, Client, SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from analytics.exports import start_export
+from api.serializers import ShortenedURLSerializer
+from .cache import _local_cache
+from .codegen import ShortCodeAllocator
+from .codeset import ShortCodeFilter
+from .forms import URLEditForm
+from .imports import import_stream
+from .jobs import JobError, recover_stale_jobs, run_pending_jobs
+from .lifecycle import soft_delete_urls, run_purge_job
+from .models import ShortenedURL, Click, ImportJob, ExportJob, PurgeJob, HourlyClickRollup, DailyClickRollup
+from .qr import build_spec, ensure_qr_image, prune_qr_cache
+from .rollups import RollupBatch, rebuild_rollups
+from .tracking import ClickEvent, write_clicks
+from .uniques import get_fingerprint_bits, false_positive_rate, is_unique_visit, _visitor_key
+from .utils import generate_qr_code
+import io
+import math
+import os
+import tempfile
+
+LOCMEM_CACHE = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'shortener-tests',
+        'OPTIONS': {'MAX_ENTRIES': 1000000},
+    }
+}
+
+@override_settings(
+    CACHES=LOCMEM_CACHE,
+    UNIQUE_VISITOR_EXPECTED_VISITORS=2000,
+    UNIQUE_VISITOR_FALSE_POSITIVE_RATE=0.01,
+)
+class UniqueVisitorFalsePositiveTests(SimpleTestCase):
+    visitors = 2000  # fingerprints stored for the link
+    probes = 20000  # fresh IPs that never visited it
+
+    def setUp(self):
+        cache.clear()
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_fingerprint_width_meets_configured_rate(self):
+        self.assertLessEqual(false_positive_rate(self.visitors), 0.01)
+
+    def test_observed_false_positive_rate(self):
+        for i in range(self.visitors):
+            is_unique_visit(1, f'10.0.{i // 256}.{i % 256}')
+
+        collisions = 0
+        for i in range(self.probes):
+            ip_address = f'172.16.{i // 256}.{i % 256}'
+            if is_unique_visit(1, ip_address):
+                # Forget the probe so the link keeps exactly the stored visitors
+                cache.delete(_visitor_key(1, ip_address))
+            else:
+                collisions += 1
+
+        # Tolerance: three standard deviations of a binomial count at the configured rate
+        rate = 0.01
+        allowed = self.probes * rate + 3 * math.sqrt(self.probes * rate * (1 - rate))
+        self.assertLessEqual(
+            collisions, allowed,
+            f'{collisions} of {self.probes} fresh IPs were reported as seen '
+            f'with {get_fingerprint_bits()}-bit fingerprints'
+        )
+
+# The short code filter builds in a background thread, outside the test transaction
+@override_settings(CACHES=LOCMEM_CACHE, CLICK_TRACKING_ASYNC=False, SHORT_CODE_FILTER_ENABLED=False)
+class RedirectTests(TestCase):
+    """The same cases through the sync and async request paths"""
+    client_classes = (Client, AsyncClient)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(
+            username='redirects', email='redirects@example.com', password='secret'
+        )
+
+    def setUp(self):
+        cache.clear()
+        _local_cache.clear()
+
+    def _create(self, short_code, **fields):
+        return ShortenedURL.objects.create(
+            user=self.user, original_url='https://example.com/target', short_code=short_code, **fields
+        )
+
+    def _get(self, client_class, path):
+        client = client_class()
+        if client_class is AsyncClient:
+            async def get():
+                return await client.get(path)
+            return async_to_sync(get)()
+        return client.get(path)
+
+    def _cases(self):
+        for async_redirects in (False, True):
+            for client_class in self.client_classes:
+                with self.subTest(client=client_class.__name__, async_redirects=async_redirects):
+                    with override_settings(ASYNC_REDIRECTS=async_redirects):
+                        yield client_class
+
+    def test_redirects_active_link(self):
+        url = self._create('go-active')
+        for client_class in self._cases():
+            response = self._get(client_class, '/go-active/')
+            self.assertEqual(response.status_code, 302)
+            self.assertEqual(response['Location'], url.original_url)
+
+    def test_unknown_code_is_not_found(self):
+        for client_class in self._cases():
+            response = self._get(client_class, '/go-missing/')
+            self.assertEqual(response.status_code, 404)
+
+    def test_expired_link_is_gone(self):
+        self._create('go-expired', expires_at=timezone.now() - timedelta(minutes=1))
+        for client_class in self._cases():
+            response = self._get(client_class, '/go-expired/')
+            self.assertEqual(response.status_code, 410)
+            self.assertContains(response, 'This link has expired', status_code=410)
+
+    def test_inactive_link_is_gone(self):
+        self._create('go-inactive', is_active=False)
+        for client_class in self._cases():
+            response = self._get(client_class, '/go-inactive/')
+            self.assertEqual(response.status_code, 410)
+            self.assertContains(response, 'This link has been disabled', status_code=410)
+
+    def test_click_is_recorded(self):
+        url = self._create('go-clicks')
+        expected = 0
+        for client_class in self._cases():
+            self._get(client_class, '/go-clicks/')
+            expected += 1
+            self.assertEqual(Click.objects.filter(url=url).count(), expected)
+
+@override_settings(CACHES=LOCMEM_CACHE, CLICK_TRACKING_ASYNC=False, SHORT_CODE_FILTER_ENABLED=False)
+class SampledCachingTests(TestCase):
+    """Cacheable links sample clients, so every counted click reaches the app"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(
+            username='sampling', email='sampling@example.com', password='secret'
+        )
+
+    def setUp(self):
+        cache.clear()
+        _local_cache.clear()
+
+    def test_caching_needs_sampling(self):
+        ShortenedURL.objects.create(
+            user=self.user, original_url='https://example.com/', short_code='go-unsampled', cache_max_age=3600
+        )
+        response = self.client.get('/go-unsampled/')
+        self.assertIn('no-cache', response['Cache-Control'])
+
+    def test_only_unsampled_clients_may_cache(self):
+        url = ShortenedURL.objects.create(
+            user=self.user, original_url='https://example.com/', short_code='go-sampled',
+            cache_max_age=3600, analytics_sample_every=4
+        )
+        sampled = 0
+        for i in range(200):
+            response = self.client.get('/go-sampled/', REMOTE_ADDR=f'10.1.0.{i}')
+            recorded = Click.objects.filter(url=url).count() > sampled
+            if recorded:
+                sampled += 1
+                self.assertIn('no-cache', response['Cache-Control'])
+            else:
+                self.assertIn('private', response['Cache-Control'])
+                self.assertNotIn('public', response['Cache-Control'])
+
+            # A sampled client has every repeat click recorded
+            if recorded:
+                self.client.get('/go-sampled/', REMOTE_ADDR=f'10.1.0.{i}')
+                sampled += 1
+                self.assertEqual(Click.objects.filter(url=url).count(), sampled)
+
+        # Roughly one in four of the 200 clients, each click recorded twice
+        self.assertTrue(50 <= sampled <= 150, sampled)
+
+    def test_public_caching_is_opt_in(self):
+        url = ShortenedURL.objects.create(
+            user=self.user, original_url='https://example.com/', short_code='go-public',
+            cache_max_age=600, cache_public=True
+        )
+        response = self.client.get('/go-public/')
+        self.assertIn('public', response['Cache-Control'])
+        self.assertIn('s-maxage=600', response['Cache-Control'])
+        self.assertEqual(Click.objects.filter(url=url).count(), 1)
+
+    def test_validation_allows_caching_with_sampling_or_public(self):
+        fields = {'original_url': 'https://example.com/', 'is_active': True, 'redirect_type': 302}
+        cases = [
+            ({'cache_max_age': 600, 'analytics_sample_every': 1}, False),
+            ({'cache_max_age': 600, 'analytics_sample_every': 4}, True),
+            ({'cache_max_age': 600, 'analytics_sample_every': 1, 'cache_public': True}, True),
+        ]
+        for policy, valid in cases:
+            with self.subTest(**policy):
+                self.assertEqual(URLEditForm({**fields, **policy}).is_valid(), valid)
+                serializer = ShortenedURLSerializer(data={'original_url': 'https://example.com/', **policy})
+                self.assertEqual(serializer.is_valid(), valid)
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class ShortCodeFilterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(
+            username='codes', email='codes@example.com', password='secret'
+        )
+
+    def _create(self, short_code, **fields):
+        return ShortenedURL.objects.create(
+            user=self.user, original_url='https://example.com/', short_code=short_code, **fields
+        )
+
+    def test_codes_committed_out_of_order_are_picked_up(self):
+        first = self._create('go-first')
+        codes = ShortCodeFilter()
+        codes.rebuild()
+
+        # A later insert commits while an earlier bulk insert still holds its ids
+        self._create('go-later', pk=first.pk + 5000)
+        codes.sync()
+        self._create('go-earlier', pk=first.pk + 1)
+        codes.sync()
+
+        for short_code in ('go-first', 'go-later', 'go-earlier'):
+            self.assertTrue(codes.might_exist(short_code), short_code)
+        self.assertNotIn(first.pk + 1, codes._gaps)
+
+class ShortCodeAllocatorTests(TestCase):
+    def test_rolled_back_reservation_is_not_handed_out_twice(self):
+        first = ShortCodeAllocator(block_size=100, permute=False)
+        second = ShortCodeAllocator(block_size=100, permute=False)
+        with transaction.atomic():
+            first.allocate(1)
+            transaction.set_rollback(True)
+
+        codes = first.allocate(5) + second.allocate(5)
+        self.assertEqual(len(set(codes)), len(codes), codes)
+
+class RollupTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(
+            username='rollups', email='rollups@example.com', password='secret'
+        )
+        cls.url = ShortenedURL.objects.create(
+            user=cls.user, original_url='https://example.com/', short_code='go-rollups', analytics_sample_every=2
+        )
+
+    def _rows(self):
+        columns = ('bucket', 'country', 'browser', 'device', 'os', 'referrer_domain', 'clicks', 'unique_clicks')
+        return {
+            model.PERIOD: sorted(model.objects.filter(url=self.url).values_list(*columns))
+            for model in (HourlyClickRollup, DailyClickRollup)
+        }
+
+    def test_batches_add_to_existing_rows(self):
+        clicked_at = timezone.now()
+        for weight, is_unique in ((1, True), (2, False)):
+            batch = RollupBatch()
+            batch.add(
+                self.url.pk, clicked_at, 'Nepal', 'Firefox', 'Other', 'Linux',
+                'https://www.example.org/a', weight, is_unique,
+            )
+            batch.write()
+
+        for model in (HourlyClickRollup, DailyClickRollup):
+            rollup = model.objects.get(url=self.url)
+            self.assertEqual((rollup.clicks, rollup.unique_clicks, rollup.referrer_domain), (3, 1, 'example.org'))
+
+    def test_rebuild_matches_incremental_rollups(self):
+        start = timezone.now().replace(minute=0, second=0, microsecond=0) - timedelta(days=2)
+        seen = set()
+        events = []
+        for i in range(40):
+            ip_address = f'10.2.0.{i % 7}'
+            events.append(ClickEvent(
+                url_id=self.url.pk, ip_address=ip_address, user_agent='test',
+                referrer=('https://news.example.com/', '', None)[i % 3],
+                browser=('Chrome 1', 'Firefox 2')[i % 2], device='Other', os='Linux',
+                is_unique=ip_address not in seen, clicked_at=start + timedelta(minutes=37 * i),
+                weight=self.url.analytics_sample_every,
+            ))
+            seen.add(ip_address)
+        # Written in several batches, as the click writer would
+        for offset in range(0, len(events), 15):
+            write_clicks(events[offset:offset + 15])
+        incremental = self._rows()
+
+        self.assertEqual(rebuild_rollups(self.url, batch_size=7), len(events))
+        self.assertEqual(self._rows(), incremental)
+        self.assertEqual(sum(row[6] for row in incremental['hour']), 80)
+
+class ImportAliasTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(
+            username='imports', email='imports@example.com', password='secret'
+        )
+
+    def test_route_prefixes_are_rejected(self):
+        job = ImportJob.objects.create(user=self.user, format=ImportJob.FORMAT_CSV)
+        stream = io.BytesIO(
+            b'original_url,custom_alias\n'
+            b'https://example.com/1,about\n'
+            b'https://example.com/2,analytics\n'
+            b'https://example.com/3,go-imported\n'
+        )
+        import_stream(job, stream)
+
+        self.assertEqual(job.rows_created, 1)
+        self.assertEqual([error['line'] for error in job.errors], [2, 3])
+        self.assertTrue(ShortenedURL.objects.filter(short_code='go-imported').exists())
+        self.assertFalse(ShortenedURL.objects.filter(short_code__in=['about', 'analytics']).exists())
+
+class ImportQuotaTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(
+            username='quota', email='quota@example.com', password='secret', daily_url_limit=2
+        )
+
+    def _import(self, rows):
+        job = ImportJob.objects.create(user=self.user, format=ImportJob.FORMAT_CSV)
+        lines = [b'original_url'] + [f'https://example.com/{i}'.encode() for i in range(rows)]
+        return job, io.BytesIO(b'\n'.join(lines) + b'\n')
+
+    def test_file_that_exactly_uses_the_quota_succeeds(self):
+        job, stream = self._import(2)
+        import_stream(job, stream, chunk_size=2)
+        self.assertEqual((job.rows_created, job.rows_failed), (2, 0))
+
+    def test_rows_over_the_quota_are_reported(self):
+        job, stream = self._import(5)
+        with self.assertRaisesMessage(JobError, '3 rows were not imported'):
+            import_stream(job, stream, chunk_size=2)
+        self.assertEqual((job.rows_created, job.rows_failed), (2, 3))
+        self.assertEqual(
+            job.errors, [{'line': line, 'error': 'Daily URL limit reached'} for line in (4, 5, 6)]
+        )
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(prefix='shortener-tests-'))
+class PurgeTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(
+            username='purges', email='purges@example.com', password='secret'
+        )
+
+    def test_purge_removes_export_files(self):
+        url = ShortenedURL.objects.create(user=self.user, original_url='https://example.com/', short_code='go-purged')
+        export = ExportJob.objects.create(
+            user=self.user, url=url, kind=ExportJob.KIND_URL, key='purge-test', status=ExportJob.STATUS_COMPLETED
+        )
+        export.file.save('go-purged.csv', ContentFile(b'Date\n'))
+        path = export.file.path
+
+        with self.captureOnCommitCallbacks():
+            _, job = soft_delete_urls(ShortenedURL.objects.filter(pk=url.pk), user=self.user)
+        run_purge_job(job)
+
+        self.assertFalse(os.path.exists(path))
+        self.assertFalse(ExportJob.objects.filter(pk=export.pk).exists())
+        self.assertFalse(ShortenedURL.all_objects.filter(pk=url.pk).exists())
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(prefix='shortener-tests-'), QR_CACHE_MAX_BYTES=0)
+class QRCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(
+            username='qr', email='qr@example.com', password='secret'
+        )
+        cls.url = ShortenedURL.objects.create(user=cls.user, original_url='https://example.com/', short_code='go-qr')
+
+    def test_rendering_never_prunes(self):
+        names = [ensure_qr_image(build_spec(self.url, size=size)) for size in ('small', 'large')]
+        self.assertTrue(all(default_storage.exists(name) for name in names))
+
+    def test_pruned_image_is_rendered_again(self):
+        qr_code = generate_qr_code(self.url)
+        self.assertGreaterEqual(prune_qr_cache(), 1)
+        self.assertFalse(default_storage.exists(qr_code.image.name))
+
+        qr_code = generate_qr_code(self.url)
+        self.assertTrue(default_storage.exists(qr_code.image.name))
+
+@override_settings(JOBS_RUN_IN_PROCESS=False, JOBS_STALE_AFTER=600)
+class StaleJobTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(
+            username='stale', email='stale@example.com', password='secret'
+        )
+
+    def _abandon(self, job, minutes=11):
+        """Pretend the job's worker died this many minutes ago"""
+        type(job).objects.filter(pk=job.pk).update(
+            status=job.STATUS_RUNNING, started_at=timezone.now() - timedelta(minutes=minutes),
+            heartbeat_at=timezone.now() - timedelta(minutes=minutes),
+        )
+
+    def test_stale_import_is_failed(self):
+        stale = ImportJob.objects.create(user=self.user, format=ImportJob.FORMAT_CSV)
+        alive = ImportJob.objects.create(user=self.user, format=ImportJob.FORMAT_CSV)
+        self._abandon(stale)
+        self._abandon(alive, minutes=5)
+
+        self.assertEqual(recover_stale_jobs(ImportJob), 1)
+        stale.refresh_from_db()
+        alive.refresh_from_db()
+        self.assertEqual(stale.status, ImportJob.STATUS_FAILED)
+        self.assertTrue(stale.error)
+        self.assertEqual(alive.status, ImportJob.STATUS_RUNNING)
+
+    def test_stale_purge_is_run_again(self):
+        with self.captureOnCommitCallbacks():
+            url = ShortenedURL.objects.create(user=self.user, original_url='https://example.com/', short_code='go-stale')
+            _, job = soft_delete_urls(ShortenedURL.objects.filter(pk=url.pk), user=self.user)
+        self._abandon(job)
+
+        run_pending_jobs()
+        job.refresh_from_db()
+        self.assertEqual(job.status, PurgeJob.STATUS_COMPLETED)
+        self.assertFalse(ShortenedURL.all_objects.filter(pk=url.pk).exists())
+
+    def test_export_dedupe_skips_stale_jobs(self):
+        url = ShortenedURL.objects.create(user=self.user, original_url='https://example.com/', short_code='go-export')
+        job, created = start_export(self.user, ExportJob.FORMAT_CSV, url=url)
+        self.assertTrue(created)
+
+        self._abandon(job, minutes=5)
+        self.assertEqual(start_export(self.user, ExportJob.FORMAT_CSV, url=url), (job, False))
+        job.refresh_from_db()
+        self.assertEqual(job.status, ExportJob.STATUS_RUNNING)
+
+        self._abandon(job)
+        again, created = start_export(self.user, ExportJob.FORMAT_CSV, url=url)
+        self.assertEqual((again.pk, created), (job.pk, False))
+        self.assertEqual(again.status, ExportJob.STATUS_PENDING)
+        self.assertIsNone(again.started_at)
@@ -0,0 +1,305 @@
+from asgiref.sync import sync_to_async
+from collections import defaultdict, namedtuple
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from .models import ShortenedURL, Click
+from .counters import increment_click_counters, fold_click_counters
+from .rollups import RollupBatch
+from .uniques import is_unique_visit, ais_unique_visit
+from .utils import get_client_info, get_location_info
+import atexit
+import hashlib
+import logging
+import os
+import queue
+import random
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+ClickEvent = namedtuple('ClickEvent', [
+    'url_id', 'ip_address', 'user_agent', 'referrer',
+    'browser', 'device', 'os', 'is_unique', 'clicked_at', 'weight',
+])
+
+_STOP = object()
+
+def write_clicks(events):
+    """Persist a batch of click events and apply aggregated counter updates"""
+    url_ids = {event.url_id for event in events}
+    # Links deleted while their clicks were queued would fail the whole batch
+    existing = set(ShortenedURL.objects.filter(pk__in=url_ids).values_list('pk', flat=True))
+
+    clicks = []
+    counts = defaultdict(lambda: [0, 0])
+    rollups = RollupBatch()
+    for event in events:
+        if event.url_id not in existing:
+            continue
+        location_info = get_location_info(event.ip_address)
+        clicks.append(Click(
+            url_id=event.url_id,
+            ip_address=event.ip_address,
+            user_agent=event.user_agent,
+            referrer=event.referrer,
+            browser=event.browser,
+            device=event.device,
+            os=event.os,
+            country=location_info.get('country', ''),
+            city=location_info.get('city', ''),
+            clicked_at=event.clicked_at,
+        ))
+        # Sampled clicks stand in for `weight` clicks in the counters
+        counts[event.url_id][0] += event.weight
+        if event.is_unique:
+            counts[event.url_id][1] += event.weight
+        rollups.add(
+            event.url_id, event.clicked_at, location_info.get('country', ''),
+            event.browser, event.device, event.os, event.referrer,
+            event.weight, event.is_unique,
+        )
+
+    if not clicks:
+        return 0
+
+    with transaction.atomic():
+        Click.objects.bulk_create(clicks, batch_size=500)
+        # Update rows in a stable order so concurrent writers cannot deadlock
+        for url_id in sorted(counts):
+            total, unique = counts[url_id]
+            increment_click_counters(url_id, total, unique)
+        rollups.write()
+
+    return len(clicks)
+
+class ClickQueue:
+    """Bounded in-process queue drained by a background writer thread"""
+
+    def __init__(self, max_size=10000, flush_size=200, flush_interval=1.0,
+                 backpressure='drop', block_timeout=0.05, fold_interval=30.0):
+        self.max_size = max_size
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.backpressure = backpressure
+        self.block_timeout = block_timeout
+        self.fold_interval = fold_interval
+        self.dropped = 0
+        self.written = 0
+        self._touched = set()
+        self._last_fold = time.monotonic()
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._queue = queue.Queue(maxsize=self.max_size)
+        self._thread = None
+        self._pid = os.getpid()
+
+    def _ensure_worker(self):
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                # Forked worker: the parent's thread and queue lock are not ours
+                self._reset()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='click-writer', daemon=True)
+                self._thread.start()
+
+    def try_put(self, event):
+        """Enqueue an event without ever blocking, returning False when the queue is full"""
+        self._ensure_worker()
+        try:
+            self._queue.put_nowait(event)
+            return True
+        except queue.Full:
+            return False
+
+    def put(self, event):
+        """Enqueue an event, applying the configured backpressure policy when full"""
+        if self.try_put(event):
+            return True
+
+        if self.backpressure == 'block':
+            try:
+                self._queue.put(event, timeout=self.block_timeout)
+                return True
+            except queue.Full:
+                pass
+        elif self.backpressure == 'sync':
+            self._write([event])
+            return True
+
+        self.dropped += 1
+        return False
+
+    def qsize(self):
+        return self._queue.qsize()
+
+    def _take_batch(self):
+        batch = []
+        stopping = False
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.flush_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if item is _STOP:
+                stopping = True
+                break
+            batch.append(item)
+        return batch, stopping
+
+    def _write(self, batch):
+        try:
+            self.written += write_clicks(batch)
+            self._touched.update(event.url_id for event in batch)
+        except Exception:
+            logger.exception('Failed to write %d click events', len(batch))
+
+    def _fold(self, force=False):
+        """Periodically fold counter shards of recently clicked URLs back into ShortenedURL"""
+        if not self._touched or (not force and time.monotonic() - self._last_fold < self.fold_interval):
+            return
+        url_ids, self._touched = self._touched, set()
+        self._last_fold = time.monotonic()
+        try:
+            fold_click_counters(url_ids)
+        except Exception:
+            logger.exception('Failed to fold click counters for %d URLs', len(url_ids))
+
+    def _run(self):
+        while True:
+            batch, stopping = self._take_batch()
+            if batch:
+                self._write(batch)
+            self._fold(force=stopping)
+            if batch or stopping:
+                close_old_connections()
+            if stopping:
+                return
+
+    def drain(self, timeout=5.0):
+        """Stop the writer and flush everything still queued"""
+        thread = self._thread
+        if thread is not None and thread.is_alive() and self._pid == os.getpid():
+            try:
+                self._queue.put(_STOP, timeout=timeout)
+            except queue.Full:
+                pass
+            thread.join(timeout)
+        self._thread = None
+
+        remaining = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _STOP:
+                remaining.append(item)
+        for start in range(0, len(remaining), self.flush_size):
+            self._write(remaining[start:start + self.flush_size])
+        self._fold(force=True)
+
+click_queue = ClickQueue(
+    max_size=getattr(settings, 'CLICK_QUEUE_MAX_SIZE', 10000),
+    flush_size=getattr(settings, 'CLICK_QUEUE_FLUSH_SIZE', 200),
+    flush_interval=getattr(settings, 'CLICK_QUEUE_FLUSH_INTERVAL', 1.0),
+    backpressure=getattr(settings, 'CLICK_QUEUE_BACKPRESSURE', 'drop'),
+    fold_interval=getattr(settings, 'CLICK_COUNTER_FOLD_INTERVAL', 30.0),
+)
+atexit.register(click_queue.drain)
+
+def sample_window(url, now=None):
+    """
+    (index, seconds left) of the client-sampling window a cacheable, sampled
+    link is in. Windows last the link's cache lifetime.
+    """
+    now = time.time() if now is None else now
+    index = int(now // url.cache_max_age)
+    return index, (index + 1) * url.cache_max_age - now
+
+def _is_sampled_client(url, ip_address):
+    index, _ = sample_window(url)
+    digest = hashlib.blake2b(
+        f'{url.id}:{ip_address}:{index}'.encode(),
+        digest_size=8,
+        key=settings.SECRET_KEY.encode()[:64],
+    ).digest()
+    return int.from_bytes(digest, 'big') % url.analytics_sample_every == 0
+
+def _is_sampled(url, ip_address):
+    """
+    Decide whether to record this hit for links that only record one in N
+    clicks. Cacheable links sample clients instead of hits: in each window one
+    in N clients is chosen by a keyed hash of their IP, gets uncacheable
+    redirects and has every click recorded, while the others may cache theirs
+    (see shortener.redirects). Links cached publicly sample the hits that
+    reach the app. Either way each recorded click stands for N.
+    """
+    if url.analytics_sample_every <= 1:
+        return True
+    if url.cache_max_age and not url.cache_public:
+        return _is_sampled_client(url, ip_address)
+    return random.randrange(url.analytics_sample_every) == 0
+
+def _build_event(client_info, url, is_unique):
+    return ClickEvent(
+        url_id=url.id,
+        ip_address=client_info['ip_address'],
+        user_agent=client_info['user_agent'],
+        referrer=client_info['referrer'],
+        browser=client_info['browser'],
+        device=client_info['device'],
+        os=client_info['os'],
+        is_unique=is_unique,
+        clicked_at=timezone.now(),
+        weight=max(url.analytics_sample_every, 1),
+    )
+
+def _write_inline(event):
+    write_clicks([event])
+    fold_click_counters([event.url_id])
+
+def record_click(request, url):
+    """
+    Capture a click on a resolved URL and hand it to the click writer.
+    Returns whether the click was sampled.
+    """
+    client_info = get_client_info(request)
+
+    # Check if this is a unique click (same IP within 24 hours). This runs for
+    # unsampled hits too, so sampled unique counts remain unbiased.
+    is_unique = is_unique_visit(url.id, client_info['ip_address'])
+    if not _is_sampled(url, client_info['ip_address']):
+        return False
+
+    event = _build_event(client_info, url, is_unique)
+    if getattr(settings, 'CLICK_TRACKING_ASYNC', True):
+        click_queue.put(event)
+    else:
+        _write_inline(event)
+    return True
+
+async def arecord_click(request, url):
+    """Async variant of record_click that never blocks the event loop"""
+    client_info = get_client_info(request)
+    is_unique = await ais_unique_visit(url.id, client_info['ip_address'])
+    if not _is_sampled(url, client_info['ip_address']):
+        return False
+
+    event = _build_event(client_info, url, is_unique)
+    if getattr(settings, 'CLICK_TRACKING_ASYNC', True):
+        if not click_queue.try_put(event):
+            # Apply the blocking/sync backpressure policies off the loop
+            await sync_to_async(click_queue.put)(event)
+    else:
+        await sync_to_async(_write_inline)(event)
+    return True
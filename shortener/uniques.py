@@ -0,0 +1,53 @@
+from django.conf import settings
+from django.core.cache import cache
+import hashlib
+import math
+
+# Visitors are remembered as truncated keyed hashes of their IP in the shared
+# cache, one short-lived key per (link, fingerprint). A new visitor is wrongly
+# reported as "seen" only when its fingerprint collides with one already stored
+# for the same link, so the fingerprint width is derived from the configured
+# false-positive rate and the expected number of visitors per link per window.
+
+def get_fingerprint_bits():
+    """Fingerprint width needed to stay under the configured false-positive rate"""
+    visitors = getattr(settings, 'UNIQUE_VISITOR_EXPECTED_VISITORS', 1000000)
+    rate = getattr(settings, 'UNIQUE_VISITOR_FALSE_POSITIVE_RATE', 0.001)
+    return min(64, max(16, math.ceil(math.log2(visitors / rate))))
+
+def false_positive_rate(visitors, bits=None):
+    """Probability that a new visitor is reported as seen when `visitors` are already stored"""
+    bits = bits or get_fingerprint_bits()
+    return 1 - (1 - 2.0 ** -bits) ** visitors
+
+def _fingerprint(ip_address, bits):
+    digest = hashlib.blake2b(
+        str(ip_address).encode(),
+        digest_size=8,
+        key=settings.SECRET_KEY.encode()[:64],
+    ).digest()
+    return int.from_bytes(digest, 'big') >> (64 - bits)
+
+def _visitor_key(url_id, ip_address):
+    bits = get_fingerprint_bits()
+    return f'shortener:uv:{url_id}:{_fingerprint(ip_address, bits):x}'
+
+def _window():
+    return getattr(settings, 'UNIQUE_VISITOR_WINDOW', 60 * 60 * 24)
+
+def is_unique_visit(url_id, ip_address):
+    """Record a visit and report whether the IP has not visited this link within the window"""
+    key = _visitor_key(url_id, ip_address)
+    if cache.add(key, 1, _window()):
+        return True
+    # Slide the window forward, matching "no click from this IP in the last 24 hours"
+    cache.touch(key, _window())
+    return False
+
+async def ais_unique_visit(url_id, ip_address):
+    """Async variant of is_unique_visit"""
+    key = _visitor_key(url_id, ip_address)
+    if await cache.aadd(key, 1, _window()):
+        return True
+    await cache.atouch(key, _window())
+    return False
@@ -7,5 +7,8 @@ urlpatterns = [
     path('url/<int:pk>/edit/', views.url_edit_view, name='url_edit'),
     path('url/<int:pk>/delete/', views.url_delete_view, name='url_delete'),
     path('url/<int:pk>/qr/', views.qr_code_view, name='url_qr'),
+    path('qr-codes.zip', views.qr_codes_zip_view, name='qr_codes_zip'),
     path('url/<int:pk>/export/', views.export_analytics_view, name='export_analytics'),
+    path('exports/<int:pk>/', views.export_job_view, name='export_job'),
+    path('exports/<int:pk>/download/', views.export_download_view, name='export_download'),
 ]
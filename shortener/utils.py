@@ -1,36 +1,97 @@
-import qrcode
-from io import BytesIO
-from django.core.files import File
 from django.conf import settings
 from .models import QRCode
+from .cache import LRUCache
 import user_agents
 import socket
+import re
+
+# Canonical desktop user agents for the most common browser families. The
+# patterns only match the exact shape these browsers send, so derivatives that
+# append tokens (Edge, Opera, Yandex, ...) fall through to the full parser and
+# the fast path always agrees with user_agents.
+_UA_FAST_PATHS = [
+    (
+        re.compile(r'Mozilla/5\.0 \(Windows NT 10\.0; Win64; x64\) AppleWebKit/537\.36 '
+                   r'\(KHTML, like Gecko\) Chrome/(\d+)\.(\d+)\.(\d+)(?:\.\d+)? Safari/537\.36'),
+        'Chrome', 'Other', 'Windows 10',
+    ),
+    (
+        re.compile(r'Mozilla/5\.0 \(Macintosh; Intel Mac OS X (\d+)_(\d+)(?:_(\d+))?\) AppleWebKit/537\.36 '
+                   r'\(KHTML, like Gecko\) Chrome/(\d+)\.(\d+)\.(\d+)(?:\.\d+)? Safari/537\.36'),
+        'Chrome', 'Mac', 'Mac OS X',
+    ),
+    (
+        re.compile(r'Mozilla/5\.0 \(Windows NT 10\.0; Win64; x64; rv:[\d.]+\) Gecko/20100101 '
+                   r'Firefox/(\d+)\.(\d+)(?:\.(\d+))?'),
+        'Firefox', 'Other', 'Windows 10',
+    ),
+]
+
+_ua_cache = LRUCache(max_size=getattr(settings, 'USER_AGENT_CACHE_SIZE', 4096))
+_ua_stats = {'fast_path_hits': 0}
+# Pathologically long strings are parsed but not cached
+_UA_CACHE_MAX_LENGTH = 1024
+
+def _join_version(parts):
+    return '.'.join(str(int(part)) for part in parts if part is not None)
+
+def _parse_user_agent_fast(user_agent_string):
+    for pattern, browser, device, os_family in _UA_FAST_PATHS:
+        match = pattern.fullmatch(user_agent_string)
+        if match is None:
+            continue
+        groups = match.groups()
+        if os_family == 'Mac OS X':
+            os_name = f"{os_family} {_join_version(groups[:3])}"
+            browser_version = _join_version(groups[3:])
+        else:
+            os_name = os_family
+            browser_version = _join_version(groups)
+        return (f"{browser} {browser_version}", device, os_name)
+    return None
+
+def parse_user_agent(user_agent_string):
+    """Parse a user agent string into a (browser, device, os) tuple, memoized"""
+    parsed = _ua_cache.get(user_agent_string)
+    if parsed is not None:
+        return parsed
+
+    parsed = _parse_user_agent_fast(user_agent_string)
+    if parsed is not None:
+        _ua_stats['fast_path_hits'] += 1
+    else:
+        user_agent = user_agents.parse(user_agent_string)
+        parsed = (
+            f"{user_agent.browser.family} {user_agent.browser.version_string}",
+            user_agent.device.family,
+            f"{user_agent.os.family} {user_agent.os.version_string}",
+        )
+
+    if len(user_agent_string) <= _UA_CACHE_MAX_LENGTH:
+        _ua_cache.set(user_agent_string, parsed)
+    return parsed
+
+def user_agent_cache_stats():
+    """Hit/miss counters for the user agent parse cache"""
+    return {
+        'size': len(_ua_cache),
+        'hits': _ua_cache.hits,
+        'misses': _ua_cache.misses,
+        'hit_ratio': round(_ua_cache.hit_ratio, 4),
+        'fast_path_hits': _ua_stats['fast_path_hits'],
+    }
 
 def generate_qr_code(url_obj):
-    """Generate QR code for a shortened URL"""
-    qr = qrcode.QRCode(
-        version=1,
-        error_correction=qrcode.constants.ERROR_CORRECT_L,
-        box_size=10,
-        border=4,
-    )
-    qr.add_data(url_obj.short_url)
-    qr.make(fit=True)
+    """Return the QR code record for a shortened URL, rendering its image only if it isn't cached"""
+    from .qr import build_spec, ensure_qr_image
+    # Re-rendered when the cache has pruned it, so the returned record never points at a missing file
+    name = ensure_qr_image(build_spec(url_obj))
     
-    img = qr.make_image(fill_color="black", back_color="white")
-    
-    # Save to BytesIO
-    buffer = BytesIO()
-    img.save(buffer, format='PNG')
-    buffer.seek(0)
-    
-    # Create or update QR code record
-    qr_code, created = QRCode.objects.get_or_create(url=url_obj)
-    qr_code.image.save(
-        f'{url_obj.short_code}_qr.png',
-        File(buffer),
-        save=True
-    )
+    # The record points at the shared content-addressed image
+    qr_code, created = QRCode.objects.get_or_create(url=url_obj, defaults={'image': name})
+    if qr_code.image.name != name:
+        qr_code.image.name = name
+        qr_code.save(update_fields=['image'])
     
     return qr_code
 
@@ -45,7 +106,7 @@ def get_client_info(request):
     
     # Get user agent
     user_agent_string = request.META.get('HTTP_USER_AGENT', '')
-    user_agent = user_agents.parse(user_agent_string)
+    browser, device, os_name = parse_user_agent(user_agent_string)
     
     # Get referrer
     referrer = request.META.get('HTTP_REFERER')
@@ -54,27 +115,16 @@ def get_client_info(request):
         'ip_address': ip_address,
         'user_agent': user_agent_string,
         'referrer': referrer,
-        'browser': f"{user_agent.browser.family} {user_agent.browser.version_string}",
-        'device': user_agent.device.family,
-        'os': f"{user_agent.os.family} {user_agent.os.version_string}",
+        'browser': browser,
+        'device': device,
+        'os': os_name,
     }
 
 def get_location_info(ip_address):
-    """Get location information from IP address using free ip-api.com service"""
-    import requests
-    try:
-        url = f'http://ip-api.com/json/{ip_address}?fields=status,country,city'
-        response = requests.get(url, timeout=2)
-        data = response.json()
-        if data.get('status') == 'success':
-            return {
-                'country': data.get('country', 'Unknown'),
-                'city': data.get('city', 'Unknown')
-            }
-        else:
-            return {'country': 'Unknown', 'city': 'Unknown'}
-    except Exception:
-        return {'country': 'Unknown', 'city': 'Unknown'}
+    """Get location information from IP address using the configured geolocation backend"""
+    from .geo import lookup_location
+    country, city = lookup_location(ip_address)
+    return {'country': country, 'city': city}
 
 def validate_url_safety(url):
     """Additional URL safety validation"""
@@ -1,17 +1,23 @@
+from asgiref.sync import sync_to_async
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.http import HttpResponse, Http404, JsonResponse
+from django.http import HttpResponseBadRequest, Http404, JsonResponse
 from django.utils import timezone
 from django.conf import settings
 from django.core.paginator import Paginator
-from django.db.models import Q, Count
+from django.db.models import Q
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 from django_ratelimit.decorators import ratelimit
-from .models import ShortenedURL, Click, QRCode
+from .models import ShortenedURL, Click, ExportJob
 from .forms import URLShortenForm, URLEditForm
-from .utils import generate_qr_code, get_client_info, get_location_info
+from .qr import build_spec, spec_from_params, qr_response, qr_zip_response
+from .codeset import short_code_filter, not_found_response
+from .redirects import follow_short_code, afollow_short_code
+from .lifecycle import soft_delete_urls
+from .rollups import rollups_for, day_start, sum_clicks, top_values
+from analytics.exports import export_format, wants_gzip, start_export, export_download_response
 import json
 
 @login_required
@@ -34,9 +40,6 @@ def dashboard_view(request):
             
             url.save()
             
-            # Generate QR code
-            generate_qr_code(url)
-            
             messages.success(request, f'URL shortened successfully! Your short URL: {url.short_url}')
             return redirect('dashboard')
     else:
@@ -68,7 +71,8 @@ def dashboard_view(request):
     
     # Statistics
     total_urls = ShortenedURL.objects.filter(user=request.user).count()
-    total_clicks = Click.objects.filter(url__user=request.user).count()
+    # Weighted for sampled links and without deleted ones, like the other totals
+    total_clicks, _ = sum_clicks(rollups_for(user=request.user))
     active_urls = ShortenedURL.objects.filter(user=request.user, is_active=True).count()
     
     context = {
@@ -91,28 +95,21 @@ def url_detail_view(request, pk):
     recent_clicks = Click.objects.filter(url=url).order_by('-clicked_at')[:10]
     
     # Get click statistics
+    click_totals = url.get_click_totals()
     click_stats = {
-        'total_clicks': url.click_count,
-        'unique_clicks': url.unique_clicks,
-        'today_clicks': Click.objects.filter(
-            url=url,
-            clicked_at__date=timezone.now().date()
-        ).count(),
-        'this_week_clicks': Click.objects.filter(
-            url=url,
-            clicked_at__gte=timezone.now() - timezone.timedelta(days=7)
-        ).count(),
+        'total_clicks': click_totals['click_count'],
+        'unique_clicks': click_totals['unique_clicks'],
+        'today_clicks': sum_clicks(rollups_for(day_start(timezone.localdate()), url=url))[0],
+        'this_week_clicks': sum_clicks(rollups_for(
+            timezone.now() - timezone.timedelta(days=7), url=url
+        ))[0],
     }
     
     # Browser statistics
-    browser_stats = Click.objects.filter(url=url).values('browser').annotate(
-        count=Count('browser')
-    ).order_by('-count')[:5]
+    browser_stats = top_values(rollups_for(url=url), 'browser', limit=5)
     
     # Country statistics
-    country_stats = Click.objects.filter(url=url).values('country').annotate(
-        count=Count('country')
-    ).order_by('-count')[:5]
+    country_stats = top_values(rollups_for(url=url), 'country', limit=5)
     
     context = {
         'url': url,
@@ -144,105 +141,86 @@ def url_delete_view(request, pk):
     url = get_object_or_404(ShortenedURL, pk=pk, user=request.user)
     
     if request.method == 'POST':
-        url.delete()
+        # Clicks and QR files are removed by a background purge job
+        soft_delete_urls(ShortenedURL.objects.filter(pk=url.pk), user=request.user)
         messages.success(request, 'URL deleted successfully!')
         return redirect('dashboard')
     
     return render(request, 'shortener/url_delete.html', {'url': url})
 
 def redirect_view(request, short_code):
-    try:
-        url = ShortenedURL.objects.get(short_code=short_code)
-    except ShortenedURL.DoesNotExist:
-        return render(request, 'errors/404.html', {'message': 'Short URL not found'}, status=404)
-    
-    # Check if URL is active
-    if not url.is_active:
-        return render(request, 'errors/410.html', {'message': 'This link has been disabled'}, status=410)
-    
-    # Check if URL is expired
-    if url.is_expired:
-        return render(request, 'errors/410.html', {'message': 'This link has expired'}, status=410)
-    
-    # Track the click
-    client_info = get_client_info(request)
-    location_info = get_location_info(client_info['ip_address'])
+    response, error = follow_short_code(request, short_code)
+    if error:
+        template, message, status = error
+        return render(request, template, {'message': message}, status=status)
     
-    # Check if this is a unique click (same IP within 24 hours)
-    is_unique = not Click.objects.filter(
-        url=url,
-        ip_address=client_info['ip_address'],
-        clicked_at__gte=timezone.now() - timezone.timedelta(hours=24)
-    ).exists()
-    
-    # Create click record
-    Click.objects.create(
-        url=url,
-        ip_address=client_info['ip_address'],
-        user_agent=client_info['user_agent'],
-        referrer=client_info['referrer'],
-        browser=client_info['browser'],
-        device=client_info['device'],
-        os=client_info['os'],
-        country=location_info.get('country', ''),
-        city=location_info.get('city', ''),
-    )
-    
-    # Update click counts
-    url.click_count += 1
-    if is_unique:
-        url.unique_clicks += 1
-    url.save()
+    return response
+
+async def redirect_view_async(request, short_code):
+    """Async redirect for ASGI deployments, sharing validation with redirect_view"""
+    response, error = await afollow_short_code(request, short_code)
+    if error:
+        template, message, status = error
+        # Context processors touch the session and user, which are sync-only
+        return await sync_to_async(render)(request, template, {'message': message}, status=status)
     
-    return redirect(url.original_url)
+    return response
 
 @login_required
 def qr_code_view(request, pk):
     url = get_object_or_404(ShortenedURL, pk=pk, user=request.user)
     
+    # Rendered on first request and cached by content
+    try:
+        spec = spec_from_params(url, request.GET)
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+    
+    return qr_response(request, spec, f'{url.short_code}_qr')
+
+@login_required
+def qr_codes_zip_view(request):
+    """Download the QR codes of all of the user's links as one ZIP file"""
+    options = {'format': request.GET.get('format'), 'size': request.GET.get('size')}
     try:
-        qr_code = url.qr_code
-    except QRCode.DoesNotExist:
-        # Generate QR code if it doesn't exist
-        qr_code = generate_qr_code(url)
+        # Validate up front; errors can't be reported once the response has started
+        build_spec(ShortenedURL(short_code='x'), **options)
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
     
-    with open(qr_code.image.path, 'rb') as f:
-        response = HttpResponse(f.read(), content_type='image/png')
-        response['Content-Disposition'] = f'inline; filename="{url.short_code}_qr.png"'
-        return response
+    urls = ShortenedURL.objects.filter(user=request.user).only('short_code').order_by('pk').iterator()
+    return qr_zip_response(urls, 'qr_codes', **options)
 
 @login_required
 def export_analytics_view(request, pk):
+    """Start a background export of a link's clicks (?format=csv, xlsx or ndjson)"""
     url = get_object_or_404(ShortenedURL, pk=pk, user=request.user)
+    fmt = export_format(request)
+    if fmt is None:
+        return HttpResponseBadRequest('Format must be csv, xlsx or ndjson')
     
-    # Get all clicks for this URL
-    clicks = Click.objects.filter(url=url).order_by('-clicked_at')
-    
-    # Create CSV response
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = f'attachment; filename="{url.short_code}_analytics.csv"'
-    
-    import csv
-    writer = csv.writer(response)
-    writer.writerow(['Date', 'IP Address', 'Browser', 'Device', 'OS', 'Country', 'City', 'Referrer'])
-    
-    for click in clicks:
-        writer.writerow([
-            click.clicked_at.strftime('%Y-%m-%d %H:%M:%S'),
-            click.ip_address,
-            click.browser,
-            click.device,
-            click.os,
-            click.country,
-            click.city,
-            click.referrer or 'Direct'
-        ])
-    
-    return response
+    job, _ = start_export(request.user, fmt, url=url, compress=wants_gzip(request))
+    return redirect('export_job', pk=job.pk)
+
+@login_required
+def export_job_view(request, pk):
+    """Progress of an export, with a download link once it is ready"""
+    job = get_object_or_404(ExportJob.objects.select_related('url'), pk=pk, user=request.user)
+    return render(request, 'shortener/export_job.html', {'job': job})
+
+@login_required
+def export_download_view(request, pk):
+    job = get_object_or_404(ExportJob, pk=pk, user=request.user)
+    if not job.is_downloadable:
+        raise Http404("Export not available")
+    return export_download_response(job)
 
 @require_http_methods(["GET"])
 def url_preview_view(request, short_code):
     """Preview page showing URL info before redirect"""
+    if not short_code_filter.might_exist(short_code):
+        return not_found_response()
+    
     try:
         url = ShortenedURL.objects.get(short_code=short_code)
     except ShortenedURL.DoesNotExist:
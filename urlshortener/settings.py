@@ -40,6 +40,7 @@ INSTALLED_APPS = DJANGO_APPS + THIRD_PARTY_APPS + LOCAL_APPS
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'shortener.middleware.RedirectFastPathMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -68,6 +69,10 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'urlshortener.wsgi.application'
+ASGI_APPLICATION = 'urlshortener.asgi.application'
+
+# Serve short-code redirects from an async view (enable when running under ASGI)
+ASYNC_REDIRECTS = config('ASYNC_REDIRECTS', default=False, cast=bool)
 
 # Database
 DATABASES = {
@@ -114,6 +119,16 @@ STATICFILES_DIRS = [
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Cache
+# Use a shared backend (e.g. memcached or redis) in production so that
+# resolution-cache invalidations reach every worker process.
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default='saaransh-link'),
+    }
+}
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
@@ -161,6 +176,82 @@ SHORT_URL_LENGTH = 6
 MAX_URLS_PER_DAY_FREE = 20
 BASE_URL = config('BASE_URL', default='http://127.0.0.1:8000')
 
+# Short code generation
+SHORT_CODE_BLOCK_SIZE = 1000  # ids each process reserves from the shared sequence at a time
+SHORT_CODE_PERMUTE = True  # scramble sequential ids so codes aren't guessable
+SHORT_CODE_SECRET = config('SHORT_CODE_SECRET', default='')  # permutation key, defaults to SECRET_KEY
+
+# Bulk URL creation
+BULK_CREATE_MAX_URLS = 5000  # URLs accepted per bulk create request
+BULK_CREATE_BATCH_SIZE = 500  # rows per INSERT
+
+# Background jobs (imports and similar long-running work)
+JOBS_RUN_IN_PROCESS = config('JOBS_RUN_IN_PROCESS', default=True, cast=bool)  # False: leave them to `manage.py run_jobs`
+JOBS_MAX_WORKERS = 2  # job threads per process
+JOBS_STALE_AFTER = 1800  # seconds without progress before a job counts as abandoned
+
+# Streaming URL imports
+IMPORT_CHUNK_SIZE = 1000  # rows validated and inserted together
+IMPORT_MAX_ERRORS = 1000  # row errors kept in a job's error report
+
+# Purging deleted URLs
+PURGE_CHUNK_SIZE = 5000  # rows removed per DELETE statement
+
+# Click rollups (hourly and daily totals per link, read by the analytics views)
+ROLLUP_BACKFILL_BATCH_SIZE = 5000  # rollup rows buffered per write by backfill_click_rollups
+ANALYTICS_MAX_DAYS = 365  # upper bound for the `days` parameter of analytics views
+TIMESERIES_MAX_POINTS = 2000  # most buckets one click series may return
+
+# Admin dashboard statistics (refresh with `manage.py refresh_system_stats --interval 300`)
+SYSTEM_STATS_BATCH_SIZE = 100000  # rows counted per query when catching up
+
+# Analytics exports (rows fetched from the database this many at a time)
+EXPORT_CHUNK_SIZE = 2000
+EXPORT_TTL = 24 * 60 * 60  # seconds a finished export file is kept for download
+
+# QR codes (rendered on first request, cached under MEDIA_ROOT/qr_cache by content)
+QR_CACHE_MAX_BYTES = 512 * 1024 * 1024  # `manage.py prune_qr_cache` deletes the oldest images beyond this
+QR_CACHE_MAX_AGE = 60 * 60  # seconds clients may reuse an image before revalidating
+# Let the web server send image bytes: '' (stream from Python), 'x-accel-redirect' (nginx) or 'x-sendfile' (Apache)
+QR_SENDFILE_BACKEND = config('QR_SENDFILE_BACKEND', default='')
+QR_SENDFILE_PREFIX = '/protected-media/'  # nginx internal location aliasing MEDIA_ROOT
+
+# Short code resolution cache
+RESOLUTION_CACHE_TIMEOUT = 60 * 60  # shared cache, seconds
+RESOLUTION_CACHE_LOCAL_SIZE = 10000  # per-process LRU entries
+RESOLUTION_CACHE_LOCAL_TTL = 5  # max staleness of the per-process LRU, seconds
+
+# Path segments that are never short codes (routes in urls.py are added automatically)
+RESERVED_SHORT_CODES = ['admin', 'api', 'www', 'dashboard', 'accounts', 'static', 'media']
+
+# Negative lookup filter for unknown short codes (needs a shared cache when running several processes)
+SHORT_CODE_FILTER_ENABLED = True
+SHORT_CODE_FILTER_ERROR_RATE = 0.001
+SHORT_CODE_FILTER_SYNC_INTERVAL = 1.0  # seconds between checks for codes created elsewhere
+SHORT_CODE_FILTER_REBUILD_INTERVAL = 60 * 60  # seconds
+
+# Click ingestion
+CLICK_TRACKING_ASYNC = config('CLICK_TRACKING_ASYNC', default=True, cast=bool)
+CLICK_QUEUE_MAX_SIZE = 10000
+CLICK_QUEUE_FLUSH_SIZE = 200
+CLICK_QUEUE_FLUSH_INTERVAL = 1.0  # seconds
+CLICK_QUEUE_BACKPRESSURE = 'drop'  # 'drop', 'block' or 'sync' when the queue is full
+CLICK_COUNTER_SHARDS = 8  # counter rows per URL
+CLICK_COUNTER_FOLD_INTERVAL = 30.0  # seconds between folding shards into ShortenedURL
+
+# Unique visitor detection
+UNIQUE_VISITOR_WINDOW = 60 * 60 * 24  # seconds
+UNIQUE_VISITOR_FALSE_POSITIVE_RATE = 0.001
+UNIQUE_VISITOR_EXPECTED_VISITORS = 1000000  # distinct IPs per link per window
+
+# IP geolocation
+GEOIP_BACKEND = config('GEOIP_BACKEND', default='shortener.geo.MaxMindGeoBackend')
+GEOIP_DATABASE_PATH = config('GEOIP_DATABASE_PATH', default=str(BASE_DIR / 'geoip' / 'GeoLite2-City.mmdb'))
+GEOIP_CACHE_SIZE = 50000  # recently seen IPs kept per process
+
+# User agent parsing
+USER_AGENT_CACHE_SIZE = 4096  # distinct user agent strings kept per process
+
 # Login/Logout URLs
 LOGIN_URL = '/accounts/login/'
 LOGIN_REDIRECT_URL = '/dashboard/'